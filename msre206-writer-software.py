@@ -1,171 +1,193 @@
+import json
+import os
 import sys
 import time
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Future
 import random
 from datetime import datetime, timedelta
-import serial
-import serial.tools.list_ports
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGroupBox,
-    QLabel, QLineEdit, QPushButton, QComboBox, QTabWidget, QTextEdit,
-    QCheckBox, QRadioButton, QMessageBox, QMenuBar, QProgressBar, QFrame, QSizePolicy
+    QLabel, QLineEdit, QPushButton, QComboBox, QTabWidget, QListView,
+    QCheckBox, QRadioButton, QMessageBox, QMenuBar, QProgressBar, QFrame, QSizePolicy, QFileDialog,
+    QInputDialog
 )
-from PyQt6.QtCore import Qt, QTimer, QSize
-from PyQt6.QtGui import QAction, QPalette, QColor, QTextCursor, QFont, QIcon
+from PyQt6.QtCore import Qt, QTimer, QSize, QObject, pyqtSignal, QAbstractListModel, QModelIndex
+from PyQt6.QtGui import QAction, QPalette, QColor, QFont, QIcon
+from msre206 import batch, cards, discovery, protocol
+from msre206.auditlog import AuditLog
+from msre206.journal import Journal
+from msre206.metrics import Metrics, MetricsServer, TextfileWriter
+from msre206.device import Device, DeviceCancelled, DeviceTimeout
+from msre206.profiles import Profile, apply_profile, list_profiles, load_profile, save_profile
+from msre206.presence import CARD_INSERTED, MONITOR_STOPPED, PresenceMonitor, insert_prompt
+from msre206.supervisor import CONNECTION_LOST, ConnectionSupervisor
+from msre206.validate import Validator
+from msre206.worker import DeviceWorker
+
+# En QSS-fil per tema i themes/ bredvid programmet (light.qss, dark.qss, ...)
+THEME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "themes")
+THEME_NAMES = ("Light", "Dark", "Matrix", "Synthwave", "Dracula")
+# En JSON-katalog per språk i lang/ (en.json, sv.json, ...); nytt språk = ny fil + rad här
+LANG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lang")
+LANGUAGE_NAMES = {"EN": "English", "SV": "Svenska"}
+FALLBACK_LANGUAGE = "EN"
+# Loggen behåller de senaste LOG_CAPACITY raderna; nya rader visas i klump var LOG_FLUSH_MS
+LOG_CAPACITY = 10000
+LOG_FLUSH_MS = 100
+# Alla loggrader skrivs även hit (roteras per dag och vid 5 MB, gamla filer gzippas)
+AUDIT_LOG_PATH = os.path.join("~", ".msre206", "msre206.log")
+# Sätts variabeln sparas all trafik på serieporten i den filen (se msre206.journal)
+JOURNAL_ENV = "MSRE206_JOURNAL"
+# Mätvärden per kommando i Prometheus-format: HTTP på 127.0.0.1:<port> och/eller en fil (se msre206.metrics)
+METRICS_PORT_ENV = "MSRE206_METRICS_PORT"
+METRICS_FILE_ENV = "MSRE206_METRICS_FILE"
+
+
+class LanguageCatalog(dict):
+    """Strängarna för ett språk. Saknas en nyckel hämtas den från reservspråket och cachas."""
+
+    def __init__(self, strings, fallback=None):
+        super().__init__(strings)
+        self.fallback = fallback
+
+    def __missing__(self, key):
+        value = self.fallback()[key] if self.fallback else key
+        self[key] = value
+        return value
+
+
+class LogModel(QAbstractListModel):
+    """Loggrader i en ringbuffert med fast kapacitet.
+
+    append() lägger bara raden i en kö; en timer för över kön till modellen högst en
+    gång per flush_ms, så vyn uppdateras en gång per klump i stället för per rad.
+    """
+
+    def __init__(self, capacity=LOG_CAPACITY, flush_ms=LOG_FLUSH_MS, parent=None):
+        super().__init__(parent)
+        self.capacity = capacity
+        self._lines = deque()
+        self._pending = []
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(flush_ms)
+        self._timer.timeout.connect(self.flush)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._lines)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid():
+            return self._lines[index.row()]
+        return None
+
+    def append(self, line):
+        self._pending.append(line)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """För över väntande rader; de äldsta raderna faller bort när bufferten är full."""
+        if not self._pending:
+            return
+        pending = self._pending[-self.capacity:]
+        self._pending = []
+        overflow = len(self._lines) + len(pending) - self.capacity
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self._lines.popleft()
+            self.endRemoveRows()
+        first = len(self._lines)
+        self.beginInsertRows(QModelIndex(), first, first + len(pending) - 1)
+        self._lines.extend(pending)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._lines.clear()
+        self._pending = []
+        self.endResetModel()
+
+    def lines(self):
+        """Alla rader, även de som ännu inte visats."""
+        return list(self._lines) + self._pending
+
+
+class DeviceSignals(QObject):
+    """För över resultat från I/O-tråden till GUI-tråden: deliver(callback, arg)."""
+    deliver = pyqtSignal(object, object)
+
 
 class MSRE206_Qt_App(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.ser = None
+        self.device = None
+        self.worker = None
+        self.operations_in_progress = 0
+        self.batch_stop = None
+        self.device_signals = DeviceSignals()
+        self.device_signals.deliver.connect(lambda callback, arg: callback(arg))
         self.is_connected = False
+        # Enheten försvann och supervisorn försöker ansluta igen
+        self.reconnecting = False
         self.is_monitoring = False
+        # (jobbfil, resultatfil, sista klara post) för en batch som väntar på att enheten kommer tillbaka
+        self.pending_batch = None
+        # BPC/BPI per spår som enheten senast bekräftade; används av rådatakodningen och valideringen
+        self.track_bpc = dict(protocol.DEFAULT_BPC)
+        self.track_bpi = dict(protocol.DEFAULT_BPI)
 
         # --- Internationalization (i18n) Setup ---
-        # Samma språkdata som i originalet
-        self.languages = {
-            "EN": {
-                "window_title": "MSRE206 Magnetic Card Reader/Writer",
-                "themes": "Themes", "language": "Language",
-                "light": "Light", "dark": "Dark", "matrix": "Matrix", "synthwave": "Synthwave", "dracula": "Dracula",
-                "connection": "Connection", "port": "Port:", "refresh_ports": "Refresh Ports",
-                "connect": "Connect", "disconnect": "Disconnect", "connected": "Connected", "disconnected": "Disconnected",
-                "basic": "Basic", "advanced": "Advanced", "raw_data": "Raw Data", "configuration": "Configuration", "generator": "Card Generator",
-                "card_data": "Card Data", "track1": "Track 1:", "track2": "Track 2:", "track3": "Track 3:",
-                "select_tracks_to_write": "Select tracks to write:",
-                "read_card": "Read Card", "write_card": "Write Card", "erase_card": "Erase Card",
-                "led_control": "LED Control", "all_led_on": "All LEDs On", "all_led_off": "All LEDs Off",
-                "green_led": "Green LED", "yellow_led": "Yellow LED", "red_led": "Red LED",
-                "test_functions": "Test Functions", "comm_test": "Communication Test", "sensor_test": "Sensor Test", "ram_test": "RAM Test",
-                "device_info": "Device Information", "get_model": "Get Model", "get_firmware": "Get Firmware", "get_coercivity": "Get Coercivity",
-                "raw_track1": "Track 1 Raw:", "raw_track2": "Track 2 Raw:", "raw_track3": "Track 3 Raw:",
-                "read_raw": "Read Raw", "write_raw": "Write Raw",
-                "leading_zeros_13": "Leading Zeros (Track 1 & 3):", "leading_zeros_2": "Leading Zeros (Track 2):",
-                "set_leading_zeros": "Set Leading Zeros", "check_leading_zeros": "Check Leading Zeros",
-                "bpi": "BPI (Bits Per Inch):", "set_bpi": "Set BPI",
-                "bpc": "BPC (Bits Per Character):", "set_bpc": "Set BPC",
-                "coercivity": "Coercivity:", "high_co": "High (Hi-Co)", "low_co": "Low (Lo-Co)", "set_coercivity": "Set Coercivity",
-                "card_type": "Card Type:", "bin": "First 6 digits (BIN):", "bin_help": "(Leave empty for standard BIN)",
-                "generate_card": "Generate Card", "card_number": "Card Number:", "expiry_date": "Expiry Date:",
-                "copy_to_track1": "Copy to Track 1", "copy_to_track2": "Copy to Track 2", "copy_both": "Copy Both",
-                "log": "Log",
-                "theme_changed": "Theme changed to: {}",
-                "error": "Error", "warning": "Warning",
-                "port_select_error": "Please select a port",
-                "connection_error": "Connection Error", "could_not_connect": "Could not connect to {}:\n{}",
-                "connected_to": "Connected to {}", "device_reset": "Device reset", "reset_error": "Error during reset: {}",
-                "not_connected": "Not connected to the device",
-                "command_sent": "{} sent", "timeout": "Timeout: No response for {}", "command_error": "Error during {}: {}",
-                "invalid_response": "Invalid response from device",
-                "read_success": "Read successful", "read_error": "Read error: Status code {}",
-                "process_error": "Error processing response: {}",
-                "select_track_to_write_warning": "Please select at least one track to write to",
-                "write_success": "Write successful", "write_error": "Write error: Status code {}",
-                "select_track_to_erase_warning": "Please select at least one track to erase",
-                "erase_success": "Erase successful", "erase_error": "Erase error: Status code {}",
-                "comm_test_success": "Communication test successful", "comm_test_fail": "Communication test failed: {}",
-                "sensor_test_success": "Sensor test successful", "sensor_test_fail": "Sensor test failed: {}",
-                "ram_test_success": "RAM test successful", "ram_test_fail": "RAM test failed", "ram_test_unexpected": "RAM test returned unexpected response: {}",
-                "device_model": "Device model: {}", "get_model_fail": "Could not get model: {}",
-                "firmware_version": "Firmware version: {}", "get_firmware_fail": "Could not get firmware: {}",
-                "coercivity_status_hi": "Coercivity status: High (Hi-Co)", "coercivity_status_lo": "Coercivity status: Low (Lo-Co)", "get_coercivity_fail": "Could not get coercivity status: {}",
-                "raw_read_success": "Raw data read successful", "raw_read_error": "Raw data read error: Status code {}",
-                "invalid_hex": "Invalid hexadecimal format for track {}",
-                "raw_write_success": "Raw data write successful", "raw_write_error": "Raw data write error: Status code {}",
-                "invalid_leading_zero_value": "Invalid value for leading zeros: {}",
-                "leading_zeros_set": "Leading zeros set", "set_leading_zeros_fail": "Failed to set leading zeros",
-                "leading_zeros_check": "Leading Zeros - Track 1&3: {}, Track 2: {}", "check_leading_zeros_fail": "Could not check leading zeros: {}",
-                "bpi_set_success": "BPI for {} set to {} bpi", "bpi_set_fail": "Failed to set BPI for {}: {}", "bpi_set_error": "Error setting BPI: {}",
-                "bpc_set_success": "BPC set - Track 1: {}, Track 2: {}, Track 3: {}", "bpc_set_fail": "Could not set BPC: {}", "invalid_bpc_value": "Invalid value for BPC: {}",
-                "coercivity_set_success": "Coercivity set to {}", "coercivity_set_fail": "Could not set coercivity: {}",
-                "card_generated": "Generated {}-card: {}",
-                "invalid_bin_error": "BIN must be exactly 6 digits",
-                "bin_mismatch_warning_visa": "Visa cards normally start with 4. Continue anyway?",
-                "bin_mismatch_warning_mastercard": "Mastercard normally starts with 51-55 or 22-27. Continue anyway?",
-                "bin_mismatch_warning_amex": "American Express normally starts with 34 or 37. Continue anyway?",
-                "bin_mismatch_warning_diners": "Diners Club normally starts with 36, 38 or 39. Continue anyway?",
-                "copied_to_track1": "Copied to Track 1", "copied_to_track2": "Copied to Track 2", "copied_to_both": "Copied to both tracks",
-                "clear_log": "Clear Log", "save_log": "Save Log", "autoscroll": "Auto-scroll",
-                "operation_in_progress": "Operation in progress...", "operation_completed": "Operation completed",
-                "card_inserted": "Card inserted", "card_removed": "Card removed", "card_detected": "Card detected",
-                "monitor_sensors": "Monitor Sensors", "stop_monitoring": "Stop Monitoring"
-            },
-            "SV": {
-                "window_title": "MSRE206 Magnetkortsläsare/Skrivare",
-                "themes": "Teman", "language": "Språk",
-                "light": "Ljust", "dark": "Mörkt", "matrix": "Matrix", "synthwave": "Synthwave", "dracula": "Dracula",
-                "connection": "Anslutning", "port": "Port:", "refresh_ports": "Uppdatera portar",
-                "connect": "Anslut", "disconnect": "Koppla från", "connected": "Ansluten", "disconnected": "Frånkopplad",
-                "basic": "Grundläggande", "advanced": "Avancerat", "raw_data": "Rådata", "configuration": "Konfiguration", "generator": "Kortgenerator",
-                "card_data": "Kortdata", "track1": "Spår 1:", "track2": "Spår 2:", "track3": "Spår 3:",
-                "select_tracks_to_write": "Välj spår att skriva:",
-                "read_card": "Läs Kort", "write_card": "Skriv Kort", "erase_card": "Radera Kort",
-                "led_control": "LED-kontroll", "all_led_on": "Alla LED På", "all_led_off": "Alla LED Av",
-                "green_led": "Grön LED", "yellow_led": "Gul LED", "red_led": "Röd LED",
-                "test_functions": "Testfunktioner", "comm_test": "Kommunikationstest", "sensor_test": "Sensortest", "ram_test": "RAM-test",
-                "device_info": "Enhetsinformation", "get_model": "Hämta Modell", "get_firmware": "Hämta Firmware", "get_coercivity": "Hämta Koercivitet",
-                "raw_track1": "Spår 1 Rådata:", "raw_track2": "Spår 2 Rådata:", "raw_track3": "Spår 3 Rådata:",
-                "read_raw": "Läs Rådata", "write_raw": "Skriv Rådata",
-                "leading_zeros_13": "Ledande nollor (Spår 1 & 3):", "leading_zeros_2": "Ledande nollor (Spår 2):",
-                "set_leading_zeros": "Sätt Ledande Nollor", "check_leading_zeros": "Kontrollera Ledande Nollor",
-                "bpi": "BPI (Bits Per Inch):", "set_bpi": "Sätt BPI",
-                "bpc": "BPC (Bits Per Character):", "set_bpc": "Sätt BPC",
-                "coercivity": "Koercivitet:", "high_co": "Hög (Hi-Co)", "low_co": "Låg (Lo-Co)", "set_coercivity": "Sätt Koercivitet",
-                "card_type": "Korttyp:", "bin": "Första 6 siffror (BIN):", "bin_help": "(Lämna tomt för standard BIN)",
-                "generate_card": "Generera Kort", "card_number": "Kortnummer:", "expiry_date": "Utgångsdatum:",
-                "copy_to_track1": "Kopiera till Spår 1", "copy_to_track2": "Kopiera till Spår 2", "copy_both": "Kopiera båda",
-                "log": "Logg",
-                "theme_changed": "Tema ändrat till: {}",
-                "error": "Fel", "warning": "Varning",
-                "port_select_error": "Vänligen välj en port",
-                "connection_error": "Anslutningsfel", "could_not_connect": "Kunde inte ansluta till {}:\n{}",
-                "connected_to": "Ansluten till {}", "device_reset": "Enhet återställd", "reset_error": "Fel vid återställning: {}",
-                "not_connected": "Inte ansluten till enheten",
-                "command_sent": "{} skickad", "timeout": "Timeout: Inget svar på {}", "command_error": "Fel vid {}: {}",
-                "invalid_response": "Ogiltigt svar från enheten",
-                "read_success": "Läsning lyckades", "read_error": "Läsningsfel: Statuskod {}",
-                "process_error": "Fel vid bearbetning av svar: {}",
-                "select_track_to_write_warning": "Välj minst ett spår att skriva till",
-                "write_success": "Skrivning lyckades", "write_error": "Skrivningsfel: Statuskod {}",
-                "select_track_to_erase_warning": "Välj minst ett spår att radera",
-                "erase_success": "Radering lyckades", "erase_error": "Raderingsfel: Statuskod {}",
-                "comm_test_success": "Kommunikationstest lyckades", "comm_test_fail": "Kommunikationstest misslyckades: {}",
-                "sensor_test_success": "Sensortest lyckades", "sensor_test_fail": "Sensortest misslyckades: {}",
-                "ram_test_success": "RAM-test lycades", "ram_test_fail": "RAM-test misslyckades", "ram_test_unexpected": "RAM-test gav oväntat svar: {}",
-                "device_model": "Enhetsmodell: {}", "get_model_fail": "Kunde inte hämta modell: {}",
-                "firmware_version": "Firmware-version: {}", "get_firmware_fail": "Kunde inte hämta firmware: {}",
-                "coercivity_status_hi": "Koercivitetsstatus: Hög (Hi-Co)", "coercivity_status_lo": "Koercivitetsstatus: Låg (Lo-Co)", "get_coercivity_fail": "Kunde inte hämta koercivitetsstatus: {}",
-                "raw_read_success": "Rådataläsning lyckades", "raw_read_error": "Rådataläsningsfel: Statuskod {}",
-                "invalid_hex": "Ogiltigt hexadecimalt format för spår {}",
-                "raw_write_success": "Rådataskrivning lyckades", "raw_write_error": "Rådataskrivningsfel: Statuskod {}",
-                "invalid_leading_zero_value": "Ogiltigt värde för ledande nollor: {}",
-                "leading_zeros_set": "Ledande nollor inställda", "set_leading_zeros_fail": "Misslyckades att sätta ledande nollor",
-                "leading_zeros_check": "Ledande nollor - Spår 1&3: {}, Spår 2: {}", "check_leading_zeros_fail": "Kunde inte kontrollera ledande nollor: {}",
-                "bpi_set_success": "BPI för {} inställd till {} bpi", "bpi_set_fail": "Misslyckades att sätta BPI för {}: {}", "bpi_set_error": "Fel vid inställning av BPI: {}",
-                "bpc_set_success": "BPC inställd - Spår 1: {}, Spår 2: {}, Spår 3: {}", "bpc_set_fail": "Kunde inte sätta BPC: {}", "invalid_bpc_value": "Ogiltigt värde för BPC: {}",
-                "coercivity_set_success": "Koercivitet inställd till {}", "coercivity_set_fail": "Kunde inte sätta koercivitet: {}",
-                "card_generated": "Genererat {}-kort: {}",
-                "invalid_bin_error": "BIN måste vara exakt 6 siffror",
-                "bin_mismatch_warning_visa": "Visa-kort börjar normalt med 4. Fortsätt ändå?",
-                "bin_mismatch_warning_mastercard": "Mastercard börjar normalt med 51-55 eller 22-27. Fortsätt ändå?",
-                "bin_mismatch_warning_amex": "American Express börjar normalt med 34 eller 37. Fortsätt ändå?",
-                "bin_mismatch_warning_diners": "Diners Club börjar normalt med 36, 38 eller 39. Fortsätt ändå?",
-                "copied_to_track1": "Kopierat till Spår 1", "copied_to_track2": "Kopierat till Spår 2", "copied_to_both": "Kopierat till båda spåren",
-                "clear_log": "Rensa Logg", "save_log": "Spara Logg", "autoscroll": "Auto-rullning",
-                "operation_in_progress": "Åtgärd pågår...", "operation_completed": "Åtgärd slutförd",
-                "card_inserted": "Kort insatt", "card_removed": "Kort borttaget", "card_detected": "Kort upptäckt",
-                "monitor_sensors": "Övervaka Sensorer", "stop_monitoring": "Stoppa Övervakning"
-            }
-        }
+        # Språkfilerna i lang/ läses först när språket väljs
+        self.languages = {}  # Språkkod -> LanguageCatalog
 
         self.current_language = "SV"  # Starta med svenska
-        self.strings = self.languages[self.current_language]
+        self.strings = self.load_language(self.current_language)
+        self.themes = {}  # Temanamn -> QSS, fylls av load_theme
+        self.current_theme = None
+        self.theme_timings = {}  # Temanamn -> ms för senaste setStyleSheet
+        audit_error = None
+        try:
+            self.audit_log = AuditLog(AUDIT_LOG_PATH).start()
+        except OSError as e:
+            self.audit_log = None
+            audit_error = e
+        self.journal = None
+        journal_error = None
+        if os.environ.get(JOURNAL_ENV):
+            try:
+                self.journal = Journal(os.environ[JOURNAL_ENV])
+            except OSError as e:
+                journal_error = e
+        self.metrics = None
+        self.metrics_exporters = []
+        metrics_error = None
+        if os.environ.get(METRICS_PORT_ENV) or os.environ.get(METRICS_FILE_ENV):
+            self.metrics = Metrics()
+            try:
+                if os.environ.get(METRICS_PORT_ENV):
+                    self.metrics_exporters.append(MetricsServer(self.metrics, int(os.environ[METRICS_PORT_ENV])).start())
+                if os.environ.get(METRICS_FILE_ENV):
+                    self.metrics_exporters.append(TextfileWriter(self.metrics, os.environ[METRICS_FILE_ENV]).start())
+            except (OSError, ValueError) as e:
+                metrics_error = e
         self.init_ui()
-        self.create_themes()
+        if audit_error:
+            self.log_message(self.strings["audit_log_error"].format(AUDIT_LOG_PATH, audit_error))
+        if journal_error:
+            self.log_message(self.strings["journal_error"].format(os.environ[JOURNAL_ENV], journal_error))
+        if metrics_error:
+            self.log_message(self.strings["metrics_error"].format(metrics_error))
         self.set_theme("Light")  # Standardtema
         self.auto_detect_port()
         self.update_ui_text()
-        # Timer for sensor monitoring
-        self.sensor_timer = QTimer()
-        self.sensor_timer.timeout.connect(self.check_sensors)
+        # Sensorövervakning; skapas när den slås på
+        self.presence_monitor = None
+        # Återanslutning när enheten kopplas ur; skapas vid anslutning
+        self.supervisor = None
 
     def init_ui(self):
         """Skapar och organiserar alla UI-komponenter."""
@@ -232,19 +254,19 @@ class MSRE206_Qt_App(QMainWindow):
 
         # Språkmeny
         self.language_menu = self.menu_bar.addMenu("")
-        en_action = QAction("English", self)
-        en_action.triggered.connect(lambda: self.set_language("EN"))
-        self.language_menu.addAction(en_action)
-
-        sv_action = QAction("Svenska", self)
-        sv_action.triggered.connect(lambda: self.set_language("SV"))
-        self.language_menu.addAction(sv_action)
+        for lang_code, name in LANGUAGE_NAMES.items():
+            action = QAction(name, self)
+            action.triggered.connect(lambda checked, code=lang_code: self.set_language(code))
+            self.language_menu.addAction(action)
 
         # Tools menu
         self.tools_menu = self.menu_bar.addMenu("Tools")
         self.monitor_sensors_action = QAction("", self)
         self.monitor_sensors_action.triggered.connect(self.toggle_sensor_monitoring)
         self.tools_menu.addAction(self.monitor_sensors_action)
+        self.batch_action = QAction("", self)
+        self.batch_action.triggered.connect(self.toggle_batch)
+        self.tools_menu.addAction(self.batch_action)
 
     def create_connection_group(self):
         """Skapar gruppen för anslutningsinställningar."""
@@ -256,6 +278,8 @@ class MSRE206_Qt_App(QMainWindow):
 
         self.port_combo = QComboBox()
         self.port_combo.setMinimumWidth(150)
+        # Redigerbar så att man kan skriva in en sökväg, t.ex. simulatorns pty
+        self.port_combo.setEditable(True)
         layout.addWidget(self.port_combo)
 
         self.refresh_btn = QPushButton()
@@ -274,26 +298,42 @@ class MSRE206_Qt_App(QMainWindow):
         return self.connection_group
 
     def setup_tabs(self):
-        """Skapar alla flikar i applikationen."""
-        self.basic_tab = QWidget()
-        self.setup_basic_tab()
-        self.notebook.addTab(self.basic_tab, "")
-
-        self.advanced_tab = QWidget()
-        self.setup_advanced_tab()
-        self.notebook.addTab(self.advanced_tab, "")
-
-        self.raw_tab = QWidget()
-        self.setup_raw_tab()
-        self.notebook.addTab(self.raw_tab, "")
-
-        self.config_tab = QWidget()
-        self.setup_config_tab()
-        self.notebook.addTab(self.config_tab, "")
+        """Skapar flikarna som tomma sidor; innehållet byggs första gången en flik visas."""
+        # (attribut, textnyckel, byggfunktion, textuppdatering)
+        self.tab_specs = [
+            ("basic_tab", "basic", self.setup_basic_tab, self.update_basic_tab_text),
+            ("advanced_tab", "advanced", self.setup_advanced_tab, self.update_advanced_tab_text),
+            ("raw_tab", "raw_data", self.setup_raw_tab, self.update_raw_tab_text),
+            ("config_tab", "configuration", self.setup_config_tab, self.update_config_tab_text),
+            ("generator_tab", "generator", self.setup_generator_tab, self.update_generator_tab_text),
+        ]
+        self.built_tabs = set()
+        for attr, _, _, _ in self.tab_specs:
+            page = QWidget()
+            setattr(self, attr, page)
+            self.notebook.addTab(page, "")
+        self.notebook.currentChanged.connect(self.ensure_tab_built)
+        self.ensure_tab_built(self.notebook.currentIndex())
+
+    def ensure_tab_built(self, index):
+        """Bygger flikens widgets om det inte redan gjorts och ger dem aktuellt språk och knappläge.
+
+        Temat följer med automatiskt eftersom stilmallen sitter på huvudfönstret.
+        """
+        if index < 0:
+            return
+        attr, _, setup, update_text = self.tab_specs[index]
+        if attr in self.built_tabs:
+            return
+        self.built_tabs.add(attr)
+        setup()
+        update_text(self.strings)
+        self.set_device_buttons_enabled(self.is_connected and not self.operations_in_progress)
 
-        self.generator_tab = QWidget()
-        self.setup_generator_tab()
-        self.notebook.addTab(self.generator_tab, "")
+    def require_tab(self, attr):
+        """Ser till att fliken attr finns, t.ex. när ett svar ska visas på en flik som aldrig öppnats."""
+        if attr not in self.built_tabs:
+            self.ensure_tab_built([spec[0] for spec in self.tab_specs].index(attr))
 
     def setup_basic_tab(self):
         """Skapar innehållet för 'Grundläggande'-fliken."""
@@ -335,6 +375,8 @@ class MSRE206_Qt_App(QMainWindow):
         checkbox_layout.addWidget(self.track2_check)
         checkbox_layout.addWidget(self.track3_check)
         checkbox_layout.addStretch(1)
+        self.verify_check = QCheckBox()
+        checkbox_layout.addWidget(self.verify_check)
         data_layout.addLayout(checkbox_layout)
 
         # Knappar
@@ -470,8 +512,12 @@ class MSRE206_Qt_App(QMainWindow):
         self.write_raw_btn.clicked.connect(self.write_raw_data)
         self.write_raw_btn.setStyleSheet("background-color: #4CAF50; color: white;")
 
+        self.encode_raw_btn = QPushButton()
+        self.encode_raw_btn.clicked.connect(self.encode_raw_data)
+
         button_layout.addWidget(self.read_raw_btn)
         button_layout.addWidget(self.write_raw_btn)
+        button_layout.addWidget(self.encode_raw_btn)
         button_layout.addStretch(1)
         raw_layout.addLayout(button_layout)
 
@@ -484,6 +530,22 @@ class MSRE206_Qt_App(QMainWindow):
         self.config_group = QGroupBox()
         config_layout = QVBoxLayout(self.config_group)
 
+        # Profiler: alla inställningar nedan på en gång
+        profile_layout = QHBoxLayout()
+        self.profile_label = QLabel()
+        self.profile_combo = QComboBox()
+        self.profile_combo.addItems(list_profiles())
+        self.apply_profile_btn = QPushButton()
+        self.apply_profile_btn.clicked.connect(self.apply_selected_profile)
+        self.apply_profile_btn.setStyleSheet("background-color: #4CAF50; color: white;")
+        self.save_profile_btn = QPushButton()
+        self.save_profile_btn.clicked.connect(self.save_current_profile)
+        profile_layout.addWidget(self.profile_label)
+        profile_layout.addWidget(self.profile_combo, 1)
+        profile_layout.addWidget(self.apply_profile_btn)
+        profile_layout.addWidget(self.save_profile_btn)
+        config_layout.addLayout(profile_layout)
+
         # Ledande nollor
         lz_layout = QHBoxLayout()
         self.leading_zero_13_label = QLabel()
@@ -695,348 +757,65 @@ class MSRE206_Qt_App(QMainWindow):
         log_controls_layout.addStretch(1)
         layout.addLayout(log_controls_layout)
 
-        self.log_text = QTextEdit()
-        self.log_text.setReadOnly(True)
-        layout.addWidget(self.log_text)
+        # Virtualiserad vy: bara synliga rader ritas och alla rader har samma höjd
+        self.log_model = LogModel(parent=self)
+        self.log_model.rowsInserted.connect(self.log_rows_inserted)
+        self.log_view = QListView()
+        self.log_view.setObjectName("log_view")
+        self.log_view.setModel(self.log_model)
+        self.log_view.setUniformItemSizes(True)
+        self.log_view.setEditTriggers(QListView.EditTrigger.NoEditTriggers)
+        self.log_view.setSelectionMode(QListView.SelectionMode.ExtendedSelection)
+        layout.addWidget(self.log_view)
 
         return self.log_group
 
-    def create_themes(self):
-        """Definierar QSS (Qt Style Sheets) för de olika teman."""
-        self.themes = {
-            "Light": """
-                QWidget { background-color: #F0F0F0; color: #000000; }
-                QMainWindow, QMenuBar, QMenu { background-color: #F0F0F0; color: #000000; }
-                QMenuBar::item:selected, QMenu::item:selected { background-color: #B0B0B0; }
-                QGroupBox {
-                    border: 2px solid #CCCCCC;
-                    border-radius: 5px;
-                    margin-top: 10px;
-                    font-weight: bold;
-                    padding-top: 10px;
-                }
-                QGroupBox::title {
-                    subcontrol-origin: margin;
-                    subcontrol-position: top left;
-                    padding: 0 5px;
-                    background-color: transparent;
-                }
-                QPushButton {
-                    background-color: #E0E0E0;
-                    border: 1px solid #B0B0B0;
-                    padding: 8px;
-                    border-radius: 4px;
-                    font-weight: bold;
-                }
-                QPushButton:hover { background-color: #D0D0D0; }
-                QPushButton:pressed { background-color: #C0C0C0; }
-                QPushButton:disabled { background-color: #EEEEEE; color: #888888; }
-                QLineEdit, QComboBox, QTextEdit {
-                    background-color: #FFFFFF;
-                    border: 1px solid #B0B0B0;
-                    border-radius: 3px;
-                    padding: 5px;
-                }
-                QTabWidget::pane {
-                    border: 1px solid #B0B0B0;
-                    background-color: #F8F8F8;
-                }
-                QTabBar::tab {
-                    background: #E0E0E0;
-                    padding: 8px 12px;
-                    border: 1px solid #B0B0B0;
-                    border-bottom: none;
-                    border-top-left-radius: 4px;
-                    border-top-right-radius: 4px;
-                }
-                QTabBar::tab:selected {
-                    background: #F8F8F8;
-                    border-bottom: 1px solid #F8F8F8;
-                    margin-bottom: -1px;
-                }
-                QTabBar::tab:!selected { margin-top: 2px; }
-                QProgressBar {
-                    border: 1px solid #B0B0B0;
-                    border-radius: 3px;
-                    text-align: center;
-                }
-                QProgressBar::chunk {
-                    background-color: #4CAF50;
-                    width: 10px;
-                }
-            """,
-            "Dark": """
-                QWidget { background-color: #2E2E2E; color: #FFFFFF; }
-                QMainWindow, QMenuBar, QMenu { background-color: #2E2E2E; color: #FFFFFF; }
-                QMenuBar::item:selected, QMenu::item:selected { background-color: #4A4A4A; }
-                QGroupBox {
-                    border: 2px solid #444444;
-                    border-radius: 5px;
-                    margin-top: 10px;
-                    font-weight: bold;
-                    padding-top: 10px;
-                }
-                QGroupBox::title {
-                    subcontrol-origin: margin;
-                    subcontrol-position: top left;
-                    padding: 0 5px;
-                    background-color: transparent;
-                    color: #FFFFFF;
-                }
-                QPushButton {
-                    background-color: #3C3C3C;
-                    border: 1px solid #4A4A4A;
-                    padding: 8px;
-                    border-radius: 4px;
-                    font-weight: bold;
-                    color: #FFFFFF;
-                }
-                QPushButton:hover { background-color: #4A4A4A; }
-                QPushButton:pressed { background-color: #5A5A5A; }
-                QPushButton:disabled { background-color: #2A2A2A; color: #666666; }
-                QLineEdit, QComboBox, QTextEdit {
-                    background-color: #4A4A4A;
-                    border: 1px solid #5A5A5A;
-                    border-radius: 3px;
-                    color: #FFFFFF;
-                    padding: 5px;
-                }
-                QComboBox::drop-down { border: 0px; }
-                QTabWidget::pane {
-                    border: 1px solid #4A4A4A;
-                    background-color: #353535;
-                }
-                QTabBar::tab {
-                    background: #3C3C3C;
-                    padding: 8px 12px;
-                    border: 1px solid #4A4A4A;
-                    border-bottom: none;
-                    border-top-left-radius: 4px;
-                    border-top-right-radius: 4px;
-                    color: #FFFFFF;
-                }
-                QTabBar::tab:selected {
-                    background: #353535;
-                    border-bottom: 1px solid #353535;
-                    margin-bottom: -1px;
-                }
-                QTabBar::tab:!selected { margin-top: 2px; }
-                QProgressBar {
-                    border: 1px solid #444444;
-                    border-radius: 3px;
-                    text-align: center;
-                    color: white;
-                }
-                QProgressBar::chunk {
-                    background-color: #4CAF50;
-                    width: 10px;
-                }
-            """,
-            "Matrix": """
-                QWidget { background-color: #000000; color: #00FF00; font-family: 'Courier New', monospace; }
-                QMainWindow, QMenuBar, QMenu { background-color: #000000; color: #00FF00; }
-                QMenuBar::item:selected, QMenu::item:selected { background-color: #003300; }
-                QGroupBox {
-                    border: 2px solid #00FF00;
-                    border-radius: 0px;
-                    margin-top: 10px;
-                    font-weight: bold;
-                    padding-top: 10px;
-                }
-                QGroupBox::title {
-                    subcontrol-origin: margin;
-                    subcontrol-position: top left;
-                    padding: 0 5px;
-                    background-color: transparent;
-                }
-                QPushButton {
-                    background-color: #003300;
-                    border: 1px solid #00FF00;
-                    padding: 8px;
-                    border-radius: 0px;
-                    font-weight: bold;
-                }
-                QPushButton:hover { background-color: #005500; }
-                QPushButton:pressed { background-color: #007700; }
-                QPushButton:disabled { background-color: #001100; color: #004400; }
-                QLineEdit, QComboBox, QTextEdit {
-                    background-color: #001100;
-                    border: 1px solid #00FF00;
-                    border-radius: 0px;
-                    color: #00FF00;
-                    padding: 5px;
-                    font-family: 'Courier New', monospace;
-                }
-                QTabWidget::pane {
-                    border: 1px solid #00FF00;
-                    background-color: #000000;
-                }
-                QTabBar::tab {
-                    background: #003300;
-                    padding: 8px 12px;
-                    border: 1px solid #00FF00;
-                    border-bottom: none;
-                    border-top-left-radius: 0px;
-                    border-top-right-radius: 0px;
-                }
-                QTabBar::tab:selected {
-                    background: #000000;
-                    border-bottom: 1px solid #000000;
-                    margin-bottom: -1px;
-                }
-                QTabBar::tab:!selected { margin-top: 2px; }
-                QProgressBar {
-                    border: 1px solid #00FF00;
-                    border-radius: 0px;
-                    text-align: center;
-                    color: #00FF00;
-                }
-                QProgressBar::chunk {
-                    background-color: #00FF00;
-                    width: 10px;
-                }
-            """,
-            "Synthwave": """
-                QWidget { background-color: #240046; color: #FF9E00; }
-                QMainWindow, QMenuBar, QMenu { background-color: #240046; color: #FF9E00; }
-                QMenuBar::item:selected, QMenu::item:selected { background-color: #5A189A; }
-                QGroupBox {
-                    border: 2px solid #FF9E00;
-                    border-radius: 5px;
-                    margin-top: 10px;
-                    font-weight: bold;
-                    padding-top: 10px;
-                }
-                QGroupBox::title {
-                    subcontrol-origin: margin;
-                    subcontrol-position: top left;
-                    padding: 0 5px;
-                    background-color: transparent;
-                }
-                QPushButton {
-                    background-color: #5A189A;
-                    border: 1px solid #FF9E00;
-                    padding: 8px;
-                    border-radius: 5px;
-                    font-weight: bold;
-                    color: #FFFFFF;
-                }
-                QPushButton:hover { background-color: #7B2CBF; }
-                QPushButton:pressed { background-color: #9D4EDD; }
-                QPushButton:disabled { background-color: #3C096C; color: #7B5E9F; }
-                QLineEdit, QComboBox, QTextEdit {
-                    background-color: #3C096C;
-                    border: 1px solid #FF9E00;
-                    border-radius: 5px;
-                    color: #FF9E00;
-                    padding: 5px;
-                }
-                QTabWidget::pane {
-                    border: 1px solid #FF9E00;
-                    background-color: #10002B;
-                }
-                QTabBar::tab {
-                    background: #5A189A;
-                    padding: 8px 12px;
-                    border: 1px solid #FF9E00;
-                    border-bottom: none;
-                    border-top-left-radius: 5px;
-                    border-top-right-radius: 5px;
-                    color: #FFFFFF;
-                }
-                QTabBar::tab:selected {
-                    background: #10002B;
-                    border-bottom: 1px solid #10002B;
-                    margin-bottom: -1px;
-                }
-                QTabBar::tab:!selected { margin-top: 2px; }
-                QProgressBar {
-                    border: 1px solid #FF9E00;
-                    border-radius: 5px;
-                    text-align: center;
-                    color: #FF9E00;
-                }
-                QProgressBar::chunk {
-                    background-color: #FF9E00;
-                    width: 10px;
-                }
-            """,
-            "Dracula": """
-                QWidget { background-color: #282a36; color: #f8f8f2; }
-                QMainWindow, QMenuBar, QMenu { background-color: #282a36; color: #f8f8f2; }
-                QMenuBar::item:selected, QMenu::item:selected { background-color: #44475a; }
-                QGroupBox {
-                    border: 2px solid #44475a;
-                    border-radius: 5px;
-                    margin-top: 10px;
-                    font-weight: bold;
-                    padding-top: 10px;
-                }
-                QGroupBox::title {
-                    subcontrol-origin: margin;
-                    subcontrol-position: top left;
-                    padding: 0 5px;
-                    background-color: transparent;
-                }
-                QPushButton {
-                    background-color: #44475a;
-                    border: 1px solid #6272a4;
-                    padding: 8px;
-                    border-radius: 5px;
-                    font-weight: bold;
-                    color: #f8f8f2;
-                }
-                QPushButton:hover { background-color: #6272a4; }
-                QPushButton:pressed { background-color: #bd93f9; }
-                QPushButton:disabled { background-color: #343746; color: #6272a4; }
-                QLineEdit, QComboBox, QTextEdit {
-                    background-color: #44475a;
-                    border: 1px solid #6272a4;
-                    border-radius: 5px;
-                    color: #f8f8f2;
-                    padding: 5px;
-                }
-                QTabWidget::pane {
-                    border: 1px solid #44475a;
-                    background-color: #21222C;
-                }
-                QTabBar::tab {
-                    background: #44475a;
-                    padding: 8px 12px;
-                    border: 1px solid #6272a4;
-                    border-bottom: none;
-                    border-top-left-radius: 5px;
-                    border-top-right-radius: 5px;
-                }
-                QTabBar::tab:selected {
-                    background: #21222C;
-                    border-bottom: 1px solid #21222C;
-                    margin-bottom: -1px;
-                }
-                QTabBar::tab:!selected { margin-top: 2px; }
-                QProgressBar {
-                    border: 1px solid #6272a4;
-                    border-radius: 5px;
-                    text-align: center;
-                    color: #f8f8f2;
-                }
-                QProgressBar::chunk {
-                    background-color: #bd93f9;
-                    width: 10px;
-                }
-            """
-        }
+    def load_theme(self, theme_name):
+        """Läser temats QSS-fil första gången det används; därefter tas texten från cachen."""
+        qss = self.themes.get(theme_name)
+        if qss is None:
+            with open(os.path.join(THEME_DIR, f"{theme_name.lower()}.qss"), encoding="utf-8") as f:
+                qss = f.read()
+            self.themes[theme_name] = qss
+        return qss
 
     def set_theme(self, theme_name):
-        """Applicerar vald QSS-stilmall på applikationen."""
-        if theme_name in self.themes:
-            self.setStyleSheet(self.themes[theme_name])
-            self.log_message(self.strings["theme_changed"].format(theme_name))
+        """Applicerar vald QSS-stilmall på applikationen; samma tema en gång till gör ingenting."""
+        if theme_name not in THEME_NAMES or theme_name == self.current_theme:
+            return
+        try:
+            qss = self.load_theme(theme_name)
+        except OSError as e:
+            self.log_message(f"{self.strings['error']}: {e}")
+            return
+        # Tiden för omtolkning och ompolering loggas så att regressioner syns
+        start = time.perf_counter()
+        self.setStyleSheet(qss)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.current_theme = theme_name
+        self.theme_timings[theme_name] = elapsed_ms
+        self.log_message(self.strings["theme_changed"].format(theme_name) + f" ({elapsed_ms:.1f} ms)")
+
+    def load_language(self, lang_code):
+        """Läser språkfilen första gången språket används och returnerar dess katalog."""
+        catalog = self.languages.get(lang_code)
+        if catalog is None:
+            with open(os.path.join(LANG_DIR, f"{lang_code.lower()}.json"), encoding="utf-8") as f:
+                strings = json.load(f)
+            fallback = None if lang_code == FALLBACK_LANGUAGE else lambda: self.load_language(FALLBACK_LANGUAGE)
+            catalog = self.languages[lang_code] = LanguageCatalog(strings, fallback)
+        return catalog
 
     def set_language(self, lang_code):
-        """Ställer in programspråket och uppdaterar all UI-text."""
+        """Ställer in programspråket och uppdaterar texten på de widgets som finns."""
+        if lang_code == self.current_language:
+            return
+        try:
+            self.strings = self.load_language(lang_code)
+        except (OSError, ValueError) as e:
+            self.log_message(f"{self.strings['error']}: {e}")
+            return
         self.current_language = lang_code
-        self.strings = self.languages[self.current_language]
         self.update_ui_text()
 
     def update_ui_text(self):
@@ -1052,6 +831,7 @@ class MSRE206_Qt_App(QMainWindow):
         self.theme_synthwave_action.setText(s["synthwave"])
         self.theme_dracula_action.setText(s["dracula"])
         self.monitor_sensors_action.setText(s["monitor_sensors" if not self.is_monitoring else "stop_monitoring"])
+        self.batch_action.setText(s["stop_batch" if self.batch_stop else "batch_encode"])
 
         # Anslutning
         self.connection_group.setTitle(s["connection"])
@@ -1059,14 +839,20 @@ class MSRE206_Qt_App(QMainWindow):
         self.refresh_btn.setText(s["refresh_ports"])
         self.update_connection_status_ui()
 
-        # Flikar
-        self.notebook.setTabText(0, s["basic"])
-        self.notebook.setTabText(1, s["advanced"])
-        self.notebook.setTabText(2, s["raw_data"])
-        self.notebook.setTabText(3, s["configuration"])
-        self.notebook.setTabText(4, s["generator"])
+        # Flikar; bara de som byggts har widgets att uppdatera
+        for index, (attr, text_key, _, update_text) in enumerate(self.tab_specs):
+            self.notebook.setTabText(index, s[text_key])
+            if attr in self.built_tabs:
+                update_text(s)
+
+        # Logg
+        self.log_group.setTitle(s["log"])
+        self.clear_log_btn.setText(s["clear_log"])
+        self.save_log_btn.setText(s["save_log"])
+        self.autoscroll_check.setText(s["autoscroll"])
 
-        # Grundläggande-flik
+    def update_basic_tab_text(self, s):
+        """Texter för 'Grundläggande'-fliken."""
         self.data_group.setTitle(s["card_data"])
         self.track1_label.setText(s["track1"])
         self.track2_label.setText(s["track2"])
@@ -1075,11 +861,13 @@ class MSRE206_Qt_App(QMainWindow):
         self.track1_check.setText(s["track1"][:-1])
         self.track2_check.setText(s["track2"][:-1])
         self.track3_check.setText(s["track3"][:-1])
+        self.verify_check.setText(s["verify_write"])
         self.read_btn.setText(s["read_card"])
         self.write_btn.setText(s["write_card"])
         self.erase_btn.setText(s["erase_card"])
 
-        # Avancerat-flik
+    def update_advanced_tab_text(self, s):
+        """Texter för 'Avancerat'-fliken."""
         self.led_group.setTitle(s["led_control"])
         self.all_led_on_btn.setText(s["all_led_on"])
         self.all_led_off_btn.setText(s["all_led_off"])
@@ -1095,16 +883,22 @@ class MSRE206_Qt_App(QMainWindow):
         self.get_firmware_btn.setText(s["get_firmware"])
         self.get_coercivity_btn.setText(s["get_coercivity"])
 
-        # Rådata-flik
+    def update_raw_tab_text(self, s):
+        """Texter för 'Rådata'-fliken."""
         self.raw_group.setTitle(s["raw_data"])
         self.raw_track1_label.setText(s["raw_track1"])
         self.raw_track2_label.setText(s["raw_track2"])
         self.raw_track3_label.setText(s["raw_track3"])
         self.read_raw_btn.setText(s["read_raw"])
         self.write_raw_btn.setText(s["write_raw"])
+        self.encode_raw_btn.setText(s["encode_raw"])
 
-        # Konfiguration-flik
+    def update_config_tab_text(self, s):
+        """Texter för 'Konfiguration'-fliken."""
         self.config_group.setTitle(s["configuration"])
+        self.profile_label.setText(s["profile"])
+        self.apply_profile_btn.setText(s["apply_profile"])
+        self.save_profile_btn.setText(s["save_profile"])
         self.leading_zero_13_label.setText(s["leading_zeros_13"])
         self.leading_zero_2_label.setText(s["leading_zeros_2"])
         self.set_leading_zeros_btn.setText(s["set_leading_zeros"])
@@ -1124,7 +918,8 @@ class MSRE206_Qt_App(QMainWindow):
         self.low_co_radio.setText(s["low_co"])
         self.set_coercivity_btn.setText(s["set_coercivity"])
 
-        # Generator-flik
+    def update_generator_tab_text(self, s):
+        """Texter för 'Kortgenerator'-fliken."""
         self.gen_group.setTitle(s["generator"])
         self.card_type_label.setText(s["card_type"])
         self.bin_label.setText(s["bin"])
@@ -1136,28 +931,53 @@ class MSRE206_Qt_App(QMainWindow):
         self.copy_track2_btn.setText(s["copy_to_track2"])
         self.copy_both_btn.setText(s["copy_both"])
 
-        # Logg
-        self.log_group.setTitle(s["log"])
-        self.clear_log_btn.setText(s["clear_log"])
-        self.save_log_btn.setText(s["save_log"])
-        self.autoscroll_check.setText(s["autoscroll"])
-
     # --- Backend-logik (i stort sett oförändrad från originalet) ---
     def auto_detect_port(self):
+        # Portlistan fylls direkt; vilken port som har en MSRE206 avgörs i bakgrunden
         self.refresh_ports()
-        ports = serial.tools.list_ports.comports()
-        for port in ports:
-            if "USB" in port.description or "Serial" in port.description:
-                self.port_combo.setCurrentText(port.device)
-                break
 
     def refresh_ports(self):
+        """Listar portarna och frågar dem alla efter en MSRE206 utan att blockera GUI:t."""
+        current = self.port_combo.currentText()
+        ports = discovery.candidate_ports()
+        self.port_combo.clear()
+        self.port_combo.addItems(list(ports))
+        if current in ports:
+            self.port_combo.setCurrentText(current)
+        # Den anslutna porten får inte störas av ett kommunikationstest
+        exclude = [self.device.port] if self.is_connected else []
+        self.run_in_worker(discovery.discover_async(ports, exclude=exclude), self.discovery_finished)
+
+    def discovery_finished(self, future):
+        s = self.strings
+        try:
+            found = future.result()
+        except Exception as e:
+            self.log_message(s["discovery_error"].format(str(e)))
+            return
+        if not found:
+            # Den anslutna porten provas inte, så då är en tom lista väntad
+            if not self.is_connected:
+                self.log_message(s["no_device_found"])
+            return
+        for device in found:
+            self.log_message(s["device_found"].format(device.port, device.model, device.firmware))
+        # Portar med en MSRE206 först i listan, med modell och firmware som tooltip
+        found_ports = [device.port for device in found]
+        ports = found_ports + [self.port_combo.itemText(i) for i in range(self.port_combo.count())
+                               if self.port_combo.itemText(i) not in found_ports]
+        current = self.port_combo.currentText()
         self.port_combo.clear()
-        ports = [port.device for port in serial.tools.list_ports.comports()]
         self.port_combo.addItems(ports)
+        for i, device in enumerate(found):
+            self.port_combo.setItemData(i, f"MSRE206 {device.model}, {device.firmware}", Qt.ItemDataRole.ToolTipRole)
+        if self.is_connected or current in found_ports:
+            self.port_combo.setCurrentText(current)
+        else:
+            self.port_combo.setCurrentIndex(0)
 
     def toggle_connection(self):
-        if not self.is_connected:
+        if not self.is_connected and not self.reconnecting:
             self.connect_serial()
         else:
             self.disconnect_serial()
@@ -1167,376 +987,554 @@ class MSRE206_Qt_App(QMainWindow):
         if not port:
             QMessageBox.critical(self, self.strings["error"], self.strings["port_select_error"])
             return
+        # Porten öppnas och används bara på I/O-tråden
+        self.device = Device(port, journal=self.journal, metrics=self.metrics)
+        self.worker = DeviceWorker(self.device)
+        self.show_progress(True, self.strings["connect"])
+        self.run_in_worker(self.worker.submit(Device.open), lambda future: self.connect_finished(future, port))
+
+    def connect_finished(self, future, port):
+        self.show_progress(False)
         try:
-            self.ser = serial.Serial(port=port, baudrate=9600, timeout=1)
-            self.is_connected = True
-            self.log_message(self.strings["connected_to"].format(port))
-            self.reset_device()
+            future.result()
         except Exception as e:
+            self.worker.shutdown(wait=False)
+            self.worker = None
             QMessageBox.critical(self, self.strings["connection_error"], self.strings["could_not_connect"].format(port, str(e)))
-        finally:
             self.update_connection_status_ui()
+            return
+        self.is_connected = True
+        self.log_message(self.strings["connected_to"].format(port))
+        self.supervisor = ConnectionSupervisor(
+            self.worker,
+            lambda event, result: self.device_signals.deliver.emit(
+                lambda arg: self.connection_changed(*arg), (event, result))).start()
+        self.reset_device()
+        # Efter reset: fyll device.state så att informationsfrågorna besvaras direkt
+        self.run_in_worker(self.worker.submit(Device.load_state), self.load_state_finished)
+        self.update_connection_status_ui()
+
+    def load_state_finished(self, future):
+        try:
+            state = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            self.log_message(self.strings["command_error"].format(self.strings["get_model"], str(e)))
+            return
+        self.log_message(self.strings["device_model"].format(state.model))
+        self.log_message(self.strings["firmware_version"].format(state.firmware))
+
+    def connection_changed(self, event, result):
+        """Supervisorn har tappat eller återfått enheten."""
+        s = self.strings
+        port = self.device.port
+        if event == CONNECTION_LOST:
+            self.is_connected = False
+            self.reconnecting = True
+            # Övervakningen slutar av sig själv när porten försvinner; den startas igen nedan
+            if self.presence_monitor:
+                self.presence_monitor.stop(wait=False)
+                self.presence_monitor = None
+            self.log_message(s["connection_lost"].format(port))
+            self.update_connection_status_ui()
+            return
+        self.is_connected = True
+        self.reconnecting = False
+        self.log_message(s["reconnected"].format(port, len(result.applied) + result.skipped))
+        if not result.ok:
+            self.log_message(s["profile_failed"].format(result.profile, result.failed or "-", result.error))
+        self.update_connection_status_ui()
+        if self.is_monitoring:
+            self.start_presence_monitor()
+        if self.pending_batch:
+            job_path, results_path, start = self.pending_batch
+            self.pending_batch = None
+            self.log_message(s["batch_resumed"].format(start + 1))
+            self.start_batch(job_path, results_path, start)
 
     def disconnect_serial(self):
-        if self.ser and self.ser.is_open:
-            self.ser.close()
+        if self.supervisor:
+            self.supervisor.stop(wait=False)
+            self.supervisor = None
+        self.reconnecting = False
+        if self.pending_batch:
+            self.pending_batch = None
+            self.batch_stop = None
+            self.batch_action.setText(self.strings["batch_encode"])
+        self.stop_presence_monitor()
+        if self.worker:
+            self.worker.shutdown(wait=False)
+            self.worker = None
         self.is_connected = False
         self.log_message(self.strings["disconnected"])
         self.update_connection_status_ui()
 
     def update_connection_status_ui(self):
         s = self.strings
-        is_enabled = self.is_connected
-        if is_enabled:
+        if self.is_connected:
             self.connect_btn.setText(s["disconnect"])
             self.status_label.setText(f"<font color='green'>{s['connected']}</font>")
+        elif self.reconnecting:
+            self.connect_btn.setText(s["disconnect"])
+            self.status_label.setText(f"<font color='orange'>{s['reconnecting']}</font>")
         else:
             self.connect_btn.setText(s["connect"])
             self.status_label.setText(f"<font color='red'>{s['disconnected']}</font>")
+        self.set_device_buttons_enabled(self.is_connected and not self.operations_in_progress)
 
+    def set_device_buttons_enabled(self, is_enabled):
         # Aktivera/inaktivera knappar baserat på anslutningsstatus
-        self.read_btn.setEnabled(is_enabled)
-        self.write_btn.setEnabled(is_enabled)
-        self.erase_btn.setEnabled(is_enabled)
-
-        for btn in self.advanced_tab.findChildren(QPushButton) + \
-                   self.raw_tab.findChildren(QPushButton) + \
-                   self.config_tab.findChildren(QPushButton):
+        # Flikar som inte byggts än får rätt läge i ensure_tab_built
+        buttons = []
+        if "basic_tab" in self.built_tabs:
+            buttons += [self.read_btn, self.write_btn, self.erase_btn]
+        for attr in ("advanced_tab", "raw_tab", "config_tab"):
+            if attr in self.built_tabs:
+                buttons += getattr(self, attr).findChildren(QPushButton)
+        for btn in buttons:
             btn.setEnabled(is_enabled)
 
+    def run_in_worker(self, future, callback):
+        """Anropar callback(future) i GUI-tråden när jobbet på I/O-tråden är klart."""
+        future.add_done_callback(lambda f: self.device_signals.deliver.emit(callback, f))
+
     def reset_device(self):
-        if self.ser and self.ser.is_open:
-            try:
-                self.ser.write(bytes([0x1B, 0x61]))
-                self.log_message(self.strings["device_reset"])
-            except Exception as e:
-                self.log_message(self.strings["reset_error"].format(str(e)))
+        if self.is_connected:
+            self.run_in_worker(self.worker.submit(Device.reset), self.reset_finished)
+
+    def reset_finished(self, future):
+        try:
+            future.result()
+            self.log_message(self.strings["device_reset"])
+        except CancelledError:
+            pass
+        except Exception as e:
+            self.log_message(self.strings["reset_error"].format(str(e)))
+
+    def send_command(self, command, on_response=None, description=None):
+        """Köar ett protocol.Command på I/O-tråden.
+
+        on_response anropas i GUI-tråden med råsvaret när det kommit.
+        """
+        if not self.is_connected:
+            QMessageBox.critical(self, self.strings["error"], self.strings["not_connected"])
+            return
+        description = description or self.strings.get(command.name, command.name)
+        self.log_message(self.strings["command_sent"].format(description))
+        if command.expect_response:
+            self.show_progress(True, description)
+        self.run_in_worker(self.worker.execute(command),
+                           lambda future: self.command_finished(future, command, description, on_response))
+
+    def command_finished(self, future, command, description, on_response):
+        if command.expect_response:
+            self.show_progress(False)
+        try:
+            response = future.result()
+        except (CancelledError, DeviceCancelled):
+            return
+        except DeviceTimeout:
+            self.log_message(self.strings["timeout"].format(description))
+            return
+        except Exception as e:
+            self.log_message(self.strings["command_error"].format(description, str(e)))
+            return
+        if on_response and response:
+            on_response(response)
+
+    def call_device(self, name, method, *args, on_result=None, fail_key=None):
+        """Köar ett Device-anrop på I/O-tråden; on_result får returvärdet i GUI-tråden.
 
-    def send_command(self, command, description, expect_response=True, timeout=10):
+        Till skillnad från send_command går anropet genom Device-metoderna, så frågor
+        besvaras ur device.state när värdet är känt och inställningar som redan gäller
+        skickas inte igen.
+        """
         if not self.is_connected:
             QMessageBox.critical(self, self.strings["error"], self.strings["not_connected"])
-            return None
+            return
+        description = self.strings.get(name, name)
+        self.log_message(self.strings["command_sent"].format(description))
+        self.show_progress(True, description)
+        self.run_in_worker(self.worker.submit(method, *args),
+                           lambda future: self.call_finished(future, description, on_result, fail_key))
+
+    def call_finished(self, future, description, on_result, fail_key):
+        self.show_progress(False)
         try:
-            self.ser.write(command)
-            self.log_message(self.strings["command_sent"].format(description))
-            QApplication.processEvents()  # Håller UI:t responsivt
-            if not expect_response:
-                return None
-            start_time = time.time()
-            response = b""
-            while time.time() - start_time < timeout:
-                if self.ser.in_waiting:
-                    response += self.ser.read(self.ser.in_waiting)
-                    if len(response) >= 2 and response[-2] == 0x1B:
-                        break
-                time.sleep(0.05)
-                QApplication.processEvents()
-            if response:
-                return response
+            result = future.result()
+        except (CancelledError, DeviceCancelled):
+            return
+        except DeviceTimeout:
+            self.log_message(self.strings["timeout"].format(description))
+            return
+        except protocol.ProtocolError as e:
+            if fail_key:
+                self.log_message(self.strings[fail_key].format(e.response.hex()))
             else:
-                self.log_message(self.strings["timeout"].format(description))
-                return None
+                self.log_message(self.strings["invalid_response"])
+            return
         except Exception as e:
             self.log_message(self.strings["command_error"].format(description, str(e)))
-            return None
+            return
+        if on_result:
+            on_result(result)
 
     def read_card(self):
-        self.show_progress(True, self.strings["read_card"])
-        response = self.send_command(bytes([0x1B, 0x72]), self.strings["read_card"], timeout=15)
-        if response:
-            self.process_read_response(response)
-        self.show_progress(False)
+        self.send_command(protocol.build_read(), self.process_read_response)
 
     def process_read_response(self, response):
         try:
-            if response[0:2] != bytes([0x1B, 0x73]):
-                self.log_message(self.strings["invalid_response"])
-                return
-            tracks = {1: "", 2: "", 3: ""}
-            parts = response.split(b'\x1b')[1:]
-            for part in parts:
-                if not part:
-                    continue
-                track_num = part[0]
-                data = part[1:].split(b'?')[0]
-                if track_num == 0x01:
-                    tracks[1] = data.decode(errors='ignore')
-                elif track_num == 0x02:
-                    tracks[2] = data.decode(errors='ignore')
-                elif track_num == 0x03:
-                    tracks[3] = data.decode(errors='ignore')
-            self.update_track_data(tracks)
-            status_byte = response[-1]
-            if status_byte == 0x30:
-                self.log_message(self.strings["read_success"])
-            else:
-                self.log_message(self.strings["read_error"].format(hex(status_byte)))
+            result = protocol.decode_read(response)
+        except protocol.ProtocolError:
+            self.log_message(self.strings["invalid_response"])
+            return
         except Exception as e:
             self.log_message(self.strings["process_error"].format(str(e)))
+            return
+        self.update_track_data(result.tracks)
+        if result.ok:
+            self.log_message(self.strings["read_success"])
+        else:
+            self.log_message(self.strings["read_error"].format(hex(result.status)))
 
     def update_track_data(self, tracks):
+        self.require_tab("basic_tab")
         self.track1_edit.setText(tracks.get(1, ''))
         self.track2_edit.setText(tracks.get(2, ''))
         self.track3_edit.setText(tracks.get(3, ''))
 
+    def selected_tracks(self):
+        """Spårnummer vars kryssruta är ikryssad."""
+        checks = {1: self.track1_check, 2: self.track2_check, 3: self.track3_check}
+        return [num for num, check in checks.items() if check.isChecked()]
+
+    def log_status_response(self, response, success_key, error_key):
+        """Loggar ett ESC <status>-svar från skriv- och raderingskommandon."""
+        try:
+            status = protocol.decode_status(response)
+        except protocol.ProtocolError:
+            self.log_message(self.strings["invalid_response"])
+            return
+        if status == protocol.STATUS_OK:
+            self.log_message(self.strings[success_key])
+        else:
+            self.log_message(self.strings[error_key].format(hex(status)))
+
     def write_card(self):
-        if not any([self.track1_check.isChecked(), self.track2_check.isChecked(), self.track3_check.isChecked()]):
+        selected = self.selected_tracks()
+        if not selected:
             QMessageBox.warning(self, self.strings["warning"], self.strings["select_track_to_write_warning"])
             return
-        data_block = bytearray([0x1B, 0x73])
-        if self.track1_check.isChecked() and self.track1_edit.text():
-            data_block += b'\x1b\x01' + self.track1_edit.text().encode()
-        if self.track2_check.isChecked() and self.track2_edit.text():
-            data_block += b'\x1b\x02' + self.track2_edit.text().encode()
-        if self.track3_check.isChecked() and self.track3_edit.text():
-            data_block += b'\x1b\x03' + self.track3_edit.text().encode()
-        data_block += b'?\x1c'
-        command = b'\x1b\x77' + data_block
-        self.show_progress(True, self.strings["write_card"])
-        response = self.send_command(command, self.strings["write_card"], timeout=15)
-        if response and len(response) >= 2 and response[0] == 0x1B:
-            status = response[1]
-            if status == 0x30:
-                self.log_message(self.strings["write_success"])
-            else:
-                self.log_message(self.strings["write_error"].format(hex(status)))
-        elif response:
-            self.log_message(self.strings["invalid_response"])
+        edits = {1: self.track1_edit, 2: self.track2_edit, 3: self.track3_edit}
+        tracks = {num: edits[num].text() for num in selected}
+        # Fel i spårdatan syns direkt i stället för som ett misslyckat skrivkommando
+        errors = Validator(self.track_bpc, self.track_bpi).check_tracks(tracks)
+        if errors:
+            self.log_message(self.strings["invalid_track_data"].format("; ".join(errors)))
+            QMessageBox.warning(self, self.strings["warning"],
+                                self.strings["invalid_track_data"].format("\n".join(errors)))
+            return
+        if self.verify_check.isChecked():
+            self.log_message(self.strings["command_sent"].format(self.strings["write_card"]))
+            self.show_progress(True, self.strings["write_card"])
+            self.run_in_worker(self.worker.submit(Device.write_verified, tracks), self.write_verified_finished)
+            return
+        command = protocol.build_write(tracks)
+        self.send_command(command, lambda r: self.log_status_response(r, "write_success", "write_error"))
+
+    def write_verified_finished(self, future):
+        s = self.strings
         self.show_progress(False)
+        try:
+            result = future.result()
+        except (CancelledError, DeviceCancelled):
+            return
+        except DeviceTimeout:
+            self.log_message(s["timeout"].format(s["write_card"]))
+            return
+        except protocol.ProtocolError:
+            self.log_message(s["invalid_response"])
+            return
+        except Exception as e:
+            self.log_message(s["command_error"].format(s["write_card"], str(e)))
+            return
+        if result.status != protocol.STATUS_OK:
+            self.log_message(s["write_error"].format(hex(result.status)))
+            return
+        self.log_message(s["write_success"])
+        if not result.read.ok:
+            self.log_message(s["read_error"].format(hex(result.read.status)))
+        for num, (written, read) in sorted(result.mismatches.items()):
+            self.log_message(s["verify_mismatch"].format(num, written, read))
+        if result.ok:
+            self.log_message(s["verify_success"])
 
     def erase_card(self):
-        select_byte = 0
-        if self.track1_check.isChecked():
-            select_byte |= 0x01
-        if self.track2_check.isChecked():
-            select_byte |= 0x02
-        if self.track3_check.isChecked():
-            select_byte |= 0x04
-        if select_byte == 0:
+        selected = self.selected_tracks()
+        if not selected:
             QMessageBox.warning(self, self.strings["warning"], self.strings["select_track_to_erase_warning"])
             return
-        command = bytes([0x1B, 0x63, select_byte])
-        self.show_progress(True, self.strings["erase_card"])
-        response = self.send_command(command, self.strings["erase_card"], timeout=15)
-        if response and len(response) >= 2 and response[0] == 0x1B:
-            status = response[1]
-            if status == 0x30:
-                self.log_message(self.strings["erase_success"])
-            else:
-                self.log_message(self.strings["erase_error"].format(hex(status)))
-        elif response:
-            self.log_message(self.strings["invalid_response"])
-        self.show_progress(False)
+        self.send_command(protocol.build_erase(selected),
+                          lambda r: self.log_status_response(r, "erase_success", "erase_error"))
 
     def led_control(self, code):
-        self.send_command(bytes([0x1B, code]), self.strings["led_control"], expect_response=False)
+        self.send_command(protocol.build_led(code))
 
     def communication_test(self):
-        self.show_progress(True, self.strings["comm_test"])
-        response = self.send_command(bytes([0x1B, 0x65]), self.strings["comm_test"])
-        if response == b'\x1b\x79':
-            self.log_message(self.strings["comm_test_success"])
-        elif response:
-            self.log_message(self.strings["comm_test_fail"].format(response.hex()))
-        self.show_progress(False)
+        def handle(response):
+            if protocol.decode_comm_test(response):
+                self.log_message(self.strings["comm_test_success"])
+            else:
+                self.log_message(self.strings["comm_test_fail"].format(response.hex()))
+        self.send_command(protocol.build_comm_test(), handle)
 
     def sensor_test(self):
-        self.show_progress(True, self.strings["sensor_test"])
-        response = self.send_command(bytes([0x1B, 0x86]), self.strings["sensor_test"], timeout=30)
-        if response == b'\x1b\x30':
-            self.log_message(self.strings["sensor_test_success"])
-        elif response:
-            self.log_message(self.strings["sensor_test_fail"].format(response.hex()))
-        self.show_progress(False)
+        def handle(response):
+            if response == bytes([protocol.ESC, protocol.STATUS_OK]):
+                self.log_message(self.strings["sensor_test_success"])
+            else:
+                self.log_message(self.strings["sensor_test_fail"].format(response.hex()))
+        self.send_command(protocol.build_sensor_test(), handle)
 
     def ram_test(self):
-        self.show_progress(True, self.strings["ram_test"])
-        response = self.send_command(bytes([0x1B, 0x87]), self.strings["ram_test"])
-        if response == b'\x1b\x30':
-            self.log_message(self.strings["ram_test_success"])
-        elif response == b'\x1b\x41':
-            self.log_message(self.strings["ram_test_fail"])
-        elif response:
-            self.log_message(self.strings["ram_test_unexpected"].format(response.hex()))
-        self.show_progress(False)
+        def handle(response):
+            try:
+                ok = protocol.decode_ack(response)
+                self.log_message(self.strings["ram_test_success" if ok else "ram_test_fail"])
+            except protocol.ProtocolError:
+                self.log_message(self.strings["ram_test_unexpected"].format(response.hex()))
+        self.send_command(protocol.build_ram_test(), handle)
 
     def get_device_model(self):
-        self.show_progress(True, self.strings["get_model"])
-        response = self.send_command(bytes([0x1B, 0x74]), self.strings["get_model"])
-        if response and len(response) >= 3 and response[0] == 0x1B and response[-1] == 0x53:
-            model = response[1:-1].decode(errors='ignore')
-            self.log_message(self.strings["device_model"].format(model))
-        elif response:
-            self.log_message(self.strings["get_model_fail"].format(response.hex()))
-        self.show_progress(False)
+        self.call_device("get_model", Device.get_model, fail_key="get_model_fail",
+                         on_result=lambda model: self.log_message(self.strings["device_model"].format(model)))
 
     def get_firmware_version(self):
-        self.show_progress(True, self.strings["get_firmware"])
-        response = self.send_command(bytes([0x1B, 0x76]), self.strings["get_firmware"])
-        if response and response[0] == 0x1B:
-            version = response[1:].decode(errors='ignore')
-            self.log_message(self.strings["firmware_version"].format(version))
-        elif response:
-            self.log_message(self.strings["get_firmware_fail"].format(response.hex()))
-        self.show_progress(False)
+        self.call_device("get_firmware", Device.get_firmware, fail_key="get_firmware_fail",
+                         on_result=lambda fw: self.log_message(self.strings["firmware_version"].format(fw)))
 
     def get_coercivity_status(self):
-        self.show_progress(True, self.strings["get_coercivity"])
-        response = self.send_command(bytes([0x1B, 0x64]), self.strings["get_coercivity"])
-        if response == b'\x1b\x48':
-            self.log_message(self.strings["coercivity_status_hi"])
-        elif response == b'\x1b\x4C':
-            self.log_message(self.strings["coercivity_status_lo"])
-        elif response:
-            self.log_message(self.strings["get_coercivity_fail"].format(response.hex()))
-        self.show_progress(False)
+        def handle(coercivity):
+            high = coercivity == protocol.COERCIVITY_HIGH
+            self.log_message(self.strings["coercivity_status_hi" if high else "coercivity_status_lo"])
+        self.call_device("get_coercivity", Device.get_coercivity, on_result=handle, fail_key="get_coercivity_fail")
 
     def read_raw_data(self):
-        self.show_progress(True, self.strings["read_raw"])
-        response = self.send_command(bytes([0x1B, 0x6D]), self.strings["read_raw"], timeout=15)
-        if response:
-            self.process_raw_read_response(response)
-        self.show_progress(False)
+        self.send_command(protocol.build_read_raw(), self.process_raw_read_response)
 
     def process_raw_read_response(self, response):
         try:
-            if response[0:2] != bytes([0x1B, 0x73]):
-                self.log_message(self.strings["invalid_response"])
-                return
-            tracks = {1: "", 2: "", 3: ""}
-            pos = 2
-            while pos < len(response) and response[pos] == 0x1B:
-                track_num = response[pos+1]
-                length = response[pos+2]
-                data = response[pos+3: pos+3+length]
-                if track_num == 1:
-                    tracks[1] = data.hex()
-                elif track_num == 2:
-                    tracks[2] = data.hex()
-                elif track_num == 3:
-                    tracks[3] = data.hex()
-                pos += 3 + length
-            self.update_raw_track_data(tracks)
-            status_byte = response[-1]
-            if status_byte == 0x30:
-                self.log_message(self.strings["raw_read_success"])
-            else:
-                self.log_message(self.strings["raw_read_error"].format(hex(status_byte)))
+            result = protocol.decode_raw_read(response)
+        except protocol.ProtocolError:
+            self.log_message(self.strings["invalid_response"])
+            return
         except Exception as e:
             self.log_message(self.strings["process_error"].format(str(e)))
+            return
+        self.update_raw_track_data({num: data.hex() for num, data in result.tracks.items()})
+        if result.ok:
+            self.log_message(self.strings["raw_read_success"])
+            self.log_decoded_raw_tracks(result.tracks)
+        else:
+            self.log_message(self.strings["raw_read_error"].format(hex(result.status)))
+
+    def log_decoded_raw_tracks(self, tracks):
+        """Avkodar rådata med aktuell BPC och loggar texten, paritetsfel och LRC per spår."""
+        from msre206 import rawcodec  # NumPy laddas först när det behövs
+        s = self.strings
+        for num, data in tracks.items():
+            if not data:
+                continue
+            decoded = rawcodec.decode_track(data, self.track_bpc[num])
+            if decoded.ok:
+                self.log_message(s["raw_decoded"].format(num, decoded.text))
+            else:
+                errors = ", ".join(str(i) for i in decoded.parity_errors) or "-"
+                self.log_message(s["raw_decode_error"].format(
+                    num, decoded.text, errors, s["lrc_ok" if decoded.lrc_ok else "lrc_error"]))
+
+    def encode_raw_data(self):
+        """Fyller rådatafälten med spåren från 'Grundläggande'-fliken, kodade med aktuell BPC."""
+        from msre206 import rawcodec
+        self.require_tab("basic_tab")
+        texts = {1: self.track1_edit.text(), 2: self.track2_edit.text(), 3: self.track3_edit.text()}
+        tracks = {}
+        for num, text in texts.items():
+            if not text:
+                continue
+            try:
+                tracks[num] = rawcodec.encode_track(text, self.track_bpc[num]).hex()
+            except ValueError as e:
+                self.log_message(self.strings["raw_encode_error"].format(num, str(e)))
+                return
+        self.update_raw_track_data(tracks)
 
     def update_raw_track_data(self, tracks):
+        self.require_tab("raw_tab")
         self.raw_track1_edit.setText(tracks.get(1, ''))
         self.raw_track2_edit.setText(tracks.get(2, ''))
         self.raw_track3_edit.setText(tracks.get(3, ''))
 
     def write_raw_data(self):
-        data_block = bytearray([0x1B, 0x73])
+        tracks = {}
+        edits = {1: self.raw_track1_edit, 2: self.raw_track2_edit, 3: self.raw_track3_edit}
+        for num, edit in edits.items():
+            if not edit.text():
+                continue
+            try:
+                tracks[num] = bytes.fromhex(edit.text())
+            except ValueError:
+                self.log_message(self.strings["invalid_hex"].format(num))
+                return
+        self.send_command(protocol.build_write_raw(tracks),
+                          lambda r: self.log_status_response(r, "raw_write_success", "raw_write_error"))
+
+    def set_leading_zeros(self):
         try:
-            if self.raw_track1_edit.text():
-                raw = bytes.fromhex(self.raw_track1_edit.text())
-                data_block += bytes([0x1B, 0x01, len(raw)]) + raw
-            if self.raw_track2_edit.text():
-                raw = bytes.fromhex(self.raw_track2_edit.text())
-                data_block += bytes([0x1B, 0x02, len(raw)]) + raw
-            if self.raw_track3_edit.text():
-                raw = bytes.fromhex(self.raw_track3_edit.text())
-                data_block += bytes([0x1B, 0x03, len(raw)]) + raw
+            lz_13, lz_2 = int(self.leading_zero_13_edit.text()), int(self.leading_zero_2_edit.text())
+            protocol.build_set_leading_zeros(lz_13, lz_2)
         except ValueError as e:
-            track = '1' if '1' in str(e) else '2' if '2' in str(e) else '3'
-            self.log_message(self.strings["invalid_hex"].format(track))
+            self.log_message(self.strings["invalid_leading_zero_value"].format(str(e)))
             return
-        data_block += b'?\x1c'
-        command = b'\x1b\x6E' + data_block
-        self.show_progress(True, self.strings["write_raw"])
-        response = self.send_command(command, self.strings["write_raw"], timeout=15)
-        if response and len(response) >= 2 and response[0] == 0x1B:
-            status = response[1]
-            if status == 0x30:
-                self.log_message(self.strings["raw_write_success"])
-            else:
-                self.log_message(self.strings["raw_write_error"].format(hex(status)))
-        elif response:
-            self.log_message(self.strings["invalid_response"])
-        self.show_progress(False)
 
-    def set_leading_zeros(self):
-        try:
-            lz_13 = int(self.leading_zero_13_edit.text())
-            lz_2 = int(self.leading_zero_2_edit.text())
-            if not (0 <= lz_13 <= 255 and 0 <= lz_2 <= 255):
-                raise ValueError()
-            command = bytes([0x1B, 0x7A, lz_13, lz_2])
-            self.show_progress(True, self.strings["set_leading_zeros"])
-            response = self.send_command(command, self.strings["set_leading_zeros"])
-            if response == b'\x1b\x30':
-                self.log_message(self.strings["leading_zeros_set"])
-            elif response == b'\x1b\x41':
-                self.log_message(self.strings["set_leading_zeros_fail"])
-            self.show_progress(False)
-        except ValueError:
-            self.log_message(self.strings["invalid_leading_zero_value"])
+        def handle(ack):
+            self.log_message(self.strings["leading_zeros_set" if ack else "set_leading_zeros_fail"])
+        self.call_device("set_leading_zeros", Device.set_leading_zeros, lz_13, lz_2, on_result=handle)
 
     def check_leading_zeros(self):
-        self.show_progress(True, self.strings["check_leading_zeros"])
-        response = self.send_command(bytes([0x1B, 0x6C]), self.strings["check_leading_zeros"])
-        if response and len(response) >= 3 and response[0] == 0x1B:
-            self.log_message(self.strings["leading_zeros_check"].format(response[1], response[2]))
-        elif response:
-            self.log_message(self.strings["check_leading_zeros_fail"].format(response.hex()))
-        self.show_progress(False)
+        self.call_device("check_leading_zeros", Device.check_leading_zeros, fail_key="check_leading_zeros_fail",
+                         on_result=lambda lz: self.log_message(self.strings["leading_zeros_check"].format(*lz)))
 
     def set_bpi(self):
-        try:
-            bpi_map = {"75": 0xA0, "210": 0xA1}
-            cmd1 = bytes([0x1B, 0x62, bpi_map[self.bpi_track1_combo.currentText()]])
-            bpi_map_t2 = {"75": 0x4B, "210": 0xD2}
-            cmd2 = bytes([0x1B, 0x62, bpi_map_t2[self.bpi_track2_combo.currentText()]])
-            bpi_map_t3 = {"75": 0xC0, "210": 0xC1}
-            cmd3 = bytes([0x1B, 0x62, bpi_map_t3[self.bpi_track3_combo.currentText()]])
-            for cmd, track, bpi_val in [
-                (cmd1, self.strings["track1"][:-1], self.bpi_track1_combo.currentText()),
-                (cmd2, self.strings["track2"][:-1], self.bpi_track2_combo.currentText()),
-                (cmd3, self.strings["track3"][:-1], self.bpi_track3_combo.currentText())
-            ]:
-                self.show_progress(True, f"Set BPI for {track}")
-                response = self.send_command(cmd, f"Set BPI for {track}")
-                if response == b'\x1b\x30':
-                    self.log_message(self.strings["bpi_set_success"].format(track, bpi_val))
-                elif response:
-                    self.log_message(self.strings["bpi_set_fail"].format(track, response.hex()))
-                self.show_progress(False)
-        except Exception as e:
-            self.log_message(self.strings["bpi_set_error"].format(str(e)))
+        def handle(ack, num, track, bpi_val):
+            if ack:
+                self.track_bpi[num] = bpi_val
+                self.log_message(self.strings["bpi_set_success"].format(track, bpi_val))
+            else:
+                self.log_message(self.strings["bpi_set_fail"].format(track, self.strings["setting_rejected"]))
+        combos = {1: self.bpi_track1_combo, 2: self.bpi_track2_combo, 3: self.bpi_track3_combo}
+        for num, combo in combos.items():
+            track = self.strings[f"track{num}"][:-1]
+            bpi_val = int(combo.currentText())
+            # Anropen köas på I/O-tråden; spår vars BPI redan gäller skickas inte
+            self.call_device(f"Set BPI for {track}", Device.set_bpi, num, bpi_val, fail_key="bpi_set_error",
+                             on_result=lambda ack, num=num, track=track, bpi_val=bpi_val: handle(ack, num, track, bpi_val))
 
     def set_bpc(self):
         try:
-            bpc1 = int(self.bpc_track1_combo.currentText())
-            bpc2 = int(self.bpc_track2_combo.currentText())
-            bpc3 = int(self.bpc_track3_combo.currentText())
-            if not (5 <= bpc1 <= 8 and 5 <= bpc2 <= 8 and 5 <= bpc3 <= 8):
-                raise ValueError()
-            command = bytes([0x1B, 0x6F, bpc1, bpc2, bpc3])
-            self.show_progress(True, self.strings["set_bpc"])
-            response = self.send_command(command, self.strings["set_bpc"])
-            if response and len(response) >= 5 and response[:2] == b'\x1b\x30':
-                self.log_message(self.strings["bpc_set_success"].format(response[2], response[3], response[4]))
-            elif response:
-                self.log_message(self.strings["bpc_set_fail"].format(response.hex()))
-            self.show_progress(False)
-        except ValueError:
-            self.log_message(self.strings["invalid_bpc_value"])
+            bpc = (int(self.bpc_track1_combo.currentText()), int(self.bpc_track2_combo.currentText()),
+                   int(self.bpc_track3_combo.currentText()))
+            protocol.build_set_bpc(*bpc)
+        except ValueError as e:
+            self.log_message(self.strings["invalid_bpc_value"].format(str(e)))
+            return
+
+        def handle(acked):
+            if not acked:
+                self.log_message(self.strings["bpc_set_fail"].format(self.strings["setting_rejected"]))
+                return
+            self.track_bpc = dict(zip(protocol.TRACKS, acked))
+            self.log_message(self.strings["bpc_set_success"].format(*acked))
+        self.call_device("set_bpc", Device.set_bpc, *bpc, on_result=handle, fail_key="bpc_set_fail")
 
     def set_coercivity(self):
-        cmd_code = 0x78 if self.high_co_radio.isChecked() else 0x79
-        self.show_progress(True, self.strings["set_coercivity"])
-        response = self.send_command(bytes([0x1B, cmd_code]), self.strings["set_coercivity"])
-        if response == b'\x1b\x30':
-            co_text = self.strings["high_co"] if self.high_co_radio.isChecked() else self.strings["low_co"]
-            self.log_message(self.strings["coercivity_set_success"].format(co_text))
-        elif response:
-            self.log_message(self.strings["coercivity_set_fail"].format(response.hex()))
+        high = self.high_co_radio.isChecked()
+
+        def handle(ack):
+            if ack:
+                co_text = self.strings["high_co"] if high else self.strings["low_co"]
+                self.log_message(self.strings["coercivity_set_success"].format(co_text))
+            else:
+                self.log_message(self.strings["coercivity_set_fail"].format(self.strings["setting_rejected"]))
+        self.call_device("set_coercivity", Device.set_coercivity, high, on_result=handle,
+                         fail_key="coercivity_set_fail")
+
+    def config_tab_profile(self, name):
+        """Profil med de värden som just nu står i 'Konfiguration'-fliken."""
+        return Profile(
+            name=name,
+            coercivity=protocol.COERCIVITY_HIGH if self.high_co_radio.isChecked() else protocol.COERCIVITY_LOW,
+            leading_zeros=(int(self.leading_zero_13_edit.text()), int(self.leading_zero_2_edit.text())),
+            bpi={num: int(combo.currentText()) for num, combo in
+                 ((1, self.bpi_track1_combo), (2, self.bpi_track2_combo), (3, self.bpi_track3_combo))},
+            bpc=(int(self.bpc_track1_combo.currentText()), int(self.bpc_track2_combo.currentText()),
+                 int(self.bpc_track3_combo.currentText())),
+        )
+
+    def show_profile(self, profile):
+        """Fyller 'Konfiguration'-fliken med profilens värden."""
+        if profile.coercivity:
+            (self.high_co_radio if profile.coercivity == protocol.COERCIVITY_HIGH else self.low_co_radio).setChecked(True)
+        if profile.leading_zeros:
+            self.leading_zero_13_edit.setText(str(profile.leading_zeros[0]))
+            self.leading_zero_2_edit.setText(str(profile.leading_zeros[1]))
+        combos = {1: self.bpi_track1_combo, 2: self.bpi_track2_combo, 3: self.bpi_track3_combo}
+        for num, bpi in profile.bpi.items():
+            combos[num].setCurrentText(str(bpi))
+        if profile.bpc:
+            for combo, bpc in zip((self.bpc_track1_combo, self.bpc_track2_combo, self.bpc_track3_combo), profile.bpc):
+                combo.setCurrentText(str(bpc))
+
+    def save_current_profile(self):
+        s = self.strings
+        name, ok = QInputDialog.getText(self, s["save_profile"], s["profile_name_prompt"],
+                                        text=self.profile_combo.currentText())
+        if not ok or not name:
+            return
+        try:
+            save_profile(self.config_tab_profile(name.strip()))
+        except (ValueError, OSError) as e:
+            self.log_message(s["profile_error"].format(name, str(e)))
+            return
+        self.profile_combo.clear()
+        self.profile_combo.addItems(list_profiles())
+        self.profile_combo.setCurrentText(name.strip())
+        self.log_message(s["profile_saved"].format(name.strip()))
+
+    def apply_selected_profile(self):
+        """Skickar de inställningar i profilen som skiljer sig från enhetens, som ett enda jobb."""
+        s = self.strings
+        name = self.profile_combo.currentText()
+        if not name:
+            return
+        if not self.is_connected:
+            QMessageBox.critical(self, s["error"], s["not_connected"])
+            return
+        try:
+            profile = load_profile(name)
+        except (ValueError, OSError, KeyError) as e:
+            self.log_message(s["profile_error"].format(name, str(e)))
+            return
+        self.show_profile(profile)
+        self.log_message(s["command_sent"].format(s["apply_profile"] + f" {name}"))
+        self.show_progress(True, s["apply_profile"])
+        self.run_in_worker(self.worker.submit(apply_profile, profile),
+                           lambda future: self.profile_applied(future, profile))
+
+    def profile_applied(self, future, profile):
+        s = self.strings
         self.show_progress(False)
+        try:
+            result = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            self.log_message(s["command_error"].format(s["apply_profile"], str(e)))
+            return
+        if result.ok:
+            # Valideringen och rådatakodningen ska räkna med de nya inställningarna
+            self.track_bpi.update(profile.bpi)
+            if profile.bpc:
+                self.track_bpc = dict(zip(protocol.TRACKS, profile.bpc))
+            self.log_message(s["profile_applied"].format(result.profile, len(result.applied), result.skipped))
+            return
+        failed = str(result.failed) if result.failed else "-"
+        self.log_message(s["profile_failed"].format(result.profile, failed, result.error))
+        if result.restored:
+            self.log_message(s["profile_rolled_back"].format(", ".join(step.setting for step in result.restored)))
+        if result.not_restored:
+            self.log_message(s["profile_not_restored"].format(", ".join(step.setting for step in result.not_restored)))
 
     def generate_card(self):
         card_type = self.card_type_combo.currentText()
@@ -1584,15 +1582,7 @@ class MSRE206_Qt_App(QMainWindow):
         return number + str(check_digit)
 
     def calculate_luhn_check_digit(self, number):
-        total = 0
-        for i, digit in enumerate(reversed(number)):
-            n = int(digit)
-            if i % 2 == 0:
-                n *= 2
-                if n > 9:
-                    n -= 9
-            total += n
-        return (10 - (total % 10)) % 10
+        return cards.luhn_check_digit(number)
 
     def generate_expiry_date(self):
         now = datetime.now()
@@ -1624,23 +1614,57 @@ class MSRE206_Qt_App(QMainWindow):
 
     def log_message(self, message):
         timestamp = time.strftime('%H:%M:%S')
-        self.log_text.append(f"{timestamp} - {message}")
+        self.log_model.append(f"{timestamp} - {message}")
+        if self.audit_log:
+            self.audit_log.write(message)
+
+    def log_rows_inserted(self, parent, first, last):
         if self.autoscroll_check.isChecked():
-            self.log_text.moveCursor(QTextCursor.MoveOperation.End)
+            self.log_view.scrollToBottom()
 
     def clear_log(self):
-        self.log_text.clear()
+        self.log_model.clear()
 
     def save_log(self):
-        QMessageBox.information(self, "Save Log", "Log save functionality would be implemented here")
+        """Exporterar raderna i loggvyn; filen skrivs på en bakgrundstråd."""
+        lines = self.log_model.lines()
+        default_name = f"msre206-log-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+        path, _ = QFileDialog.getSaveFileName(self, self.strings["save_log"], default_name,
+                                              "Text files (*.txt);;All files (*)")
+        if not path:
+            return
+        future = Future()
+
+        def export():
+            try:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                future.set_result(path)
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=export, name="msre206-log-export", daemon=True).start()
+        self.run_in_worker(future, self.save_log_finished)
+
+    def save_log_finished(self, future):
+        try:
+            self.log_message(self.strings["log_saved"].format(future.result()))
+        except Exception as e:
+            self.log_message(self.strings["log_save_error"].format(e))
 
     def show_progress(self, show, message=None):
+        # Flera kommandon kan ligga i kö; förloppet döljs när det sista är klart
         if show:
+            self.operations_in_progress += 1
             self.progress_bar.setVisible(True)
             self.progress_bar.setRange(0, 0)  # Indeterminate progress
+            self.set_device_buttons_enabled(False)
             if message:
                 self.status_label.setText(f"<font color='blue'>{message}...</font>")
         else:
+            self.operations_in_progress = max(0, self.operations_in_progress - 1)
+            if self.operations_in_progress:
+                return
             self.progress_bar.setVisible(False)
             self.progress_bar.setRange(0, 100)
             self.update_connection_status_ui()
@@ -1650,34 +1674,121 @@ class MSRE206_Qt_App(QMainWindow):
             QMessageBox.critical(self, self.strings["error"], self.strings["not_connected"])
             return
         if self.is_monitoring:
-            self.sensor_timer.stop()
-            self.is_monitoring = False
-            self.monitor_sensors_action.setText(self.strings["monitor_sensors"])
+            self.stop_presence_monitor()
             self.log_message("Sensor monitoring stopped")
         else:
-            self.sensor_timer.start(1000)  # Check every second
+            self.start_presence_monitor()
             self.is_monitoring = True
             self.monitor_sensors_action.setText(self.strings["stop_monitoring"])
             self.log_message("Sensor monitoring started")
 
-    def check_sensors(self):
+    def start_presence_monitor(self):
+        # Pollar på I/O-tråden med avstudsning och adaptivt intervall; bara ändringar når GUI:t
+        monitor = PresenceMonitor(
+            self.worker,
+            lambda event: self.device_signals.deliver.emit(
+                lambda e: self.card_presence_changed(e, monitor), event))
+        self.presence_monitor = monitor.start()
+
+    def stop_presence_monitor(self):
+        if self.presence_monitor:
+            self.presence_monitor.stop(wait=False)
+            self.presence_monitor = None
+        self.is_monitoring = False
+        self.monitor_sensors_action.setText(self.strings["monitor_sensors"])
+
+    def card_presence_changed(self, event, monitor=None):
+        if monitor is not self.presence_monitor:
+            # Från en monitor som redan stoppats
+            return
+        if event == MONITOR_STOPPED:
+            self.presence_monitor = None
+            if self.supervisor and (self.reconnecting or self.device.disconnected):
+                # Supervisorn startar övervakningen igen när enheten är tillbaka
+                return
+            self.stop_presence_monitor()
+            self.log_message(self.strings["monitoring_failed"].format(monitor.error))
+            return
+        if not self.is_monitoring:
+            return
+        self.log_message(self.strings["card_inserted" if event == CARD_INSERTED else "card_removed"])
+
+    def toggle_batch(self):
+        """Startar batchkodning från en CSV/JSONL-fil, eller stoppar en pågående."""
+        s = self.strings
+        if self.batch_stop is not None:
+            self.batch_stop.set()
+            if self.pending_batch:
+                # Batchen väntar på enheten, så det finns inget jobb som avslutar den
+                self.pending_batch = None
+                self.batch_stop = None
+                self.batch_action.setText(s["batch_encode"])
+            return
         if not self.is_connected:
-            self.sensor_timer.stop()
-            self.is_monitoring = False
+            QMessageBox.critical(self, s["error"], s["not_connected"])
+            return
+        job_path, _ = QFileDialog.getOpenFileName(self, s["batch_encode"], "",
+                                                  "Job files (*.csv *.jsonl *.ndjson);;All files (*)")
+        if not job_path:
             return
+        results_path = os.path.splitext(job_path)[0] + ".results.csv"
+        self.batch_stop = threading.Event()
+        self.batch_action.setText(s["stop_batch"])
+        self.log_message(s["batch_started"].format(job_path))
+        self.start_batch(job_path, results_path)
+
+    def start_batch(self, job_path, results_path, start=0):
+        """Kör jobbfilen från post start + 1; resultaten läggs till när start > 0."""
+        s = self.strings
+        self.show_progress(True, s["batch_encode"])
+        # Hela batchen körs på I/O-tråden; skrivkommandot väntar själv på varje kortdragning,
+        # eller på att nästa kort sätts i när sensorövervakningen är på
+        prompt = insert_prompt(self.device, self.batch_stop) if self.is_monitoring else None
+        future = self.worker.submit(
+            batch.run_batch, job_path, results_path, prompt=prompt, stop=self.batch_stop, start=start,
+            verify=self.verify_check.isChecked(), validator=Validator(self.track_bpc, self.track_bpi),
+            on_record=lambda result: self.device_signals.deliver.emit(self.batch_record_done, result),
+            on_retry=lambda result: self.device_signals.deliver.emit(self.batch_record_retry, result))
+        self.run_in_worker(future, lambda f: self.batch_finished(f, job_path, results_path))
+
+    def batch_record_retry(self, result):
+        self.log_message(self.strings["batch_waiting"].format(result.index))
+
+    def batch_record_done(self, result):
+        status = hex(result.status) if result.status is not None else ""
+        self.log_message(self.strings["batch_record"].format(result.index, result.result, status or result.error))
+
+    def batch_finished(self, future, job_path, results_path):
+        self.show_progress(False)
         try:
-            self.ser.write(bytes([0x1B, 0x80]))
-            time.sleep(0.1)
-            if self.ser.in_waiting:
-                response = self.ser.read(self.ser.in_waiting)
-                if response and response[0] == 0x01:
-                    self.log_message(self.strings["card_detected"])
+            summary = future.result()
+        except CancelledError:
+            summary = None
         except Exception as e:
-            self.log_message(f"Error checking sensors: {str(e)}")
+            summary = None
+            self.log_message(self.strings["batch_error"].format(str(e)))
+        if summary and summary.disconnected and self.supervisor and not self.batch_stop.is_set():
+            # Batchen fortsätter från samma post när supervisorn fått tillbaka enheten
+            self.pending_batch = (job_path, results_path, summary.last_index)
+            self.log_message(self.strings["batch_paused"].format(summary.last_index))
+            return
+        self.batch_stop = None
+        self.batch_action.setText(self.strings["batch_encode"])
+        if summary is None:
+            return
+        self.log_message(self.strings["batch_finished"].format(summary.ok, summary.failed, summary.skipped, results_path))
 
     def closeEvent(self, event):
-        """Säkerställer att serieporten stängs när fönstret stängs."""
+        """Säkerställer att serieporten stängs och loggfilen skrivs klart när fönstret stängs."""
         self.disconnect_serial()
+        if self.audit_log:
+            self.audit_log.stop()
+            self.audit_log = None
+        if self.journal:
+            self.journal.close()
+        for exporter in self.metrics_exporters:
+            exporter.stop()
+        self.metrics_exporters = []
         event.accept()
 
 # -----------------------------------------------------------------------------------
@@ -0,0 +1,36 @@
+"""Fristående protokoll- och enhetslager för MSRE206 (kräver inte PyQt6).
+
+Undermodulerna importeras först när något av namnen nedan används, så att
+kommandoraden (python -m msre206) bara laddar protocol och device.
+"""
+import importlib
+
+_EXPORTS = {
+    "Command": "protocol",
+    "ReadResult": "protocol",
+    "ProtocolError": "protocol",
+    "Device": "device",
+    "DeviceError": "device",
+    "DeviceCancelled": "device",
+    "DeviceTimeout": "device",
+    "NotConnectedError": "device",
+    "DeviceWorker": "worker",
+    "AsyncDevice": "aio",
+    "EncoderPool": "pool",
+    "JobResult": "pool",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
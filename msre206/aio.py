@@ -0,0 +1,354 @@
+"""asyncio-klient för MSRE206.
+
+Porten öppnas icke-blockerande och läses och skrivs när event-loopen rapporterar
+att den är redo, så en loop kan övervaka flera läsare utan en tråd per enhet.
+"""
+import asyncio
+import os
+import time
+
+import serial
+
+from . import protocol
+from .device import INTER_BYTE_TIMEOUT, PORT_ERRORS, RESYNC_TIMEOUT, DeviceCancelled, DeviceDisconnected, DeviceTimeout, NotConnectedError
+from .metrics import OUTCOME_CANCELLED, OUTCOME_DISCONNECTED, OUTCOME_ERROR, OUTCOME_OK, OUTCOME_TIMEOUT
+from .state import DeviceState
+
+# Används bara där porten saknar fileno (Windows) och vi inte kan vänta på läsbarhet
+POLL_INTERVAL = 0.005
+
+
+class AsyncDevice:
+    """Asynkron session mot en MSRE206.
+
+    Alla metoder är coroutines och tar ett valfritt timeout-argument som ersätter
+    kommandots standardtid. Avbryts ett anrop (task.cancel() eller timeout) eller
+    kommer bara en del av svaret synkroniserar nästa kommando först med ESC e, som
+    i Device, så att ett sent svar aldrig tas för nästa. Kommandon på samma enhet
+    körs i tur och ordning. state, disconnected och metrics fungerar som för
+    Device.
+    """
+
+    def __init__(self, port=None, baudrate=9600, ser=None, journal=None, metrics=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.ser = ser
+        self.journal = journal
+        self.metrics = metrics
+        self.state = DeviceState()
+        self.disconnected = False
+        # Ett svar på ett tidigare kommando kan fortfarande vara på väg (se Device)
+        self._stale = False
+        self._lock = asyncio.Lock()
+
+    async def open(self):
+        if self.ser is None or not self.ser.is_open:
+            self.ser = serial.Serial(port=self.port, baudrate=self.baudrate, timeout=0)
+            self.state.clear()
+        else:
+            self.ser.timeout = 0
+        self.disconnected = False
+        self._stale = False
+        return self
+
+    async def close(self):
+        if self.ser and self.ser.is_open:
+            try:
+                self.ser.close()
+            except PORT_ERRORS:
+                # Porten kan redan vara borta
+                pass
+        self.state.clear()
+
+    @property
+    def is_open(self):
+        return bool(self.ser and self.ser.is_open)
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def execute(self, command, timeout=None):
+        """Skickar command och returnerar svaret (None om inget svar förväntas)."""
+        metrics = self.metrics
+        if metrics is None:
+            return await self._execute(command, timeout)
+        outcome, response = OUTCOME_ERROR, None
+        started = time.perf_counter()
+        try:
+            response = await self._execute(command, timeout)
+            outcome = OUTCOME_OK
+            return response
+        except DeviceTimeout:
+            outcome = OUTCOME_TIMEOUT
+            raise
+        except (DeviceCancelled, asyncio.CancelledError):
+            outcome = OUTCOME_CANCELLED
+            raise
+        except DeviceDisconnected:
+            outcome = OUTCOME_DISCONNECTED
+            raise
+        finally:
+            metrics.observe(self.port, command, outcome, time.perf_counter() - started, response)
+
+    async def _execute(self, command, timeout):
+        if not self.is_open:
+            raise NotConnectedError("Not connected to the device")
+        timeout = command.timeout if timeout is None else timeout
+        journal = self.journal
+        async with self._lock:
+            self.state.forget(command)
+            cid = journal.begin(command) if journal else 0
+            try:
+                if self._stale and command.expect_response:
+                    await self._resync()
+                # Det som ligger kvar i bufferten hör inte till det här kommandot
+                self.ser.reset_input_buffer()
+                await self._write(command.payload)
+                if not command.expect_response:
+                    return None
+                try:
+                    parser = await asyncio.wait_for(self._receive(command, cid), timeout)
+                except asyncio.TimeoutError:
+                    self.ser.reset_input_buffer()
+                    self._stale = True
+                    if journal:
+                        journal.note(cid, "timeout")
+                    raise DeviceTimeout(command) from None
+                except asyncio.CancelledError:
+                    self.ser.reset_input_buffer()
+                    self._stale = True
+                    if journal:
+                        journal.note(cid, "cancelled")
+                    raise
+                response = parser.frame
+                if response and not parser.complete:
+                    self.ser.reset_input_buffer()
+                    self._stale = True
+                    if journal:
+                        journal.note(cid, "incomplete")
+                    raise protocol.ProtocolError(response, "Incomplete response from device")
+            except PORT_ERRORS as e:
+                # Som i Device: ett fel på porten betyder att enheten försvunnit
+                self.disconnected = True
+                if journal:
+                    journal.note(cid, "disconnected")
+                raise DeviceDisconnected(f"{command.name}: {e}") from e
+            finally:
+                if journal:
+                    journal.flush()
+        if not response:
+            raise DeviceTimeout(command)
+        return response
+
+    async def _resync(self):
+        """Som Device._resync: skickar ESC e och slänger allt fram till dess ESC y."""
+        command = protocol.build_comm_test()
+        journal = self.journal
+        cid = journal.begin(command) if journal else 0
+        self.ser.reset_input_buffer()
+        await self._write(command.payload)
+        try:
+            await asyncio.wait_for(self._read_until(protocol.COMM_TEST_OK, cid), RESYNC_TIMEOUT)
+        except asyncio.TimeoutError:
+            if journal:
+                journal.note(cid, "timeout")
+            raise DeviceTimeout(command) from None
+        self.ser.reset_input_buffer()
+        self._stale = False
+
+    async def _read_until(self, marker, cid=0):
+        data = b""
+        while marker not in data:
+            chunk = self.ser.read(max(1, self.ser.in_waiting))
+            if chunk:
+                data += chunk
+                if self.journal:
+                    self.journal.received(cid, chunk)
+                continue
+            await self._wait_readable(None)
+
+    async def _write(self, data):
+        """Skriver data utan att blockera event-loopen."""
+        fd = self._fileno()
+        if fd is None:
+            # Utan fileno går det inte att vänta på skrivbarhet; skriv i en tråd i stället
+            await asyncio.get_running_loop().run_in_executor(None, self.ser.write, data)
+            return
+        data = memoryview(data)
+        while data:
+            try:
+                data = data[os.write(fd, data):]
+            except BlockingIOError:
+                await self._wait_writable(fd)
+
+    async def _wait_writable(self, fd):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        loop.add_writer(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_writer(fd)
+
+    def _fileno(self):
+        """Portens filbeskrivare, eller None där den saknas (Windows)."""
+        try:
+            return self.ser.fileno()
+        except (AttributeError, OSError, NotImplementedError):
+            return None
+
+    async def _receive(self, command, cid=0):
+        parser = protocol.FrameParser(command.opcode)
+        while not parser.complete:
+            data = self.ser.read(max(1, self.ser.in_waiting))
+            if data:
+                parser.feed(data)
+                if self.journal:
+                    self.journal.received(cid, data)
+                continue
+            # Första byten får vänta hela tidsgränsen, därefter avslutar tystnad svaret
+            if not await self._wait_readable(INTER_BYTE_TIMEOUT if parser.buffer else None):
+                parser.finish()
+                break
+        return parser
+
+    async def _wait_readable(self, timeout):
+        """Väntar tills porten har data; False om timeout passerade först."""
+        loop = asyncio.get_running_loop()
+        fd = self._fileno()
+        if fd is None:
+            waited = 0.0
+            while not self.ser.in_waiting:
+                if timeout is not None and waited >= timeout:
+                    return False
+                await asyncio.sleep(POLL_INTERVAL)
+                waited += POLL_INTERVAL
+            return True
+        ready = loop.create_future()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await asyncio.wait_for(ready, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(fd)
+
+    # --- Kortoperationer ---
+
+    async def reset(self):
+        await self.execute(protocol.build_reset())
+
+    async def read(self, timeout=None):
+        return protocol.decode_read(await self.execute(protocol.build_read(), timeout))
+
+    async def write(self, tracks, timeout=None):
+        """Skriver {spår: text} och returnerar statusbyten."""
+        return protocol.decode_status(await self.execute(protocol.build_write(tracks), timeout))
+
+    async def write_verified(self, tracks, raw=False, timeout=None):
+        """Skriver och läser tillbaka; se Device.write_verified."""
+        status = await (self.write_raw(tracks, timeout) if raw else self.write(tracks, timeout))
+        result = protocol.VerifyResult(status)
+        if status != protocol.STATUS_OK:
+            return result
+        result.read = await (self.read_raw(timeout) if raw else self.read(timeout))
+        result.mismatches = protocol.compare_tracks(tracks, result.read)
+        return result
+
+    async def erase(self, tracks, timeout=None):
+        return protocol.decode_status(await self.execute(protocol.build_erase(tracks), timeout))
+
+    async def read_raw(self, timeout=None):
+        return protocol.decode_raw_read(await self.execute(protocol.build_read_raw(), timeout))
+
+    async def write_raw(self, tracks, timeout=None):
+        """Skriver {spår: bytes} och returnerar statusbyten."""
+        return protocol.decode_status(await self.execute(protocol.build_write_raw(tracks), timeout))
+
+    async def led(self, code):
+        await self.execute(protocol.build_led(code))
+
+    # --- Tester och information ---
+
+    async def comm_test(self, timeout=None):
+        return protocol.decode_comm_test(await self.execute(protocol.build_comm_test(), timeout))
+
+    async def sensor_test(self, timeout=None):
+        return protocol.decode_ack(await self.execute(protocol.build_sensor_test(), timeout))
+
+    async def ram_test(self, timeout=None):
+        return protocol.decode_ack(await self.execute(protocol.build_ram_test(), timeout))
+
+    async def poll_sensor(self, timeout=None):
+        return protocol.decode_sensor(await self.execute(protocol.build_sensor_poll(), timeout))
+
+    async def get_model(self, timeout=None, refresh=False):
+        if refresh or self.state.model is None:
+            self.state.model = protocol.decode_model(await self.execute(protocol.build_get_model(), timeout))
+        return self.state.model
+
+    async def get_firmware(self, timeout=None, refresh=False):
+        if refresh or self.state.firmware is None:
+            self.state.firmware = protocol.decode_firmware(
+                await self.execute(protocol.build_get_firmware(), timeout))
+        return self.state.firmware
+
+    async def get_coercivity(self, timeout=None, refresh=False):
+        if refresh or self.state.coercivity is None:
+            self.state.coercivity = protocol.decode_coercivity(
+                await self.execute(protocol.build_get_coercivity(), timeout))
+        return self.state.coercivity
+
+    async def load_state(self, timeout=None):
+        """Se Device.load_state."""
+        await self.get_model(timeout, refresh=True)
+        await self.get_firmware(timeout, refresh=True)
+        await self.get_coercivity(timeout, refresh=True)
+        await self.check_leading_zeros(timeout, refresh=True)
+        return self.state
+
+    # --- Konfiguration (hoppar över värden som redan gäller, se Device) ---
+
+    async def set_leading_zeros(self, lz_13, lz_2, timeout=None):
+        if self.state.leading_zeros == (lz_13, lz_2):
+            return True
+        ack = protocol.decode_ack(await self.execute(protocol.build_set_leading_zeros(lz_13, lz_2), timeout))
+        if ack:
+            self.state.leading_zeros = (lz_13, lz_2)
+        return ack
+
+    async def check_leading_zeros(self, timeout=None, refresh=False):
+        if refresh or self.state.leading_zeros is None:
+            self.state.leading_zeros = protocol.decode_leading_zeros(
+                await self.execute(protocol.build_check_leading_zeros(), timeout))
+        return self.state.leading_zeros
+
+    async def set_bpi(self, track, bpi, timeout=None):
+        bpi = int(bpi)
+        if self.state.bpi.get(track) == bpi:
+            return True
+        ack = protocol.decode_ack(await self.execute(protocol.build_set_bpi(track, bpi), timeout))
+        if ack:
+            self.state.bpi[track] = bpi
+        return ack
+
+    async def set_bpc(self, bpc1, bpc2, bpc3, timeout=None):
+        if self.state.bpc == (bpc1, bpc2, bpc3):
+            return self.state.bpc
+        acked = protocol.decode_bpc(await self.execute(protocol.build_set_bpc(bpc1, bpc2, bpc3), timeout))
+        if acked:
+            self.state.bpc = acked
+        return acked
+
+    async def set_coercivity(self, high, timeout=None):
+        value = protocol.COERCIVITY_HIGH if high else protocol.COERCIVITY_LOW
+        if self.state.coercivity == value:
+            return True
+        ack = protocol.decode_ack(await self.execute(protocol.build_set_coercivity(high), timeout))
+        if ack:
+            self.state.coercivity = value
+        return ack
@@ -0,0 +1,112 @@
+"""Beständig logg som skrivs av en bakgrundstråd.
+
+Raderna läggs på en kö via logging.QueueHandler och skrivs till fil av en
+QueueListener, så den som loggar (GUI- eller I/O-tråden) aldrig väntar på disken.
+Filen roteras när den blir för stor eller när dagen (timmen) byts, och gamla filer
+kan gzip-komprimeras:
+
+    audit = AuditLog("~/.msre206/msre206.log").start()
+    audit.write("Card written")
+    audit.stop()
+"""
+import gzip
+import logging
+import os
+import queue
+import shutil
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 10
+# Tidsrotation: ny fil när den här tidsstämpeln ändras
+ROTATE_FORMATS = {"daily": "%Y-%m-%d", "hourly": "%Y-%m-%d %H"}
+LINE_FORMAT = "%(asctime)s.%(msecs)03d %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class AuditFileHandler(RotatingFileHandler):
+    """RotatingFileHandler som även roterar vid dags- eller timskifte.
+
+    Perioden jämförs med filens senaste ändring, så en fil från i går roteras vid
+    första raden i dag även om programmet startats om däremellan.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT,
+                 rotate="daily", compress=False):
+        if backup_count < 1:
+            raise ValueError("backup_count must be at least 1")
+        super().__init__(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.period_format = ROTATE_FORMATS[rotate] if rotate else None
+        self._period = None
+        if self.period_format and os.path.exists(self.baseFilename):
+            self._period = time.strftime(self.period_format, time.localtime(os.path.getmtime(self.baseFilename)))
+        if compress:
+            self.namer = lambda name: name + ".gz"
+            self.rotator = _gzip_rotator
+
+    def shouldRollover(self, record):
+        if self.period_format:
+            period = time.strftime(self.period_format, time.localtime(record.created))
+            if self._period is None:
+                self._period = period
+            elif period != self._period:
+                self._period = period
+                return os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0
+        return super().shouldRollover(record)
+
+
+class AuditLog:
+    """Skriver rader till en roterande fil från en egen tråd."""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT,
+                 rotate="daily", compress=True):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate = rotate
+        self.compress = compress
+        self.logger = logging.getLogger(f"msre206.audit.{id(self)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self._handler = None
+        self._listener = None
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._handler = AuditFileHandler(self.path, self.max_bytes, self.backup_count,
+                                         self.rotate, self.compress)
+        self._handler.setFormatter(logging.Formatter(LINE_FORMAT, DATE_FORMAT))
+        records = queue.SimpleQueue()
+        self._listener = QueueListener(records, self._handler)
+        self._listener.start()
+        self.logger.addHandler(QueueHandler(records))
+        return self
+
+    def write(self, message):
+        """Köar en rad; tidsstämpeln sätts nu, inte när raden skrivs."""
+        self.logger.info(message)
+
+    def stop(self):
+        """Skriver ut det som ligger i kön och stänger filen."""
+        if self._listener is None:
+            return
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        self._listener.stop()
+        self._handler.close()
+        self._listener = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,232 @@
+"""Batchkodning från CSV- eller JSONL-filer.
+
+Jobbfilen läses en post i taget, så även mycket stora filer går att köra. Resultatet
+skrivs som CSV med en rad per post direkt när posten är klar.
+"""
+import csv
+import json
+import os
+from dataclasses import dataclass
+
+from . import protocol
+from .device import DeviceDisconnected, DeviceTimeout
+
+# Kolumn (CSV) eller nyckel (JSONL) för varje spår
+DEFAULT_COLUMNS = {1: "track1", 2: "track2", 3: "track3"}
+# Valfri kolumn som identifierar posten i resultatfilen
+ID_COLUMN = "id"
+RESULT_FIELDS = ["record", "id", "status", "result", "error"]
+# prompt kan returnera SKIP för att hoppa över posten (räknas som misslyckad och som skipped)
+SKIP = "skip"
+# Felet när kortet skrevs men återläsningen inte kom i tid; posten körs inte om
+VERIFY_TIMEOUT = "verify timeout"
+
+
+def detect_format(path):
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def iter_records(path, fmt=None):
+    """Ger en post (dict) i taget från en CSV- eller JSONL-fil."""
+    fmt = fmt or detect_format(path)
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def record_tracks(record, columns=None):
+    """Plockar ut {spår: text} ur en post; tomma fält hoppas över."""
+    columns = columns or DEFAULT_COLUMNS
+    return {num: str(record[col]) for num, col in columns.items() if record.get(col)}
+
+
+@dataclass
+class RecordResult:
+    index: int
+    record_id: str = ""
+    status: int = None
+    error: str = ""
+    # Spår som inte läste tillbaka som skrivet (bara med verify)
+    mismatches: tuple = ()
+    # Posten stoppades av valideringen och skickades aldrig till enheten
+    invalid: bool = False
+    # Operatören hoppade över posten
+    skipped: bool = False
+
+    @property
+    def ok(self):
+        return not self.error and self.status == protocol.STATUS_OK
+
+    @property
+    def result(self):
+        if self.ok:
+            return "ok"
+        if self.invalid:
+            return "invalid"
+        if self.skipped:
+            return "skipped"
+        if self.mismatches:
+            return "mismatch"
+        if self.error == VERIFY_TIMEOUT:
+            return "verify_timeout"
+        return "timeout" if self.error == "timeout" else "error"
+
+    def row(self):
+        status = "" if self.status is None else hex(self.status)
+        return [self.index, self.record_id, status, self.result, self.error]
+
+
+@dataclass
+class BatchSummary:
+    total: int = 0
+    ok: int = 0
+    failed: int = 0
+    # Poster som avvisades av valideringen (räknas också i failed)
+    invalid: int = 0
+    # Poster som operatören hoppade över (räknas också i failed)
+    skipped: int = 0
+    # Index för sista behandlade post; används för att fortsätta en avbruten körning
+    last_index: int = 0
+    # Körningen avbröts för att enheten försvann; posten efter last_index är inte skriven
+    disconnected: bool = False
+
+    def add(self, result):
+        self.total += 1
+        self.last_index = result.index
+        if result.ok:
+            self.ok += 1
+        else:
+            self.failed += 1
+        if result.invalid:
+            self.invalid += 1
+        if result.skipped:
+            self.skipped += 1
+
+    def extend(self, other):
+        """Lägger till en fortsättning av samma körning (run_batch med start=last_index)."""
+        self.total += other.total
+        self.ok += other.ok
+        self.failed += other.failed
+        self.invalid += other.invalid
+        self.skipped += other.skipped
+        self.last_index = other.last_index
+        self.disconnected = other.disconnected
+
+
+def encode_record(device, index, record, columns=None, verify=False):
+    """Skriver en post till kortet och returnerar ett RecordResult.
+
+    Med verify läses kortet tillbaka direkt efter skrivningen och jämförs spår för spår.
+    Kommer återläsningen inte i tid är kortet redan skrivet, så posten får felet
+    VERIFY_TIMEOUT (resultat "verify_timeout") och statusen från skrivningen.
+    """
+    result = RecordResult(index, str(record.get(ID_COLUMN, "")))
+    tracks = record_tracks(record, columns)
+    if not tracks:
+        result.error = "no track data"
+        return result
+    try:
+        result.status = device.write(tracks)
+        if result.status != protocol.STATUS_OK:
+            result.error = "write error"
+        elif verify:
+            _verify(device, tracks, result)
+    except DeviceDisconnected:
+        # Posten har inget resultat; run_batch avbryter så att den kan köras om
+        raise
+    except DeviceTimeout:
+        result.error = "timeout"
+    except protocol.ProtocolError as e:
+        result.error = f"invalid response: {e.response.hex()}"
+    except Exception as e:
+        result.error = str(e)
+    return result
+
+
+def _verify(device, tracks, result):
+    """Läser tillbaka ett skrivet kort (som Device.write_verified) och sätter fel i result."""
+    try:
+        read = device.read()
+    except DeviceTimeout:
+        result.error = VERIFY_TIMEOUT
+        return
+    if not read.ok:
+        result.error = f"verify read error {hex(read.status)}"
+        return
+    mismatches = protocol.compare_tracks(tracks, read)
+    if mismatches:
+        result.mismatches = tuple(sorted(mismatches))
+        result.error = "mismatch on track " + ",".join(str(n) for n in result.mismatches)
+
+
+def _encode_until_done(device, index, record, columns, verify, prompt, stop, on_retry):
+    """Kodar posten tills den blir klar; None om prompt avbröt körningen.
+
+    En timeout betyder bara att inget kort drogs i tid, så samma post körs igen (med
+    ny prompt) tills den lyckas, hoppas över (SKIP) eller körningen stoppas.
+    """
+    while True:
+        answer = prompt(index, record) if prompt else None
+        if answer is False:
+            return None
+        if answer == SKIP:
+            return RecordResult(index, str(record.get(ID_COLUMN, "")), error="skipped", skipped=True)
+        result = encode_record(device, index, record, columns, verify)
+        if result.error != "timeout" or (stop is not None and stop.is_set()):
+            return result
+        if on_retry:
+            on_retry(result)
+
+
+def run_batch(device, job_path, results_path, columns=None, fmt=None, prompt=None,
+              on_record=None, stop=None, start=0, verify=False, validator=None, on_retry=None):
+    """Kodar alla poster i job_path med device och skriver resultat till results_path.
+
+    prompt(index, record) anropas före varje post, t.ex. för att vänta på operatören
+    eller på nästa kort (presence.insert_prompt); returnerar den False avbryts körningen
+    och SKIP hoppar över posten. Utan prompt väntar skrivkommandot självt på nästa
+    kortdragning. Dras inget kort i tid körs samma post igen, och on_retry(result)
+    anropas med timeoutresultatet. on_record(result) anropas efter varje post. stop är
+    en threading.Event som avbryter efter pågående post. Med start > 0 hoppas de
+    första posterna över och resultaten läggs till.
+    verify=True läser tillbaka varje kort och markerar avvikande spår som "mismatch";
+    en återläsning som inte kommer i tid blir "verify_timeout" utan att kortet skrivs om.
+    Med en validator (validate.Validator) kontrolleras hela filen först; ogiltiga poster
+    skickas aldrig till enheten utan får resultatet "invalid" direkt.
+    Försvinner enheten avbryts körningen med summary.disconnected satt; med
+    start=summary.last_index fortsätter en ny körning med posten som inte hann skrivas.
+    """
+    summary = BatchSummary(last_index=start)
+    invalid = validator.check_file(job_path, fmt, columns, start).invalid if validator else {}
+    append = start > 0 and os.path.exists(results_path)
+    with open(results_path, "a" if append else "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out)
+        if not append:
+            writer.writerow(RESULT_FIELDS)
+        for index, record in enumerate(iter_records(job_path, fmt), 1):
+            if index <= start:
+                continue
+            if stop is not None and stop.is_set():
+                break
+            if index in invalid:
+                result = RecordResult(index, str(record.get(ID_COLUMN, "")),
+                                      error="; ".join(invalid[index]), invalid=True)
+            else:
+                try:
+                    result = _encode_until_done(device, index, record, columns, verify, prompt, stop, on_retry)
+                except DeviceDisconnected:
+                    summary.disconnected = True
+                    break
+                if result is None:
+                    break
+            writer.writerow(result.row())
+            out.flush()
+            summary.add(result)
+            if on_record:
+                on_record(result)
+    return summary
@@ -0,0 +1,230 @@
+"""Prestandamätning: kommandolatens, kort per minut och mikrotester av tolkarna.
+
+Körs mot en riktig enhet eller mot simulatorn och skriver resultatet som JSON, så
+att körningar kan jämföras mellan versioner:
+
+    python -m msre206.bench --simulate --output bench.json
+    python -m msre206.bench --port /dev/ttyUSB0 --no-cards
+
+Mot en riktig enhet väntar läs-, skriv- och raderingsmätningarna på kortdragningar.
+Konfigurationskommandon (BPC, BPI, koercivitet, ledande nollor) ändrar enhetens
+inställningar och körs bara med --simulate eller --config.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from . import cards, protocol
+from .device import Device
+
+SCHEMA_VERSION = 1
+
+# Kommandon som bara frågar enheten
+QUERY_COMMANDS = {
+    "comm_test": protocol.build_comm_test,
+    "get_model": protocol.build_get_model,
+    "get_firmware": protocol.build_get_firmware,
+    "get_coercivity": protocol.build_get_coercivity,
+    "check_leading_zeros": protocol.build_check_leading_zeros,
+    "ram_test": protocol.build_ram_test,
+}
+# Kommandon som ändrar inställningar; värdena är enhetens standardvärden
+CONFIG_COMMANDS = {
+    "set_leading_zeros": lambda: protocol.build_set_leading_zeros(61, 22),
+    "set_bpi": lambda: protocol.build_set_bpi(1, 210),
+    "set_bpc": lambda: protocol.build_set_bpc(7, 5, 5),
+    "set_coercivity": lambda: protocol.build_set_coercivity(True),
+}
+SAMPLE_TRACKS = {
+    1: "%B4111111111111111^TEST/CARDHOLDER^2812101?",
+    2: ";4111111111111111=2812101?",
+    3: ";0123456789012345678901234567890?",
+}
+CARD_COMMANDS = {
+    "read_card": protocol.build_read,
+    "write_card": lambda: protocol.build_write(SAMPLE_TRACKS),
+    "erase_card": lambda: protocol.build_erase(protocol.TRACKS),
+    "read_raw": protocol.build_read_raw,
+}
+
+
+def summarize(samples):
+    """Percentiler (närmaste rang) i millisekunder för en lista med sekunder."""
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def pct(p):
+        return round(ordered[min(n - 1, max(0, int(round(p / 100 * n)) - 1))] * 1000, 3)
+
+    return {
+        "n": n,
+        "mean_ms": round(sum(ordered) / n * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def bench_latency(device, builders, iterations):
+    """Tur och retur-tid per kommando; misslyckade anrop räknas separat."""
+    results = {}
+    for name, build in builders.items():
+        command = build()
+        samples, errors = [], 0
+        for _ in range(iterations):
+            start = time.perf_counter()
+            try:
+                device.execute(command)
+            except Exception:
+                errors += 1
+                continue
+            samples.append(time.perf_counter() - start)
+        results[name] = summarize(samples) if samples else {"n": 0}
+        results[name]["errors"] = errors
+    return results
+
+
+def bench_cycles(device, cycles):
+    """Hela kort-cykler (skicka, vänta på dragning, svar) per minut."""
+    results = {}
+    for name, build in CARD_COMMANDS.items():
+        command = build()
+        ok = 0
+        start = time.perf_counter()
+        for _ in range(cycles):
+            try:
+                device.execute(command)
+                ok += 1
+            except Exception:
+                pass
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "cycles": cycles,
+            "ok": ok,
+            "seconds": round(elapsed, 3),
+            "cycles_per_minute": round(ok * 60 / elapsed, 2) if elapsed else 0.0,
+        }
+    return results
+
+
+# ? FS ESC status efter spårblocken, som enheten (och simulatorn) skickar
+_TRACK_TRAILER = bytes([0x3F, protocol.FS, protocol.ESC, protocol.STATUS_OK])
+
+
+def _sample_read_response():
+    block = bytearray([protocol.ESC, 0x73])
+    for num, data in SAMPLE_TRACKS.items():
+        # Enheten skickar spårdatan utan slutvakt; '?' kommer först i avslutningen
+        block += bytes([protocol.ESC, num]) + data.split("?")[0].encode()
+    return bytes(block) + _TRACK_TRAILER
+
+
+def _sample_raw_response():
+    block = bytearray([protocol.ESC, 0x73])
+    for num, data in SAMPLE_TRACKS.items():
+        raw = data.encode() * 2
+        block += bytes([protocol.ESC, num, len(raw)]) + raw
+    return bytes(block) + _TRACK_TRAILER
+
+
+def _parse_frame(opcode, frame):
+    parser = protocol.FrameParser(opcode)
+    parser.feed(frame)
+    parser.finish()
+    return parser.frame
+
+
+def bench_micro(iterations):
+    """Tid per anrop (mikrosekunder) för de rena Python-delarna."""
+    read_response = _sample_read_response()
+    raw_response = _sample_raw_response()
+    raw_tracks = {num: data.encode() for num, data in SAMPLE_TRACKS.items()}
+    cases = {
+        "decode_read": lambda: protocol.decode_read(read_response),
+        "decode_raw_read": lambda: protocol.decode_raw_read(raw_response),
+        "build_write": lambda: protocol.build_write(SAMPLE_TRACKS),
+        "build_write_raw": lambda: protocol.build_write_raw(raw_tracks),
+        "frame_parser_read": lambda: _parse_frame(protocol.OP_READ, read_response),
+        "frame_parser_raw_read": lambda: _parse_frame(protocol.OP_READ_RAW, raw_response),
+        "luhn_check_digit": lambda: cards.luhn_check_digit("411111111111111"),
+    }
+    results = {}
+    for name, fn in cases.items():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - start
+        results[name] = {"iterations": iterations, "us_per_call": round(elapsed / iterations * 1e6, 3)}
+    return results
+
+
+def run(device=None, iterations=50, cycles=20, micro_iterations=20000, card_ops=True, config=False):
+    """Kör alla mätningar och returnerar en dict som kan skrivas som JSON."""
+    report = {
+        "schema": SCHEMA_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "micro": bench_micro(micro_iterations),
+    }
+    if device is not None:
+        builders = dict(QUERY_COMMANDS)
+        if config:
+            builders.update(CONFIG_COMMANDS)
+        if card_ops:
+            builders.update(CARD_COMMANDS)
+        report["port"] = device.port
+        report["latency"] = bench_latency(device, builders, iterations)
+        if card_ops:
+            report["cycles"] = bench_cycles(device, cycles)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark an MSRE206 or the simulator")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--port", help="serial port of a real device")
+    target.add_argument("--simulate", action="store_true", help="run against the built-in simulator")
+    parser.add_argument("--swipe-delay", type=float, default=0.0, help="simulated swipe time in seconds")
+    parser.add_argument("--no-pace", action="store_true", help="simulator sends without wire-time pacing")
+    parser.add_argument("--iterations", type=int, default=50, help="round trips per command")
+    parser.add_argument("--cycles", type=int, default=20, help="card cycles per operation")
+    parser.add_argument("--micro-iterations", type=int, default=20000, help="calls per microbenchmark")
+    parser.add_argument("--no-cards", action="store_true", help="skip commands that wait for a swipe")
+    parser.add_argument("--config", action="store_true", help="include commands that change settings")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    sim = None
+    device = None
+    try:
+        if args.simulate:
+            from .simulator import MSRE206Simulator
+            sim = MSRE206Simulator(swipe_delay=args.swipe_delay, pace=not args.no_pace)
+            device = Device(sim.start()).open()
+        elif args.port:
+            device = Device(args.port).open()
+        report = run(device, args.iterations, args.cycles, args.micro_iterations,
+                     card_ops=not args.no_cards, config=args.config or args.simulate)
+        if sim is not None:
+            report["simulator"] = {"swipe_delay": args.swipe_delay, "paced": not args.no_pace}
+    finally:
+        if device is not None:
+            device.close()
+        if sim is not None:
+            sim.stop()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""Hjälpfunktioner för kortnummer som inte behöver GUI:t."""
+
+
+def luhn_check_digit(number):
+    """Beräknar Luhn-kontrollsiffran för number (utan kontrollsiffra)."""
+    total = 0
+    for i, digit in enumerate(reversed(number)):
+        n = int(digit)
+        if i % 2 == 0:
+            n *= 2
+            if n > 9:
+                n -= 9
+        total += n
+    return (10 - (total % 10)) % 10
@@ -0,0 +1,434 @@
+"""Kommandorad för MSRE206 utan GUI.
+
+Laddar bara pyserial och protokollkoden, så ett anrop kommer ut på linjen direkt och
+passar i skript och cron-jobb:
+
+    python -m msre206 --port /dev/ttyUSB0 read
+    python -m msre206 --port /dev/ttyUSB0 erase 1 2
+    python -m msre206 --port /dev/ttyUSB0 write --track1 "%B1234^NAME^2512?"
+    python -m msre206 --port /dev/ttyUSB0 --json info
+
+Porten kan också anges med miljövariabeln MSRE206_PORT. Med --journal (eller
+MSRE206_JOURNAL) sparas all trafik på porten, se msre206.journal, och med
+--metrics-port/--metrics-file exporteras mätvärden per kommando, se
+msre206.metrics. Slutkoden är 0
+vid lyckat kommando, 1 om enheten svarade med fel eller inte svarade, och 2 vid
+felaktiga argument.
+"""
+import argparse
+import json
+import os
+import sys
+
+from . import protocol
+from .device import Device, DeviceError
+
+PORT_ENV = "MSRE206_PORT"
+JOURNAL_ENV = "MSRE206_JOURNAL"
+METRICS_PORT_ENV = "MSRE206_METRICS_PORT"
+METRICS_FILE_ENV = "MSRE206_METRICS_FILE"
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+def _tracks_arg(values):
+    tracks = []
+    for value in values:
+        for part in value.replace("+", ",").split(","):
+            if part.strip():
+                tracks.append(int(part))
+    return tracks
+
+
+def _track_options(parser, kind):
+    for num in protocol.TRACKS:
+        parser.add_argument(f"-{num}", f"--track{num}", dest=f"track{num}", metavar=kind.upper(),
+                            help=f"{kind} for track {num}")
+
+
+def _collect_tracks(args, convert=str):
+    return {num: convert(getattr(args, f"track{num}")) for num in protocol.TRACKS
+            if getattr(args, f"track{num}")}
+
+
+def _status_text(status):
+    return "ok" if status == protocol.STATUS_OK else f"error {status:#04x}"
+
+
+def _emit(args, data, lines):
+    if args.json:
+        print(json.dumps(data))
+    else:
+        for line in lines:
+            print(line)
+
+
+# --- Underkommandon ---
+
+def cmd_read(device, args):
+    result = device.read()
+    _emit(args, {"status": result.status, "ok": result.ok,
+                 "tracks": {str(n): t for n, t in result.tracks.items()}},
+          [f"Track {n}: {t}" for n, t in result.tracks.items()] + [f"Status: {_status_text(result.status)}"])
+    return EXIT_OK if result.ok else EXIT_FAILED
+
+
+def cmd_raw_read(device, args):
+    result = device.read_raw()
+    _emit(args, {"status": result.status, "ok": result.ok,
+                 "tracks": {str(n): t.hex() for n, t in result.tracks.items()}},
+          [f"Track {n}: {t.hex()}" for n, t in result.tracks.items()] + [f"Status: {_status_text(result.status)}"])
+    return EXIT_OK if result.ok else EXIT_FAILED
+
+
+def _finish_write(device, args, tracks, raw):
+    if args.verify:
+        result = device.write_verified(tracks, raw=raw)
+        status, ok = result.status, result.ok
+        mismatches = sorted(result.mismatches)
+    else:
+        status = device.write_raw(tracks) if raw else device.write(tracks)
+        ok, mismatches = status == protocol.STATUS_OK, []
+    lines = [f"Status: {_status_text(status)}"]
+    if mismatches:
+        lines.append("Verify mismatch on track " + ",".join(str(n) for n in mismatches))
+    _emit(args, {"status": status, "ok": ok, "mismatches": mismatches}, lines)
+    return EXIT_OK if ok else EXIT_FAILED
+
+
+def cmd_write(device, args):
+    tracks = _collect_tracks(args)
+    if not tracks:
+        raise ValueError("No track data given")
+    if not args.no_validate:
+        from .validate import Validator
+        errors = Validator().check_tracks(tracks)
+        if errors:
+            raise ValueError("; ".join(errors))
+    return _finish_write(device, args, tracks, raw=False)
+
+
+def cmd_raw_write(device, args):
+    tracks = _collect_tracks(args, bytes.fromhex)
+    if not tracks:
+        raise ValueError("No track data given")
+    return _finish_write(device, args, tracks, raw=True)
+
+
+def cmd_erase(device, args):
+    status = device.erase(_tracks_arg(args.tracks) or protocol.TRACKS)
+    _emit(args, {"status": status, "ok": status == protocol.STATUS_OK}, [f"Status: {_status_text(status)}"])
+    return EXIT_OK if status == protocol.STATUS_OK else EXIT_FAILED
+
+
+def cmd_info(device, args):
+    info = {
+        "comm_test": device.comm_test(),
+        "model": device.get_model(),
+        "firmware": device.get_firmware(),
+    }
+    _emit(args, info, [f"Communication test: {'ok' if info['comm_test'] else 'failed'}",
+                       f"Model: {info['model']}", f"Firmware: {info['firmware']}"])
+    return EXIT_OK if info["comm_test"] else EXIT_FAILED
+
+
+def cmd_config(device, args):
+    """Ändrar de inställningar som angetts och skriver sedan ut aktuella värden."""
+    acks = {}
+    if args.coercivity:
+        acks["coercivity"] = device.set_coercivity(args.coercivity == protocol.COERCIVITY_HIGH)
+    if args.leading_zeros:
+        acks["leading_zeros"] = device.set_leading_zeros(*args.leading_zeros)
+    for track, bpi in args.bpi:
+        acks[f"bpi{track}"] = device.set_bpi(track, bpi)
+    if args.bpc:
+        acked = device.set_bpc(*args.bpc)
+        acks["bpc"] = list(acked) if acked else False
+    # Visa vad enheten faktiskt har, inte det som nyss sparats i device.state
+    lz_13, lz_2 = device.check_leading_zeros(refresh=True)
+    current = {
+        "coercivity": device.get_coercivity(refresh=True),
+        "leading_zeros": [lz_13, lz_2],
+    }
+    lines = [f"Set {name}: {'ok' if ack else 'failed'}" for name, ack in acks.items()]
+    lines += [f"Coercivity: {current['coercivity']}", f"Leading zeros: track 1&3 {lz_13}, track 2 {lz_2}"]
+    _emit(args, {"set": acks, "current": current}, lines)
+    return EXIT_OK if all(acks.values()) else EXIT_FAILED
+
+
+def cmd_discover(device, args):
+    """Letar efter enheter på alla portar; kräver ingen --port."""
+    from . import discovery
+
+    found = discovery.discover(baudrate=args.baudrate, timeout=args.timeout or discovery.PROBE_TIMEOUT)
+    _emit(args, [{"port": f.port, "model": f.model, "firmware": f.firmware, "description": f.description}
+                 for f in found],
+          [f"{f.port}: model {f.model}, firmware {f.firmware} ({f.description})" for f in found]
+          or ["No MSRE206 found"])
+    return EXIT_OK if found else EXIT_FAILED
+
+
+def cmd_profile(device, args):
+    """Visar, sparar eller tar bort profiler; kräver ingen enhet."""
+    from . import profiles
+
+    if args.action == "list":
+        names = profiles.list_profiles()
+        _emit(args, names, names)
+        return EXIT_OK
+    if not args.name:
+        raise ValueError(f"profile {args.action} needs a name")
+    if args.action == "show":
+        data = profiles.load_profile(args.name).to_dict()
+        _emit(args, data, [f"{key}: {value}" for key, value in data.items()])
+    elif args.action == "save":
+        profile = profiles.Profile(args.name, args.coercivity,
+                                   tuple(args.leading_zeros) if args.leading_zeros else None,
+                                   dict(args.bpi), tuple(args.bpc) if args.bpc else None)
+        path = profiles.save_profile(profile)
+        _emit(args, {"saved": path}, [f"Saved {path}"])
+    else:
+        profiles.delete_profile(args.name)
+    return EXIT_OK
+
+
+def cmd_apply_profile(device, args):
+    from . import profiles
+
+    result = profiles.apply_profile(device, profiles.load_profile(args.name), rollback=not args.no_rollback)
+    lines = [f"Changed: {', '.join(str(step) for step in result.applied) or 'nothing'}",
+             f"Already set: {result.skipped}"]
+    if not result.ok:
+        lines.append(f"Failed at {result.failed or '-'}: {result.error}")
+        lines.append(f"Rolled back: {', '.join(step.setting for step in result.restored) or 'nothing'}")
+        if result.not_restored:
+            lines.append(f"Not restored: {', '.join(step.setting for step in result.not_restored)}")
+    _emit(args, {"ok": result.ok, "applied": [str(step) for step in result.applied], "skipped": result.skipped,
+                 "failed": str(result.failed) if result.failed else None, "error": result.error,
+                 "restored": [step.setting for step in result.restored],
+                 "not_restored": [step.setting for step in result.not_restored]}, lines)
+    return EXIT_OK if result.ok else EXIT_FAILED
+
+
+def _columns_arg(value):
+    return dict(zip(protocol.TRACKS, value.split(","))) if value else None
+
+
+def cmd_validate(device, args):
+    """Kontrollerar en jobbfil utan enhet; ogiltiga poster skrivs på stderr."""
+    from .validate import Validator
+
+    validator = Validator(check_luhn=args.luhn)
+    report = validator.check_file(args.job, args.format, _columns_arg(args.columns), args.start)
+    for index, errors in report.invalid.items():
+        print(f"{index}\t" + "; ".join(errors), file=sys.stderr)
+    _emit(args, {"total": report.total, "invalid": len(report.invalid)},
+          [f"Total: {report.total}, invalid: {len(report.invalid)}"])
+    return EXIT_OK if report.ok else EXIT_FAILED
+
+
+def cmd_batch(device, args):
+    from . import batch
+
+    columns = _columns_arg(args.columns)
+
+    def on_record(result):
+        if not args.quiet:
+            print(f"{result.index}\t{result.record_id}\t{result.result}\t{result.error}", file=sys.stderr)
+
+    def on_retry(result):
+        if not args.quiet:
+            print(f"{result.index}\t{result.record_id}\tno card swiped, waiting again", file=sys.stderr)
+
+    validator = None
+    if not args.no_validate:
+        from .validate import Validator
+        validator = Validator(check_luhn=args.luhn)
+
+    prompt = None
+    if args.wait_card:
+        from .presence import insert_prompt
+        prompt = insert_prompt(device)
+
+    def run(start):
+        return batch.run_batch(device, args.job, args.results, columns=columns, fmt=args.format,
+                               prompt=prompt, on_record=on_record, start=start, verify=args.verify,
+                               validator=validator, on_retry=on_retry)
+
+    summary = run(args.start)
+    while summary.disconnected and args.reconnect:
+        from . import supervisor
+        print(f"msre206: device lost after record {summary.last_index}, waiting for it to come back",
+              file=sys.stderr)
+        supervisor.reconnect(device, supervisor.take_down(device))
+        print(f"msre206: reconnected, resuming at record {summary.last_index + 1}", file=sys.stderr)
+        summary.extend(run(summary.last_index))
+    if summary.disconnected:
+        print(f"msre206: device lost after record {summary.last_index}; resume with --start {summary.last_index}",
+              file=sys.stderr)
+    _emit(args, {"total": summary.total, "ok": summary.ok, "failed": summary.failed,
+                 "invalid": summary.invalid, "skipped": summary.skipped, "last_index": summary.last_index,
+                 "disconnected": summary.disconnected},
+          [f"Total: {summary.total}, ok: {summary.ok}, failed: {summary.failed}, invalid: {summary.invalid}, "
+           f"skipped: {summary.skipped}"])
+    return EXIT_OK if not summary.failed and not summary.disconnected else EXIT_FAILED
+
+
+def _bpi_arg(value):
+    track, _, bpi = value.partition("=")
+    track, bpi = int(track), int(bpi)
+    if track not in protocol.TRACKS or bpi not in protocol.BPI_VALUES:
+        raise argparse.ArgumentTypeError(f"invalid BPI setting: {value}")
+    return track, bpi
+
+
+def _setting_options(parser):
+    parser.add_argument("--coercivity", choices=(protocol.COERCIVITY_HIGH, protocol.COERCIVITY_LOW))
+    parser.add_argument("--leading-zeros", type=int, nargs=2, metavar=("TRACK13", "TRACK2"))
+    parser.add_argument("--bpi", type=_bpi_arg, action="append", default=[], metavar="TRACK=BPI",
+                        help="bits per inch, 75 or 210 (repeatable)")
+    parser.add_argument("--bpc", type=int, nargs=3, choices=protocol.BPC_VALUES, metavar=("T1", "T2", "T3"),
+                        help="bits per character for tracks 1-3")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="msre206", description="Headless MSRE206 card reader/writer")
+    parser.add_argument("-p", "--port", default=os.environ.get(PORT_ENV),
+                        help=f"serial port (default: ${PORT_ENV})")
+    parser.add_argument("--baudrate", type=int, default=9600)
+    parser.add_argument("--timeout", type=float, help="override the command timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--journal", default=os.environ.get(JOURNAL_ENV),
+                        help=f"append all serial traffic to this journal file (default: ${JOURNAL_ENV})")
+    parser.add_argument("--metrics-port", type=int, default=os.environ.get(METRICS_PORT_ENV),
+                        help=f"serve Prometheus metrics on 127.0.0.1:PORT/metrics (default: ${METRICS_PORT_ENV})")
+    parser.add_argument("--metrics-file", default=os.environ.get(METRICS_FILE_ENV),
+                        help=f"write Prometheus metrics to this textfile-collector file (default: ${METRICS_FILE_ENV})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("read", help="read a card (ISO)").set_defaults(func=cmd_read)
+    sub.add_parser("raw-read", help="read a card as raw bytes (hex)").set_defaults(func=cmd_raw_read)
+
+    p = sub.add_parser("write", help="write text tracks (ISO)")
+    _track_options(p, "text")
+    p.add_argument("--verify", action="store_true", help="read the card back and compare")
+    p.add_argument("--no-validate", action="store_true", help="send the tracks without checking them first")
+    p.set_defaults(func=cmd_write)
+
+    p = sub.add_parser("raw-write", help="write raw tracks given as hex")
+    _track_options(p, "hex")
+    p.add_argument("--verify", action="store_true", help="read the card back and compare")
+    p.set_defaults(func=cmd_raw_write)
+
+    p = sub.add_parser("erase", help="erase tracks (default: all)")
+    p.add_argument("tracks", nargs="*", help="track numbers, e.g. 1 2 or 1+2")
+    p.set_defaults(func=cmd_erase)
+
+    p = sub.add_parser("config", help="change and show device settings")
+    _setting_options(p)
+    p.set_defaults(func=cmd_config)
+
+    p = sub.add_parser("profile", help="list, show, save or delete configuration profiles")
+    p.add_argument("action", choices=("list", "show", "save", "delete"))
+    p.add_argument("name", nargs="?")
+    _setting_options(p)
+    p.set_defaults(func=cmd_profile, offline=True)
+
+    p = sub.add_parser("apply-profile", help="apply a saved profile, sending only what differs")
+    p.add_argument("name")
+    p.add_argument("--no-rollback", action="store_true", help="keep completed steps if a later step fails")
+    p.set_defaults(func=cmd_apply_profile)
+
+    sub.add_parser("info", help="communication test, model and firmware").set_defaults(func=cmd_info)
+
+    p = sub.add_parser("batch", help="encode every record in a CSV/JSONL job file")
+    p.add_argument("job", help="job file (.csv or .jsonl)")
+    p.add_argument("results", help="results CSV")
+    p.add_argument("--format", choices=("csv", "jsonl"))
+    p.add_argument("--columns", help="track columns, e.g. track1,track2,track3")
+    p.add_argument("--start", type=int, default=0, help="skip this many records (resume)")
+    p.add_argument("--verify", action="store_true", help="read every card back and compare")
+    p.add_argument("--no-validate", action="store_true", help="do not validate records before encoding")
+    p.add_argument("--luhn", action="store_true", help="also reject card numbers that fail the Luhn check")
+    p.add_argument("--wait-card", action="store_true",
+                   help="poll the card sensor and start each record when a new card is inserted")
+    p.add_argument("--reconnect", action="store_true",
+                   help="if the device is unplugged, wait for it, restore its settings and continue")
+    p.add_argument("-q", "--quiet", action="store_true", help="no per-record progress on stderr")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("validate", help="check a job file without a device")
+    p.add_argument("job", help="job file (.csv or .jsonl)")
+    p.add_argument("--format", choices=("csv", "jsonl"))
+    p.add_argument("--columns", help="track columns, e.g. track1,track2,track3")
+    p.add_argument("--start", type=int, default=0, help="skip this many records")
+    p.add_argument("--luhn", action="store_true", help="also reject card numbers that fail the Luhn check")
+    p.set_defaults(func=cmd_validate, offline=True)
+
+    p = sub.add_parser("discover", help="probe all serial ports and list the MSRE206 that answer")
+    p.set_defaults(func=cmd_discover, offline=True)
+    return parser
+
+
+class _TimeoutDevice(Device):
+    """Device där alla kommandon får samma tidsgräns (--timeout)."""
+
+    def __init__(self, *args, timeout, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeout = timeout
+
+    def execute(self, command):
+        return super().execute(protocol.Command(command.name, command.payload, self.timeout,
+                                                command.expect_response))
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "offline", False):
+        try:
+            return args.func(None, args)
+        except (ValueError, OSError) as e:
+            print(f"msre206: {e}", file=sys.stderr)
+            return EXIT_USAGE
+    if not args.port:
+        parser.error(f"no serial port given (use --port or ${PORT_ENV})")
+    journal = None
+    metrics = exporters = None
+    try:
+        if args.journal:
+            from .journal import Journal
+            journal = Journal(args.journal)
+        if args.metrics_port is not None or args.metrics_file:
+            from .metrics import Metrics, MetricsServer, TextfileWriter
+            metrics, exporters = Metrics(), []
+            if args.metrics_port is not None:
+                exporters.append(MetricsServer(metrics, int(args.metrics_port)).start())
+            if args.metrics_file:
+                exporters.append(TextfileWriter(metrics, args.metrics_file).start())
+        if args.timeout:
+            device = _TimeoutDevice(args.port, args.baudrate, journal=journal, metrics=metrics,
+                                    timeout=args.timeout)
+        else:
+            device = Device(args.port, args.baudrate, journal=journal, metrics=metrics)
+        with device:
+            return args.func(device, args)
+    except ValueError as e:
+        print(f"msre206: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    except (DeviceError, protocol.ProtocolError, OSError) as e:
+        print(f"msre206: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    except KeyboardInterrupt:
+        return EXIT_FAILED
+    finally:
+        for exporter in exporters or ():
+            exporter.stop()
+        if journal:
+            journal.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+"""Session mot en MSRE206 över pyserial."""
+import time
+
+import serial
+
+from . import protocol
+from .metrics import OUTCOME_CANCELLED, OUTCOME_DISCONNECTED, OUTCOME_ERROR, OUTCOME_OK, OUTCOME_TIMEOUT
+from .state import DeviceState
+
+# Så länge får det vara tyst mellan två byte i samma svar (ca 50 tecken vid 9600 baud)
+INTER_BYTE_TIMEOUT = 0.05
+# Så länge får synkroniseringen efter ett uteblivet eller trasigt svar vänta på ESC y
+RESYNC_TIMEOUT = 1.0
+
+# Fel från själva porten; reset_input_buffer (tcflush) kastar termios.error, som inte är ett OSError
+try:
+    import termios
+    PORT_ERRORS = (serial.SerialException, OSError, termios.error)
+except ImportError:
+    PORT_ERRORS = (serial.SerialException, OSError)
+
+
+class DeviceError(Exception):
+    """Fel vid kommunikation med enheten."""
+
+
+class NotConnectedError(DeviceError):
+    """Porten är inte öppen."""
+
+
+class DeviceCancelled(DeviceError):
+    """Kommandot avbröts med cancel() innan svaret kom."""
+
+
+class DeviceDisconnected(DeviceError):
+    """Porten slutade fungera mitt i ett kommando, t.ex. för att enheten kopplades ur."""
+
+
+class DeviceTimeout(DeviceError):
+    """Inget svar inom tidsgränsen."""
+
+    def __init__(self, command):
+        super().__init__(f"Timeout: No response for {command.name}")
+        self.command = command
+
+
+class Device:
+    """En öppen anslutning till en MSRE206.
+
+    execute() skickar ett färdigbyggt protocol.Command och returnerar råsvaret.
+    Övriga metoder bygger kommandot, skickar det och tolkar svaret. Med en
+    journal.Journal loggas alla byte som skickas och tas emot.
+
+    state (state.DeviceState) håller inställningarna för den här anslutningen:
+    get_*-metoderna svarar ur den när värdet är känt (refresh=True frågar ändå) och
+    set_*-metoderna hoppar över värden som redan gäller. Den töms vid open, close
+    och reset.
+
+    Går porten sönder under ett kommando kastas DeviceDisconnected och disconnected
+    blir True tills porten öppnas igen (se supervisor.ConnectionSupervisor). Med en
+    metrics.Metrics registreras utfall och svarstid för varje kommando.
+    """
+
+    def __init__(self, port=None, baudrate=9600, ser=None, journal=None, metrics=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.ser = ser
+        self.journal = journal
+        self.metrics = metrics
+        self.state = DeviceState()
+        self.disconnected = False
+        self._cancelled = False
+        # Ett svar på ett tidigare kommando kan fortfarande vara på väg (timeout, avbrott, halv ram)
+        self._stale = False
+
+    def open(self):
+        if self.ser is None or not self.ser.is_open:
+            self.ser = serial.Serial(port=self.port, baudrate=self.baudrate, timeout=1)
+            self.state.clear()
+        self.disconnected = False
+        self._stale = False
+        return self
+
+    def close(self):
+        if self.ser and self.ser.is_open:
+            try:
+                self.ser.close()
+            except PORT_ERRORS:
+                # Porten kan redan vara borta
+                pass
+        self.state.clear()
+
+    def cancel(self):
+        """Avbryter en blockerande läsning; får anropas från en annan tråd."""
+        self._cancelled = True
+        if self.is_open and hasattr(self.ser, "cancel_read"):
+            self.ser.cancel_read()
+
+    @property
+    def is_open(self):
+        return bool(self.ser and self.ser.is_open)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, command):
+        """Skickar command och returnerar svaret (None om inget svar förväntas)."""
+        metrics = self.metrics
+        if metrics is None:
+            return self._execute(command)
+        outcome, response = OUTCOME_ERROR, None
+        started = time.perf_counter()
+        try:
+            response = self._execute(command)
+            outcome = OUTCOME_OK
+            return response
+        except DeviceTimeout:
+            outcome = OUTCOME_TIMEOUT
+            raise
+        except DeviceCancelled:
+            outcome = OUTCOME_CANCELLED
+            raise
+        except DeviceDisconnected:
+            outcome = OUTCOME_DISCONNECTED
+            raise
+        finally:
+            metrics.observe(self.port, command, outcome, time.perf_counter() - started, response)
+
+    def _execute(self, command):
+        if not self.is_open:
+            raise NotConnectedError("Not connected to the device")
+        self._cancelled = False
+        self.state.forget(command)
+        journal = self.journal
+        cid = journal.begin(command) if journal else 0
+        try:
+            if self._stale and command.expect_response:
+                self._resync()
+            # Det som ligger kvar i bufferten hör inte till det här kommandot
+            self.ser.reset_input_buffer()
+            self.ser.write(command.payload)
+            if not command.expect_response:
+                return None
+            parser = self._receive(command, cid)
+            response = parser.frame
+            if self._cancelled or not parser.complete:
+                # Resten av svaret (eller hela) kan komma senare; det får inte hamna i nästa svar
+                self.ser.reset_input_buffer()
+                self._stale = True
+            if self._cancelled:
+                if journal:
+                    journal.note(cid, "cancelled")
+                raise DeviceCancelled(f"{command.name} cancelled")
+            if not response:
+                if journal:
+                    journal.note(cid, "timeout")
+                raise DeviceTimeout(command)
+            if not parser.complete:
+                if journal:
+                    journal.note(cid, "incomplete")
+                raise protocol.ProtocolError(response, "Incomplete response from device")
+            return response
+        except PORT_ERRORS as e:
+            # Ett fel på själva porten betyder att enheten försvunnit, inte att kommandot misslyckats
+            self.disconnected = True
+            if journal:
+                journal.note(cid, "disconnected")
+            raise DeviceDisconnected(f"{command.name}: {e}") from e
+        finally:
+            if journal:
+                journal.flush()
+
+    def _resync(self):
+        """Väntar ut ett sent svar på ett tidigare kommando innan nästa kommando skickas.
+
+        Kommunikationstestet ESC e skickas och allt före dess ESC y slängs, så ett svar
+        som kommer efter en timeout tas aldrig för svaret på nästa kommando. Svarar
+        enheten inte kastas DeviceTimeout och nästa kommando försöker igen.
+        """
+        command = protocol.build_comm_test()
+        journal = self.journal
+        cid = journal.begin(command) if journal else 0
+        self.ser.reset_input_buffer()
+        self.ser.write(command.payload)
+        deadline = time.monotonic() + RESYNC_TIMEOUT
+        data = b""
+        while not self._cancelled:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.ser.timeout = remaining
+            chunk = self.ser.read(max(1, self.ser.in_waiting))
+            if journal and chunk:
+                journal.received(cid, chunk)
+            data += chunk
+            if protocol.COMM_TEST_OK in data:
+                self.ser.reset_input_buffer()
+                self._stale = False
+                return
+        if self._cancelled:
+            raise DeviceCancelled(f"{command.name} cancelled")
+        if journal:
+            journal.note(cid, "timeout")
+        raise DeviceTimeout(command)
+
+    def _receive(self, command, cid=0):
+        """Blockerar på porten tills svaret på command är komplett eller tiden gått ut.
+
+        FrameParser vet hur svaret ser ut, så vi läser bara så många byte som fattas
+        och returnerar direkt när ramen är hel. Blir det tyst i INTER_BYTE_TIMEOUT mitt
+        i ett svar returneras det som kommit, så att trasiga svar inte väntar ut timeout;
+        för svar utan känd längd (firmware) är tystnaden just det som avslutar ramen.
+        Returnerar FrameParser; ramen är hel bara om parser.complete är satt.
+        """
+        journal = self.journal
+        deadline = time.monotonic() + command.timeout
+        parser = protocol.FrameParser(command.opcode)
+        # Första byten får ta hela tidsgränsen (t.ex. väntan på kortdragning)
+        self.ser.timeout = command.timeout
+        chunk = self.ser.read(1)
+        parser.feed(chunk)
+        if journal and chunk:
+            journal.received(cid, chunk)
+        self.ser.timeout = INTER_BYTE_TIMEOUT
+        while chunk and not parser.complete and not self._cancelled:
+            if time.monotonic() >= deadline:
+                break
+            chunk = self.ser.read(max(parser.needed(), self.ser.in_waiting))
+            parser.feed(chunk)
+            if journal and chunk:
+                journal.received(cid, chunk)
+        if not chunk:
+            parser.finish()
+        return parser
+
+    # --- Kortoperationer ---
+
+    def reset(self):
+        self.execute(protocol.build_reset())
+
+    def read(self):
+        return protocol.decode_read(self.execute(protocol.build_read()))
+
+    def write(self, tracks):
+        """Skriver {spår: text} och returnerar statusbyten."""
+        return protocol.decode_status(self.execute(protocol.build_write(tracks)))
+
+    def write_verified(self, tracks, raw=False):
+        """Skriver och läser direkt tillbaka i samma jobb; returnerar protocol.VerifyResult.
+
+        Läskommandot skickas så fort skrivningen kvitterats, så enheten är redo för
+        nästa dragning utan extra väntan. raw=True använder ESC n / ESC m.
+        """
+        status = self.write_raw(tracks) if raw else self.write(tracks)
+        result = protocol.VerifyResult(status)
+        if status != protocol.STATUS_OK:
+            return result
+        result.read = self.read_raw() if raw else self.read()
+        result.mismatches = protocol.compare_tracks(tracks, result.read)
+        return result
+
+    def erase(self, tracks):
+        return protocol.decode_status(self.execute(protocol.build_erase(tracks)))
+
+    def read_raw(self):
+        return protocol.decode_raw_read(self.execute(protocol.build_read_raw()))
+
+    def write_raw(self, tracks):
+        """Skriver {spår: bytes} och returnerar statusbyten."""
+        return protocol.decode_status(self.execute(protocol.build_write_raw(tracks)))
+
+    def led(self, code):
+        self.execute(protocol.build_led(code))
+
+    # --- Tester och information ---
+
+    def comm_test(self):
+        return protocol.decode_comm_test(self.execute(protocol.build_comm_test()))
+
+    def sensor_test(self):
+        return protocol.decode_ack(self.execute(protocol.build_sensor_test()))
+
+    def ram_test(self):
+        return protocol.decode_ack(self.execute(protocol.build_ram_test()))
+
+    def get_model(self, refresh=False):
+        if refresh or self.state.model is None:
+            self.state.model = protocol.decode_model(self.execute(protocol.build_get_model()))
+        return self.state.model
+
+    def get_firmware(self, refresh=False):
+        if refresh or self.state.firmware is None:
+            self.state.firmware = protocol.decode_firmware(self.execute(protocol.build_get_firmware()))
+        return self.state.firmware
+
+    def get_coercivity(self, refresh=False):
+        if refresh or self.state.coercivity is None:
+            self.state.coercivity = protocol.decode_coercivity(self.execute(protocol.build_get_coercivity()))
+        return self.state.coercivity
+
+    def load_state(self):
+        """Fyller state med allt som går att fråga enheten om; returnerar state."""
+        self.get_model(refresh=True)
+        self.get_firmware(refresh=True)
+        self.get_coercivity(refresh=True)
+        self.check_leading_zeros(refresh=True)
+        return self.state
+
+    def poll_sensor(self):
+        """Frågar sensorn en gång; True om ett kort finns i läsaren.
+
+        Uteblir svaret kastas DeviceTimeout; kommer det senare slängs det innan nästa
+        kommando skickas (se _resync), så det blandas inte ihop med nästa svar.
+        """
+        return protocol.decode_sensor(self.execute(protocol.build_sensor_poll()))
+
+    # --- Konfiguration ---
+
+    # set_*-metoderna returnerar kvittensen direkt (utan att skicka något) om värdet
+    # redan gäller, och sparar värdet i state när enheten kvitterat det
+
+    def set_leading_zeros(self, lz_13, lz_2):
+        if self.state.leading_zeros == (lz_13, lz_2):
+            return True
+        ack = protocol.decode_ack(self.execute(protocol.build_set_leading_zeros(lz_13, lz_2)))
+        if ack:
+            self.state.leading_zeros = (lz_13, lz_2)
+        return ack
+
+    def check_leading_zeros(self, refresh=False):
+        if refresh or self.state.leading_zeros is None:
+            self.state.leading_zeros = protocol.decode_leading_zeros(
+                self.execute(protocol.build_check_leading_zeros()))
+        return self.state.leading_zeros
+
+    def set_bpi(self, track, bpi):
+        bpi = int(bpi)
+        if self.state.bpi.get(track) == bpi:
+            return True
+        ack = protocol.decode_ack(self.execute(protocol.build_set_bpi(track, bpi)))
+        if ack:
+            self.state.bpi[track] = bpi
+        return ack
+
+    def set_bpc(self, bpc1, bpc2, bpc3):
+        """Returnerar de BPC som enheten kvitterade, eller False om den avvisade dem."""
+        if self.state.bpc == (bpc1, bpc2, bpc3):
+            return self.state.bpc
+        acked = protocol.decode_bpc(self.execute(protocol.build_set_bpc(bpc1, bpc2, bpc3)))
+        if acked:
+            self.state.bpc = acked
+        return acked
+
+    def set_coercivity(self, high):
+        value = protocol.COERCIVITY_HIGH if high else protocol.COERCIVITY_LOW
+        if self.state.coercivity == value:
+            return True
+        ack = protocol.decode_ack(self.execute(protocol.build_set_coercivity(high)))
+        if ack:
+            self.state.coercivity = value
+        return ack
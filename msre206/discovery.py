@@ -0,0 +1,94 @@
+"""Hittar anslutna MSRE206 genom att fråga alla serieportar samtidigt.
+
+Varje kandidatport öppnas i en egen tråd och får kommunikationstestet ESC e med en
+kort tidsgräns; bara portar som svarar ESC y räknas, och för dem hämtas modell och
+firmware. Hela sökningen tar därför ungefär en tidsgräns oavsett antal portar:
+
+    for found in discover():
+        print(found.port, found.model, found.firmware)
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+import serial
+import serial.tools.list_ports
+
+from . import protocol
+from .device import Device, DeviceError
+
+# Tidsgräns för kommunikationstestet på varje port; en MSRE206 svarar inom millisekunder
+PROBE_TIMEOUT = 0.3
+
+
+@dataclass
+class FoundDevice:
+    port: str
+    model: str
+    firmware: str
+    description: str = ""
+
+
+def candidate_ports():
+    """{port: beskrivning} för alla serieportar som operativsystemet känner till."""
+    return {port.device: port.description for port in serial.tools.list_ports.comports()}
+
+
+def probe_port(port, baudrate=9600, timeout=PROBE_TIMEOUT, description=""):
+    """FoundDevice om en MSRE206 svarar på port, annars None.
+
+    Porten öppnas exklusivt, så en port som ett annat program redan använder lämnas
+    i fred. Modell och firmware frågas bara efter ett lyckat kommunikationstest.
+    """
+    try:
+        ser = serial.Serial(port=port, baudrate=baudrate, timeout=timeout, exclusive=True)
+    except (serial.SerialException, OSError, ValueError):
+        return None
+    device = Device(port, baudrate, ser=ser)
+    try:
+        # Skräp från en tidigare session får inte tas för ett svar
+        ser.reset_input_buffer()
+        probe = protocol.build_comm_test()
+        if not protocol.decode_comm_test(device.execute(protocol.Command(probe.name, probe.payload, timeout))):
+            return None
+        return FoundDevice(port, device.get_model(), device.get_firmware(), description)
+    except (DeviceError, protocol.ProtocolError, serial.SerialException, OSError):
+        return None
+    finally:
+        device.close()
+
+
+def discover(ports=None, baudrate=9600, timeout=PROBE_TIMEOUT, exclude=()):
+    """Provar alla portar parallellt och returnerar en FoundDevice per MSRE206.
+
+    ports är en lista med portnamn eller {port: beskrivning} (standard: alla portar);
+    portar i exclude, t.ex. en som redan är ansluten, provas inte. Resultatet har
+    samma ordning som ports.
+    """
+    if ports is None:
+        ports = candidate_ports()
+    if not isinstance(ports, dict):
+        ports = {port: "" for port in ports}
+    ports = {port: description for port, description in ports.items() if port not in exclude}
+    if not ports:
+        return []
+    with ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix="msre206-probe") as executor:
+        futures = [executor.submit(probe_port, port, baudrate, timeout, description)
+                   for port, description in ports.items()]
+        return [found for found in (future.result() for future in futures) if found]
+
+
+def discover_async(*args, **kwargs):
+    """Som discover men i en bakgrundstråd; returnerar en Future med listan."""
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(discover(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="msre206-discovery", daemon=True).start()
+    return future
@@ -0,0 +1,387 @@
+"""Binär journal över all trafik på serieporten, med uppspelning.
+
+Device och AsyncDevice tar ett valfritt Journal och skriver då varje skickat
+kommando och varje mottagen bit av svaret, med monoton tid och ett korrelations-id
+per kommando. Filen är kompakt och läses tillbaka med read_records()/exchanges():
+
+    python -m msre206.journal dump session.msrj
+    python -m msre206.journal parse session.msrj
+    python -m msre206.journal serve session.msrj --link /tmp/msre206-replay
+
+parse kör de inspelade svaren genom FrameParser och avkodarna och rapporterar fel
+och tid per opkod. serve spelar upp sessionen på en pty som en falsk port, så
+samma kommandosekvens ger samma svar som i fält.
+
+Filformat: rubrik MAGIC, version (1 byte) och starttid (float64, epoch). Därefter
+poster med huvud <kind u8, id u32, tid ns u64, längd u32> följt av längd byte data.
+Varje gång filen öppnas för skrivning inleds en ny session med en session-post.
+"""
+import argparse
+import itertools
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import tty
+from dataclasses import dataclass, field
+
+from . import protocol
+
+MAGIC = b"MSRJ"
+VERSION = 1
+_HEADER = struct.Struct("<4sBd")
+_RECORD = struct.Struct("<BIQI")
+
+# Posttyper
+KIND_COMMAND = 1   # data = kommandots namn
+KIND_SENT = 2      # data = byte som skrevs till porten
+KIND_RECEIVED = 3  # data = byte som lästes från porten
+KIND_NOTE = 4      # data = text, t.ex. "timeout" eller "cancelled"
+KIND_SESSION = 5   # data = starttid (float64, epoch); id och tid börjar om efter denna
+KIND_NAMES = {KIND_COMMAND: "command", KIND_SENT: "sent", KIND_RECEIVED: "received",
+              KIND_NOTE: "note", KIND_SESSION: "session"}
+_SESSION = struct.Struct("<d")
+
+# Avkodare per opkod för parse
+DECODERS = {
+    protocol.OP_READ: protocol.decode_read,
+    protocol.OP_READ_RAW: protocol.decode_raw_read,
+    protocol.OP_WRITE: protocol.decode_status,
+    protocol.OP_WRITE_RAW: protocol.decode_status,
+    protocol.OP_ERASE: protocol.decode_status,
+    protocol.OP_COMM_TEST: protocol.decode_comm_test,
+    protocol.OP_SENSOR_TEST: protocol.decode_ack,
+    protocol.OP_RAM_TEST: protocol.decode_ack,
+    protocol.OP_GET_MODEL: protocol.decode_model,
+    protocol.OP_GET_FIRMWARE: protocol.decode_firmware,
+    protocol.OP_GET_COERCIVITY: protocol.decode_coercivity,
+    protocol.OP_SET_LEADING_ZEROS: protocol.decode_ack,
+    protocol.OP_CHECK_LEADING_ZEROS: protocol.decode_leading_zeros,
+    protocol.OP_SET_BPI: protocol.decode_ack,
+    protocol.OP_SET_BPC: protocol.decode_bpc,
+    protocol.OP_SET_HICO: protocol.decode_ack,
+    protocol.OP_SET_LOCO: protocol.decode_ack,
+    protocol.OP_SENSOR: protocol.decode_sensor,
+}
+
+
+class JournalError(Exception):
+    """Filen är inte en journal eller är trasig."""
+
+
+class Journal:
+    """Skriver trafik till en binär fil. Trådsäker, så flera enheter kan dela en journal."""
+
+    def __init__(self, path):
+        self.path = path
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._start = time.monotonic_ns()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab")
+        if new:
+            self._file.write(_HEADER.pack(MAGIC, VERSION, time.time()))
+        self.record(KIND_SESSION, 0, _SESSION.pack(time.time()))
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, kind, cid, data):
+        t = time.monotonic_ns() - self._start
+        with self._lock:
+            # Enhetens tråd kan hinna skriva efter att journalen stängts vid avslut
+            if self._file.closed:
+                return
+            self._file.write(_RECORD.pack(kind, cid, t, len(data)))
+            self._file.write(data)
+
+    def begin(self, command):
+        """Loggar kommandot och dess byte; returnerar korrelations-id för svaret."""
+        cid = next(self._ids)
+        self.record(KIND_COMMAND, cid, command.name.encode())
+        self.record(KIND_SENT, cid, command.payload)
+        return cid
+
+    def received(self, cid, data):
+        self.record(KIND_RECEIVED, cid, bytes(data))
+
+    def note(self, cid, text):
+        self.record(KIND_NOTE, cid, text.encode())
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+
+@dataclass
+class JournalRecord:
+    kind: int
+    cid: int
+    time: float  # sekunder sedan journalen öppnades
+    data: bytes
+
+
+@dataclass
+class Exchange:
+    """Ett kommando och allt som kom tillbaka på det."""
+    cid: int
+    session: int = 0
+    name: str = ""
+    sent: bytes = b""
+    received: bytes = b""
+    sent_at: float = 0.0
+    # (tid, data) för varje mottagen bit, för uppspelning med ursprunglig takt
+    chunks: list = field(default_factory=list)
+    notes: list = field(default_factory=list)
+
+    @property
+    def opcode(self):
+        return self.sent[1] if len(self.sent) > 1 else None
+
+    @property
+    def latency(self):
+        return self.chunks[-1][0] - self.sent_at if self.chunks else None
+
+
+def read_records(path):
+    """Ger JournalRecord för varje post; en avkapad sista post ignoreras."""
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise JournalError(f"{path}: file too short")
+        magic, version, _started = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise JournalError(f"{path}: not a version {VERSION} journal")
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            kind, cid, t, length = _RECORD.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield JournalRecord(kind, cid, t / 1e9, data)
+
+
+def exchanges(path):
+    """Grupperar posterna per session och korrelations-id, i den ordning kommandona skickades."""
+    result = {}
+    session = 0
+    for rec in read_records(path):
+        if rec.kind == KIND_SESSION:
+            session += 1
+            continue
+        ex = result.setdefault((session, rec.cid), Exchange(rec.cid, session))
+        if rec.kind == KIND_COMMAND:
+            ex.name = rec.data.decode(errors="replace")
+        elif rec.kind == KIND_SENT:
+            ex.sent += rec.data
+            ex.sent_at = rec.time
+        elif rec.kind == KIND_RECEIVED:
+            ex.received += rec.data
+            ex.chunks.append((rec.time, rec.data))
+        elif rec.kind == KIND_NOTE:
+            ex.notes.append(rec.data.decode(errors="replace"))
+    return list(result.values())
+
+
+def parse_exchange(exchange):
+    """Kör svaret genom FrameParser och avkodaren; returnerar (avkodat värde, fel eller None)."""
+    parser = protocol.FrameParser(exchange.opcode)
+    parser.feed(exchange.received)
+    # Inspelningen av svaret tar slut där linjen blev tyst
+    parser.finish()
+    if not parser.complete:
+        return None, "incomplete frame"
+    if parser.remainder:
+        return None, f"{len(parser.remainder)} trailing bytes"
+    decode = DECODERS.get(exchange.opcode)
+    if decode is None:
+        return None, None
+    try:
+        return decode(parser.frame), None
+    except protocol.ProtocolError as e:
+        return None, f"{e}: {e.response.hex()}"
+
+
+# --- Uppspelning som falsk port ---
+
+class ReplayPort:
+    """Spelar upp en journal på en pty (endast POSIX).
+
+    När ett kommando kommer in skickas svaret från nästa inspelade utbyte med samma
+    byte. Med timing=True skickas svaret med samma fördröjningar som i inspelningen.
+    """
+
+    def __init__(self, exchanges, timing=False):
+        self.exchanges = [ex for ex in exchanges if ex.sent]
+        self.timing = timing
+        self.port = None
+        self.unmatched = []
+        self._next = 0
+        self._master = self._slave = None
+        self._stop_r = self._stop_w = None
+        self._thread = None
+
+    def start(self):
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="msre206-replay", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        if self._thread is None:
+            return
+        os.write(self._stop_w, b"x")
+        self._thread.join()
+        for fd in (self._master, self._slave, self._stop_r, self._stop_w):
+            os.close(fd)
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        buffer = b""
+        while True:
+            ready, _, _ = select.select([self._master, self._stop_r], [], [])
+            if self._stop_r in ready:
+                return
+            try:
+                buffer += os.read(self._master, 4096)
+            except OSError:
+                return
+            while buffer:
+                match = self._match(buffer)
+                if match is None:
+                    # Okänt kommando; vänta på mer data om det kan vara början på ett
+                    if any(ex.sent.startswith(buffer) for ex in self.exchanges[self._next:]):
+                        break
+                    self.unmatched.append(buffer)
+                    buffer = b""
+                    break
+                buffer = buffer[len(match.sent):]
+                self._reply(match)
+
+    def _match(self, buffer):
+        for i in range(self._next, len(self.exchanges)):
+            ex = self.exchanges[i]
+            if buffer.startswith(ex.sent):
+                self._next = i + 1
+                return ex
+        return None
+
+    def _reply(self, exchange):
+        previous = exchange.sent_at
+        for t, data in exchange.chunks:
+            if self.timing:
+                time.sleep(max(0.0, t - previous))
+                previous = t
+            os.write(self._master, data)
+
+
+# --- Kommandorad ---
+
+def _cmd_dump(args):
+    for rec in read_records(args.journal):
+        if rec.kind == KIND_SESSION:
+            started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(_SESSION.unpack(rec.data)[0]))
+            print(f"--- session started {started}")
+            continue
+        data = rec.data.decode(errors="replace") if rec.kind in (KIND_COMMAND, KIND_NOTE) else rec.data.hex(" ")
+        print(f"{rec.time:12.6f} #{rec.cid:<6} {KIND_NAMES.get(rec.kind, rec.kind):<9} {data}")
+
+
+def _cmd_parse(args):
+    """Avkodar alla svar och rapporterar fel samt tolkningstid per opkod."""
+    stats = {}
+    failures = 0
+    for ex in exchanges(args.journal):
+        if not ex.received:
+            if args.verbose:
+                print(f"#{ex.cid} {ex.name}: no response {' '.join(ex.notes)}")
+            continue
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            value, error = parse_exchange(ex)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        entry = stats.setdefault(ex.name or hex(ex.opcode or 0), {"count": 0, "errors": 0, "seconds": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += elapsed
+        if error:
+            entry["errors"] += 1
+            failures += 1
+            print(f"#{ex.cid} {ex.name}: {error} ({ex.received.hex(' ')})")
+        elif args.verbose:
+            print(f"#{ex.cid} {ex.name}: {value!r}")
+    print(f"{'Command':<22} {'Count':>6} {'Errors':>6} {'us/parse':>9}")
+    for name, entry in stats.items():
+        print(f"{name:<22} {entry['count']:>6} {entry['errors']:>6} {entry['seconds'] / entry['count'] * 1e6:>9.2f}")
+    return 1 if failures else 0
+
+
+def _cmd_serve(args):
+    replay = ReplayPort(exchanges(args.journal), timing=args.timing)
+    port = replay.start()
+    if args.link:
+        if os.path.islink(args.link):
+            os.unlink(args.link)
+        os.symlink(port, args.link)
+    print(f"Replaying {args.journal} on {args.link or port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        replay.stop()
+        if args.link and os.path.islink(args.link):
+            os.unlink(args.link)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="msre206.journal", description="Inspect and replay MSRE206 journals")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("dump", help="print every record")
+    p.add_argument("journal")
+    p.set_defaults(func=_cmd_dump)
+    p = sub.add_parser("parse", help="run recorded responses through the parsers")
+    p.add_argument("journal")
+    p.add_argument("--repeat", type=int, default=1, help="parse each response this many times for timing")
+    p.add_argument("-v", "--verbose", action="store_true", help="print every decoded response")
+    p.set_defaults(func=_cmd_parse)
+    p = sub.add_parser("serve", help="serve the recorded responses on a pseudo-terminal")
+    p.add_argument("journal")
+    p.add_argument("--timing", action="store_true", help="reproduce the recorded response delays")
+    p.add_argument("--link", help="create a symlink to the pty at this path")
+    p.set_defaults(func=_cmd_serve)
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args) or 0
+    except (OSError, JournalError) as e:
+        print(f"msre206.journal: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Räknare och latenshistogram per kommando och enhet, i Prometheus textformat.
+
+Device.execute och AsyncDevice.execute rapporterar varje kommando till en Metrics
+(om en sådan getts): utfall (ok, timeout, cancelled, disconnected, error), tid från
+skickat kommando till komplett svar, och statusbyten för skrivning och radering.
+Registreringen är ett par dict-uppslag under ett lås, så den märks inte bredvid
+seriekommunikationen.
+Värdena kan hämtas över HTTP eller skrivas till en fil för node_exporters
+textfile collector:
+
+    metrics = Metrics()
+    device = Device("/dev/ttyUSB0", metrics=metrics)
+    server = MetricsServer(metrics, 9206).start()      # http://127.0.0.1:9206/metrics
+    writer = TextfileWriter(metrics, "/var/lib/node_exporter/msre206.prom").start()
+"""
+import bisect
+import os
+import threading
+
+from . import protocol
+
+# Övre gränser (sekunder) för latenshistogrammet; kortdragningar hamnar i de övre
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Kommandon som svarar med en statusbyte som räknas per värde
+STATUS_OPCODES = frozenset((protocol.OP_WRITE, protocol.OP_WRITE_RAW, protocol.OP_ERASE))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_INTERVAL = 15.0
+
+OUTCOME_OK = "ok"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_CANCELLED = "cancelled"
+OUTCOME_DISCONNECTED = "disconnected"
+OUTCOME_ERROR = "error"
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_label(value)}"' for name, value in labels.items()) + "}"
+
+
+class Metrics:
+    """Samlar mätvärden från en eller flera Device; trådsäker."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._commands = {}  # (enhet, kommando, utfall) -> antal
+        self._latency = {}  # (enhet, kommando) -> [antal per hink..., +Inf, summa]
+        self._status = {}  # (enhet, kommando, status) -> antal
+
+    def observe(self, device, command, outcome, seconds, response=None):
+        """Registrerar ett kommando; anropas av Device.execute och AsyncDevice.execute."""
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        key = (device, command.name)
+        status = None
+        if outcome == OUTCOME_OK and command.opcode in STATUS_OPCODES and response and len(response) >= 2:
+            status = response[1]
+        with self._lock:
+            count_key = (device, command.name, outcome)
+            self._commands[count_key] = self._commands.get(count_key, 0) + 1
+            latency = self._latency.get(key)
+            if latency is None:
+                latency = self._latency[key] = [0] * (len(self.buckets) + 2)
+            latency[bucket] += 1
+            latency[-1] += seconds
+            if status is not None:
+                status_key = (device, command.name, status)
+                self._status[status_key] = self._status.get(status_key, 0) + 1
+
+    def render(self):
+        """Alla mätvärden i Prometheus textformat."""
+        with self._lock:
+            commands = sorted(self._commands.items())
+            latency = sorted((key, list(values)) for key, values in self._latency.items())
+            status = sorted(self._status.items())
+        lines = [
+            "# HELP msre206_commands_total Commands sent to the device, by outcome.",
+            "# TYPE msre206_commands_total counter",
+        ]
+        for (device, command, outcome), count in commands:
+            lines.append(f"msre206_commands_total{_labels(device=device, command=command, outcome=outcome)} {count}")
+        lines += [
+            "# HELP msre206_command_duration_seconds Time from sending a command to a complete response.",
+            "# TYPE msre206_command_duration_seconds histogram",
+        ]
+        bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+        for (device, command), values in latency:
+            cumulative = 0
+            for bound, count in zip(bounds, values):
+                cumulative += count
+                labels = _labels(device=device, command=command, le=bound)
+                lines.append(f"msre206_command_duration_seconds_bucket{labels} {cumulative}")
+            labels = _labels(device=device, command=command)
+            lines.append(f"msre206_command_duration_seconds_sum{labels} {values[-1]:.6f}")
+            lines.append(f"msre206_command_duration_seconds_count{labels} {cumulative}")
+        lines += [
+            "# HELP msre206_status_total Status bytes returned by write and erase commands.",
+            "# TYPE msre206_status_total counter",
+        ]
+        for (device, command, code), count in status:
+            lines.append(f"msre206_status_total{_labels(device=device, command=command, status=f'{code:#04x}')} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Skriver render() till path; filen byts atomärt så att den aldrig läses halvskriven."""
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+class MetricsServer:
+    """Serverar Metrics.render() på http://host:port/metrics i en bakgrundstråd.
+
+    Lyssnar bara på localhost om inget annat anges. port=0 väljer en ledig port,
+    som sedan finns i self.port.
+    """
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        # Laddas först här så att Device inte drar in http.server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="msre206-metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._thread = None
+
+
+class TextfileWriter:
+    """Skriver Metrics till en fil var interval:e sekund, och en sista gång vid stop()."""
+
+    def __init__(self, metrics, path, interval=DEFAULT_INTERVAL):
+        self.metrics = metrics
+        self.path = os.path.expanduser(path)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="msre206-metrics-file", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._write()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            self.metrics.write_textfile(self.path)
+        except OSError:
+            # Försök igen nästa gång; en saknad katalog ska inte stoppa kodningen
+            pass
@@ -0,0 +1,234 @@
+"""Flera MSRE206 samtidigt, med jobb som går till den enhet som är ledig."""
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+from . import protocol
+from .device import Device, DeviceDisconnected
+from .worker import DeviceWorker
+
+# Operationer som räknas som ett kort i genomströmningsrapporten
+CARD_OPERATIONS = ("read", "write", "erase", "read_raw", "write_raw")
+
+
+@dataclass
+class JobResult:
+    """Resultatet av ett jobb i poolen. value är det Device-metoden returnerade."""
+    job_id: int
+    device_id: str
+    operation: str
+    value: object = None
+    error: Exception = None
+    started: float = 0.0
+    finished: float = 0.0
+
+    @property
+    def duration(self):
+        return self.finished - self.started
+
+    @property
+    def ok(self):
+        if self.error is not None:
+            return False
+        if isinstance(self.value, (protocol.ReadResult, protocol.VerifyResult)):
+            return self.value.ok
+        if isinstance(self.value, int) and not isinstance(self.value, bool):
+            return self.value == protocol.STATUS_OK
+        return self.value is not False
+
+
+@dataclass
+class DeviceStats:
+    jobs: int = 0
+    cards: int = 0
+    errors: int = 0
+    busy_time: float = 0.0
+    # Enheten försvann och tar inte längre några jobb
+    disconnected: bool = False
+
+
+@dataclass
+class _Job:
+    job_id: int
+    operation: str
+    args: tuple
+    kwargs: dict
+    future: Future = field(default_factory=Future)
+
+
+class EncoderPool:
+    """Öppnar flera portar och fördelar jobb på de enheter som är lediga.
+
+    Varje enhet har en egen DeviceWorker och en utdelningstråd som hämtar nästa jobb
+    från en gemensam kö så fort enheten blivit klar med föregående. submit() tar namnet
+    på en Device-metod (t.ex. "write") och returnerar en Future med ett JobResult.
+    Kopplas en enhet ur slutar den ta jobb och jobbet den höll på med läggs tillbaka
+    i kön åt de andra; först när ingen enhet finns kvar misslyckas jobben.
+
+        with EncoderPool(["/dev/ttyUSB0", "/dev/ttyUSB1"]) as pool:
+            futures = [pool.submit("write", {1: t1, 2: t2}) for t1, t2 in records]
+            results = [f.result() for f in futures]
+            print(pool.format_report())
+    """
+
+    def __init__(self, ports, baudrate=9600, journal=None, metrics=None):
+        # ports kan vara en lista med portnamn eller {enhets-id: port}
+        if not isinstance(ports, dict):
+            ports = {port: port for port in ports}
+        self.ports = ports
+        self.baudrate = baudrate
+        # En gemensam journal.Journal för alla enheter (valfri)
+        self.journal = journal
+        # Gemensam metrics.Metrics; varje enhet får egna serier med porten som etikett
+        self.metrics = metrics
+        self.workers = {}
+        self.stats = {device_id: DeviceStats() for device_id in ports}
+        self._queue = queue.Queue()
+        self._threads = []
+        self._job_ids = itertools.count(1)
+        self._stats_lock = threading.Lock()
+        self._connected = 0
+        self._started = None
+        self._last_finished = None
+
+    def open(self):
+        """Öppnar alla portar; misslyckas någon stängs de som redan öppnats."""
+        try:
+            for device_id, port in self.ports.items():
+                worker = DeviceWorker(Device(port, self.baudrate, journal=self.journal, metrics=self.metrics), name=f"msre206-{device_id}")
+                self.workers[device_id] = worker
+                worker.submit(Device.open).result()
+        except Exception:
+            self.close()
+            raise
+        self._connected = len(self.workers)
+        for device_id, worker in self.workers.items():
+            thread = threading.Thread(target=self._dispatch, args=(device_id, worker),
+                                      name=f"msre206-dispatch-{device_id}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        for worker in self.workers.values():
+            worker.shutdown()
+        self.workers = {}
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, operation, *args, **kwargs):
+        """Köar Device.<operation>(*args, **kwargs) på första lediga enhet."""
+        if not hasattr(Device, operation):
+            raise ValueError(f"Unknown operation: {operation}")
+        job = _Job(next(self._job_ids), operation, args, kwargs)
+        self._queue.put(job)
+        return job.future
+
+    def read(self):
+        return self.submit("read")
+
+    def write(self, tracks):
+        return self.submit("write", tracks)
+
+    def erase(self, tracks):
+        return self.submit("erase", tracks)
+
+    def _dispatch(self, device_id, worker):
+        lost = None
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            # Ett jobb som lagts tillbaka efter en urkoppling är redan markerat som igång
+            if not job.future.running() and not job.future.set_running_or_notify_cancel():
+                continue
+            result = JobResult(job.job_id, device_id, job.operation, started=time.monotonic())
+            with self._stats_lock:
+                if self._started is None:
+                    self._started = result.started
+            if lost is not None:
+                # Ingen enhet kvar; den sista utdelningstråden underkänner resten av kön
+                result.error = lost
+            else:
+                try:
+                    method = getattr(Device, job.operation)
+                    result.value = worker.submit(method, *job.args, **job.kwargs).result()
+                except DeviceDisconnected as e:
+                    lost = e
+                    if self._device_lost(device_id):
+                        self._queue.put(job)
+                        return
+                    result.error = e
+                except Exception as e:
+                    result.error = e
+            result.finished = time.monotonic()
+            self._record(result)
+            job.future.set_result(result)
+
+    def _device_lost(self, device_id):
+        """Markerar enheten som borta; True om andra enheter finns kvar att ta jobben."""
+        with self._stats_lock:
+            self.stats[device_id].disconnected = True
+            self._connected -= 1
+            return self._connected > 0
+
+    def _record(self, result):
+        with self._stats_lock:
+            stats = self.stats[result.device_id]
+            stats.jobs += 1
+            stats.busy_time += result.duration
+            if not result.ok:
+                stats.errors += 1
+            elif result.operation in CARD_OPERATIONS:
+                stats.cards += 1
+            self._last_finished = result.finished
+
+    def report(self):
+        """Kort per minut för varje enhet och totalt, räknat från första jobbets start."""
+        with self._stats_lock:
+            if self._started is None:
+                elapsed = 0.0
+            else:
+                elapsed = (self._last_finished or time.monotonic()) - self._started
+            devices = {}
+            for device_id, stats in self.stats.items():
+                devices[device_id] = {
+                    "jobs": stats.jobs,
+                    "cards": stats.cards,
+                    "errors": stats.errors,
+                    "busy_seconds": round(stats.busy_time, 3),
+                    "disconnected": stats.disconnected,
+                    "cards_per_minute": round(stats.cards * 60 / elapsed, 2) if elapsed else 0.0,
+                }
+            total_cards = sum(d["cards"] for d in devices.values())
+            return {
+                "elapsed_seconds": round(elapsed, 3),
+                "devices": devices,
+                "total": {
+                    "jobs": sum(d["jobs"] for d in devices.values()),
+                    "cards": total_cards,
+                    "errors": sum(d["errors"] for d in devices.values()),
+                    "cards_per_minute": round(total_cards * 60 / elapsed, 2) if elapsed else 0.0,
+                },
+            }
+
+    def format_report(self):
+        report = self.report()
+        lines = [f"{'Device':<20} {'Cards':>6} {'Errors':>6} {'Cards/min':>10}"]
+        for device_id, d in report["devices"].items():
+            lines.append(f"{device_id:<20} {d['cards']:>6} {d['errors']:>6} {d['cards_per_minute']:>10}")
+        t = report["total"]
+        lines.append(f"{'Total':<20} {t['cards']:>6} {t['errors']:>6} {t['cards_per_minute']:>10}")
+        return "\n".join(lines)
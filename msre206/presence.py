@@ -0,0 +1,155 @@
+"""Kortnärvaro: avstudsad sensoravläsning med adaptivt pollintervall.
+
+PresenceDetector är ren logik: den matas med avläsningar och säger när ett kort
+satts i eller tagits ut. PresenceMonitor pollar i bakgrunden via enhetens
+DeviceWorker och anropar on_change, och wait_for_insert väntar på nästa kort i den
+tråd som redan äger enheten (t.ex. inne i en batchkörning):
+
+    summary = batch.run_batch(device, "jobs.csv", "results.csv",
+                              prompt=insert_prompt(device, stop))
+"""
+import threading
+import time
+from concurrent.futures import CancelledError
+
+from . import protocol
+from .device import Device, DeviceError, DeviceTimeout
+
+CARD_INSERTED = "inserted"
+CARD_REMOVED = "removed"
+# PresenceMonitor har slutat polla på grund av ett fel (se PresenceMonitor.error)
+MONITOR_STOPPED = "stopped"
+
+# Pollintervall i sekunder: snabbt när något händer, långsamt när allt är stilla
+FAST_INTERVAL = 0.05
+SLOW_INTERVAL = 0.5
+BACKOFF = 1.5
+# Antal lika avläsningar i rad innan ett nytt läge godtas
+DEBOUNCE = 2
+
+
+class PresenceDetector:
+    """Avstudsning och pollintervall för sensorn.
+
+    update() tar en avläsning (True/False, eller None om ingen avläsning gick att
+    göra) och returnerar CARD_INSERTED, CARD_REMOVED eller None. interval är hur
+    länge det är lämpligt att vänta till nästa avläsning.
+    """
+
+    def __init__(self, debounce=DEBOUNCE, fast_interval=FAST_INTERVAL, slow_interval=SLOW_INTERVAL,
+                 backoff=BACKOFF):
+        self.debounce = debounce
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self.backoff = backoff
+        self.state = None  # None tills första avstudsade avläsningen
+        self.interval = fast_interval
+        self._candidate = None
+        self._count = 0
+
+    def update(self, present):
+        if present is None:
+            return None
+        if present == self.state:
+            self._candidate = None
+            self._count = 0
+            self.interval = min(self.slow_interval, self.interval * self.backoff)
+            return None
+        if present == self._candidate:
+            self._count += 1
+        else:
+            self._candidate, self._count = present, 1
+        self.interval = self.fast_interval
+        if self._count < self.debounce:
+            return None
+        previous, self.state = self.state, present
+        self._candidate = None
+        self._count = 0
+        # Tom läsare vid start är inget uttag
+        if previous is None and not present:
+            return None
+        return CARD_INSERTED if present else CARD_REMOVED
+
+
+def wait_for_insert(device, detector=None, stop=None, timeout=None):
+    """Pollar device tills ett kort sätts i; True när det hänt, False vid stop/timeout.
+
+    Anropas i tråden som äger device. Med samma detector mellan anropen krävs att
+    föregående kort tagits ut innan nästa räknas, så samma kort skrivs inte två gånger.
+    """
+    detector = detector or PresenceDetector()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        if stop is not None and stop.is_set():
+            return False
+        try:
+            present = device.poll_sensor()
+        except DeviceTimeout:
+            present = None
+        if detector.update(present) == CARD_INSERTED:
+            return True
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        if stop is not None:
+            stop.wait(detector.interval)
+        else:
+            time.sleep(detector.interval)
+
+
+def insert_prompt(device, stop=None):
+    """prompt för batch.run_batch som startar varje post så fort nästa kort sitter i."""
+    detector = PresenceDetector()
+    return lambda index, record: wait_for_insert(device, detector, stop)
+
+
+class PresenceMonitor:
+    """Pollar sensorn i bakgrunden och anropar on_change(CARD_INSERTED/CARD_REMOVED).
+
+    Avläsningarna körs på enhetens DeviceWorker, så de blandas aldrig med andra
+    kommandon. Har workern redan jobb i kö hoppas avläsningen över, så övervakningen
+    aldrig fördröjer en läsning eller skrivning. Går avläsningen inte att göra (porten
+    försvann, workern stängs) slutar monitorn, sparar felet i error och anropar
+    on_change(MONITOR_STOPPED). on_change anropas från monitorns tråd.
+    """
+
+    def __init__(self, worker, on_change=None, detector=None):
+        self.worker = worker
+        self.on_change = on_change
+        self.detector = detector or PresenceDetector()
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="msre206-presence", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.detector.interval):
+            if self.worker.busy:
+                continue
+            try:
+                present = self.worker.submit(Device.poll_sensor).result()
+            except DeviceTimeout:
+                present = None
+            except (CancelledError, RuntimeError, DeviceError, protocol.ProtocolError, OSError) as e:
+                # Workern stängs eller porten försvann
+                self.error = e
+                if self.on_change and not self._stop.is_set():
+                    self.on_change(MONITOR_STOPPED)
+                return
+            event = self.detector.update(present)
+            if event and self.on_change:
+                self.on_change(event)
@@ -0,0 +1,227 @@
+"""Namngivna konfigurationsprofiler som sparas på disk och tillämpas som en helhet.
+
+En profil anger koercivitet, ledande nollor, BPI per spår och BPC; det som saknas
+lämnas orört. apply_profile jämför med enhetens kända läge (device.state), skickar
+bara de kommandon som behövs, kontrollerar varje kvittens och återställer de steg
+som redan gjorts om något steg misslyckas:
+
+    profile = load_profile("loco-loyalty")
+    result = apply_profile(device, profile)
+    if not result.ok:
+        print(result.error, result.not_restored)
+"""
+import json
+import os
+import re
+from dataclasses import dataclass, field
+
+from . import protocol
+from .device import DeviceError
+
+PROFILE_DIR = "~/.msre206/profiles"
+PROFILE_SUFFIX = ".json"
+# Profilnamnet blir filnamnet
+NAME_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]*")
+
+
+@dataclass
+class Profile:
+    """None (eller saknat spår i bpi) betyder att inställningen inte ingår i profilen."""
+    name: str
+    coercivity: str = None
+    leading_zeros: tuple = None
+    bpi: dict = field(default_factory=dict)
+    bpc: tuple = None
+
+    def to_dict(self):
+        data = {"name": self.name}
+        if self.coercivity is not None:
+            data["coercivity"] = self.coercivity
+        if self.leading_zeros is not None:
+            data["leading_zeros"] = list(self.leading_zeros)
+        if self.bpi:
+            data["bpi"] = {str(track): bpi for track, bpi in sorted(self.bpi.items())}
+        if self.bpc is not None:
+            data["bpc"] = list(self.bpc)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Bygger en profil och kontrollerar värdena; ValueError vid ogiltig profil."""
+        profile = cls(
+            name=data["name"],
+            coercivity=data.get("coercivity"),
+            leading_zeros=tuple(data["leading_zeros"]) if data.get("leading_zeros") is not None else None,
+            bpi={int(track): int(bpi) for track, bpi in data.get("bpi", {}).items()},
+            bpc=tuple(data["bpc"]) if data.get("bpc") is not None else None,
+        )
+        profile.validate()
+        return profile
+
+    @classmethod
+    def from_state(cls, name, state):
+        """Profil med de inställningar som är kända i state (state.DeviceState)."""
+        return cls(name, state.coercivity, state.leading_zeros, dict(state.bpi), state.bpc)
+
+    def validate(self):
+        if not NAME_PATTERN.fullmatch(self.name or ""):
+            raise ValueError(f"Invalid profile name: {self.name!r}")
+        if self.coercivity not in (None, protocol.COERCIVITY_HIGH, protocol.COERCIVITY_LOW):
+            raise ValueError(f"Invalid coercivity: {self.coercivity}")
+        if self.leading_zeros is not None:
+            protocol.build_set_leading_zeros(*self.leading_zeros)
+        for track, bpi in self.bpi.items():
+            if track not in protocol.TRACKS or bpi not in protocol.BPI_VALUES:
+                raise ValueError(f"Invalid BPI for track {track}: {bpi}")
+        if self.bpc is not None:
+            protocol.build_set_bpc(*self.bpc)
+
+
+def _profile_path(name, directory):
+    if not NAME_PATTERN.fullmatch(name or ""):
+        raise ValueError(f"Invalid profile name: {name!r}")
+    return os.path.join(os.path.expanduser(directory), name + PROFILE_SUFFIX)
+
+
+def list_profiles(directory=PROFILE_DIR):
+    directory = os.path.expanduser(directory)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(entry[:-len(PROFILE_SUFFIX)] for entry in os.listdir(directory)
+                  if entry.endswith(PROFILE_SUFFIX))
+
+
+def load_profile(name, directory=PROFILE_DIR):
+    with open(_profile_path(name, directory), encoding="utf-8") as f:
+        return Profile.from_dict(json.load(f))
+
+
+def save_profile(profile, directory=PROFILE_DIR):
+    """Sparar profilen (skriver över en med samma namn) och returnerar sökvägen."""
+    profile.validate()
+    path = _profile_path(profile.name, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Skriv till en temporär fil först så att en avbruten sparning inte förstör profilen
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(profile.to_dict(), f, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
+    return path
+
+
+def delete_profile(name, directory=PROFILE_DIR):
+    os.remove(_profile_path(name, directory))
+
+
+# --- Tillämpning ---
+
+@dataclass
+class Step:
+    """En inställning som ska ändras; old är None om det tidigare värdet inte är känt."""
+    setting: str
+    new: object
+    old: object = None
+
+    def apply(self, device, value=None):
+        """Skickar inställningen och returnerar True om enheten kvitterade rätt värde."""
+        value = self.new if value is None else value
+        if self.setting == "coercivity":
+            return device.set_coercivity(value == protocol.COERCIVITY_HIGH)
+        if self.setting == "leading_zeros":
+            return device.set_leading_zeros(*value)
+        if self.setting == "bpc":
+            return device.set_bpc(*value) == tuple(value)
+        return device.set_bpi(int(self.setting[3:]), value)
+
+    def __str__(self):
+        return f"{self.setting}={self.new}"
+
+
+def plan(device, profile):
+    """Stegen som behövs för att enheten ska få profilens inställningar.
+
+    Koercivitet och ledande nollor frågas efter om de inte redan finns i device.state,
+    så att de kan återställas; BPI och BPC går inte att fråga efter och skickas om de
+    inte är kända.
+    """
+    state = device.state
+    steps = []
+    if profile.coercivity is not None:
+        current = device.get_coercivity()
+        if current != profile.coercivity:
+            steps.append(Step("coercivity", profile.coercivity, current))
+    if profile.leading_zeros is not None:
+        current = tuple(device.check_leading_zeros())
+        if current != tuple(profile.leading_zeros):
+            steps.append(Step("leading_zeros", tuple(profile.leading_zeros), current))
+    for track, bpi in sorted(profile.bpi.items()):
+        if state.bpi.get(track) != bpi:
+            steps.append(Step(f"bpi{track}", bpi, state.bpi.get(track)))
+    if profile.bpc is not None and state.bpc != tuple(profile.bpc):
+        steps.append(Step("bpc", tuple(profile.bpc), state.bpc))
+    return steps
+
+
+@dataclass
+class ApplyResult:
+    """Utfall av apply_profile.
+
+    applied är stegen som gick igenom, failed steget som misslyckades, restored de
+    steg (inklusive failed) som återställdes och not_restored de som inte kunde
+    återställas (okänt tidigare värde eller fel vid återställningen).
+    """
+    profile: str
+    applied: list = field(default_factory=list)
+    skipped: int = 0
+    failed: Step = None
+    error: str = ""
+    restored: list = field(default_factory=list)
+    not_restored: list = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return self.failed is None and not self.error
+
+
+def _count_settings(profile):
+    return ((profile.coercivity is not None) + (profile.leading_zeros is not None)
+            + len(profile.bpi) + (profile.bpc is not None))
+
+
+def apply_profile(device, profile, rollback=True):
+    """Tillämpar profilen på device i ett svep och returnerar ett ApplyResult.
+
+    Körs i tråden som äger device. Misslyckas ett steg (fel kvittens, timeout eller
+    ogiltigt svar) stoppas körningen och med rollback=True sätts redan ändrade
+    inställningar tillbaka i omvänd ordning.
+    """
+    result = ApplyResult(profile.name)
+    try:
+        steps = plan(device, profile)
+    except (DeviceError, protocol.ProtocolError) as e:
+        result.error = f"could not read current settings: {e}"
+        return result
+    result.skipped = _count_settings(profile) - len(steps)
+    for step in steps:
+        try:
+            ok = step.apply(device)
+        except (DeviceError, protocol.ProtocolError) as e:
+            ok, result.error = False, str(e) or type(e).__name__
+        if not ok:
+            result.failed = step
+            result.error = result.error or f"{step.setting} not acknowledged"
+            break
+        result.applied.append(step)
+    if result.failed is None or not rollback:
+        return result
+    # Det misslyckade steget kan ha gått igenom trots fel svar, så det återställs också
+    for step in [result.failed] + result.applied[::-1]:
+        try:
+            if step.old is not None and step.apply(device, step.old):
+                result.restored.append(step)
+                continue
+        except (DeviceError, protocol.ProtocolError):
+            pass
+        result.not_restored.append(step)
+    return result
@@ -0,0 +1,473 @@
+"""Kommandon och svarstolkning för MSRE206, utan beroende av PyQt6 eller pyserial."""
+from dataclasses import dataclass, field
+
+ESC = 0x1B
+FS = 0x1C
+STATUS_OK = 0x30
+STATUS_FAIL = 0x41
+# Svaret på kommunikationstestet ESC e
+COMM_TEST_OK = bytes([ESC, 0x79])
+
+# Opkoder (byten efter ESC)
+OP_RESET = 0x61
+OP_READ = 0x72
+OP_WRITE = 0x77
+OP_ERASE = 0x63
+OP_READ_RAW = 0x6D
+OP_WRITE_RAW = 0x6E
+OP_COMM_TEST = 0x65
+OP_SENSOR_TEST = 0x86
+OP_RAM_TEST = 0x87
+OP_GET_MODEL = 0x74
+OP_GET_FIRMWARE = 0x76
+OP_GET_COERCIVITY = 0x64
+OP_SET_LEADING_ZEROS = 0x7A
+OP_CHECK_LEADING_ZEROS = 0x6C
+OP_SET_BPI = 0x62
+OP_SET_BPC = 0x6F
+OP_SET_HICO = 0x78
+OP_SET_LOCO = 0x79
+OP_SENSOR = 0x80
+
+LED_ALL_OFF = 0x81
+LED_ALL_ON = 0x82
+LED_GREEN = 0x83
+LED_YELLOW = 0x84
+LED_RED = 0x85
+LED_CODES = (LED_ALL_OFF, LED_ALL_ON, LED_GREEN, LED_YELLOW, LED_RED)
+
+COERCIVITY_HIGH = "high"
+COERCIVITY_LOW = "low"
+
+TRACKS = (1, 2, 3)
+BPI_VALUES = (75, 210)
+BPC_VALUES = (5, 6, 7, 8)
+# ISO 7811-standard: 7 bitar/210 bpi på spår 1, 5 bitar på spår 2 (75 bpi) och 3 (210 bpi)
+DEFAULT_BPC = {1: 7, 2: 5, 3: 5}
+DEFAULT_BPI = {1: 210, 2: 75, 3: 210}
+# Teckenuppsättning per BPC: ASCII-värdet för teckenvärde 0, och startvakten
+ISO_CHAR_OFFSETS = {5: 0x30, 6: 0x20, 7: 0x20, 8: 0x00}
+ISO_START_SENTINELS = {5: ";", 6: "%", 7: "%", 8: "%"}
+ISO_END_SENTINEL = "?"
+# Varje spår har egna koder för 75/210 bpi
+BPI_CODES = {
+    1: {75: 0xA0, 210: 0xA1},
+    2: {75: 0x4B, 210: 0xD2},
+    3: {75: 0xC0, 210: 0xC1},
+}
+
+# Standardtidsgränser (sekunder); kommandon som väntar på kortdragning får längre tid
+DEFAULT_TIMEOUT = 10
+SWIPE_TIMEOUT = 15
+SENSOR_TEST_TIMEOUT = 30
+# Sensorfrågan svarar direkt; kort tid så att en övervakningsloop inte fastnar
+SENSOR_POLL_TIMEOUT = 0.25
+
+
+class ProtocolError(Exception):
+    """Svaret från enheten hade inte förväntat format."""
+
+    def __init__(self, response, message="Invalid response from device"):
+        super().__init__(message)
+        self.response = bytes(response)
+
+
+@dataclass(frozen=True)
+class Command:
+    """Ett färdigbyggt kommando. name är samma nyckel som används i språkfilerna."""
+    name: str
+    payload: bytes
+    timeout: float = DEFAULT_TIMEOUT
+    expect_response: bool = True
+
+    @property
+    def opcode(self):
+        return self.payload[1]
+
+
+@dataclass
+class ReadResult:
+    """Spårdata och statusbyte från en läsning (text för ESC r, bytes för ESC m)."""
+    tracks: dict
+    status: int
+
+    @property
+    def ok(self):
+        return self.status == STATUS_OK
+
+
+@dataclass
+class VerifyResult:
+    """Resultat av skrivning följd av läsning. mismatches är {spår: (skrivet, läst)}."""
+    status: int
+    read: ReadResult = None
+    mismatches: dict = field(default_factory=dict)
+
+    @property
+    def ok(self):
+        return self.status == STATUS_OK and self.read is not None and self.read.ok and not self.mismatches
+
+
+# --- Kommandobyggare ---
+
+def build_reset():
+    return Command("reset", bytes([ESC, OP_RESET]), expect_response=False)
+
+
+def build_read():
+    return Command("read_card", bytes([ESC, OP_READ]), timeout=SWIPE_TIMEOUT)
+
+
+def _track_block(tracks, raw):
+    """Bygger datablocket ESC s [ESC n data]... ? FS för skrivkommandona."""
+    data_block = bytearray([ESC, 0x73])
+    for num in TRACKS:
+        data = tracks.get(num)
+        if not data:
+            continue
+        if raw:
+            data_block += bytes([ESC, num, len(data)]) + bytes(data)
+        else:
+            data_block += bytes([ESC, num]) + data.encode()
+    data_block += b'?\x1c'
+    return bytes(data_block)
+
+
+def build_write(tracks):
+    """tracks: {spårnummer: text}. Tomma spår hoppas över."""
+    return Command("write_card", bytes([ESC, OP_WRITE]) + _track_block(tracks, raw=False),
+                   timeout=SWIPE_TIMEOUT)
+
+
+def build_erase(tracks):
+    """tracks: spårnummer som ska raderas."""
+    select_byte = 0
+    for num in tracks:
+        if num not in TRACKS:
+            raise ValueError(f"Invalid track: {num}")
+        select_byte |= 1 << (num - 1)
+    if select_byte == 0:
+        raise ValueError("No tracks selected")
+    return Command("erase_card", bytes([ESC, OP_ERASE, select_byte]), timeout=SWIPE_TIMEOUT)
+
+
+def build_read_raw():
+    return Command("read_raw", bytes([ESC, OP_READ_RAW]), timeout=SWIPE_TIMEOUT)
+
+
+def build_write_raw(tracks):
+    """tracks: {spårnummer: bytes}. Längden skrivs som en byte före datat."""
+    return Command("write_raw", bytes([ESC, OP_WRITE_RAW]) + _track_block(tracks, raw=True),
+                   timeout=SWIPE_TIMEOUT)
+
+
+def build_led(code):
+    if code not in LED_CODES:
+        raise ValueError(f"Invalid LED code: {code:#x}")
+    return Command("led_control", bytes([ESC, code]), expect_response=False)
+
+
+def build_comm_test():
+    return Command("comm_test", bytes([ESC, OP_COMM_TEST]))
+
+
+def build_sensor_test():
+    return Command("sensor_test", bytes([ESC, OP_SENSOR_TEST]), timeout=SENSOR_TEST_TIMEOUT)
+
+
+def build_ram_test():
+    return Command("ram_test", bytes([ESC, OP_RAM_TEST]))
+
+
+def build_get_model():
+    return Command("get_model", bytes([ESC, OP_GET_MODEL]))
+
+
+def build_get_firmware():
+    return Command("get_firmware", bytes([ESC, OP_GET_FIRMWARE]))
+
+
+def build_get_coercivity():
+    return Command("get_coercivity", bytes([ESC, OP_GET_COERCIVITY]))
+
+
+def build_set_leading_zeros(lz_13, lz_2):
+    if not (0 <= lz_13 <= 255 and 0 <= lz_2 <= 255):
+        raise ValueError(f"Invalid leading zeros: {lz_13}, {lz_2}")
+    return Command("set_leading_zeros", bytes([ESC, OP_SET_LEADING_ZEROS, lz_13, lz_2]))
+
+
+def build_check_leading_zeros():
+    return Command("check_leading_zeros", bytes([ESC, OP_CHECK_LEADING_ZEROS]))
+
+
+def build_set_bpi(track, bpi):
+    return Command("set_bpi", bytes([ESC, OP_SET_BPI, BPI_CODES[track][int(bpi)]]))
+
+
+def build_set_bpc(bpc1, bpc2, bpc3):
+    if not all(b in BPC_VALUES for b in (bpc1, bpc2, bpc3)):
+        raise ValueError(f"Invalid BPC: {bpc1}, {bpc2}, {bpc3}")
+    return Command("set_bpc", bytes([ESC, OP_SET_BPC, bpc1, bpc2, bpc3]))
+
+
+def build_set_coercivity(high):
+    return Command("set_coercivity", bytes([ESC, OP_SET_HICO if high else OP_SET_LOCO]))
+
+
+def build_sensor_poll():
+    return Command("sensor_poll", bytes([ESC, OP_SENSOR]), timeout=SENSOR_POLL_TIMEOUT)
+
+
+# --- Svarstolkning ---
+
+def _track_status(response):
+    """Statusbyten efter spårdatan; ProtocolError om svaret inte slutar med ? FS ESC status."""
+    if len(response) < 6 or response[0:2] != bytes([ESC, 0x73]) or response[-4:-1] != _TRACK_TRAILER:
+        raise ProtocolError(response)
+    return response[-1]
+
+
+def decode_read(response):
+    """Tolkar svaret på ESC r: ESC s ESC 1 data ESC 2 data ESC 3 data ? FS ESC status."""
+    status = _track_status(response)
+    tracks = {1: "", 2: "", 3: ""}
+    parts = response[:-4].split(b'\x1b')[1:]
+    for part in parts:
+        if not part:
+            continue
+        track_num = part[0]
+        data = part[1:].split(b'?')[0]
+        if track_num in tracks:
+            tracks[track_num] = data.decode(errors='ignore')
+    return ReadResult(tracks, status)
+
+
+def decode_raw_read(response):
+    """Tolkar svaret på ESC m där varje spår är ESC n längd data."""
+    status = _track_status(response)
+    tracks = {1: b"", 2: b"", 3: b""}
+    pos = 2
+    while pos < len(response) - 4 and response[pos] == ESC:
+        track_num = response[pos+1]
+        length = response[pos+2]
+        data = response[pos+3: pos+3+length]
+        if track_num in tracks:
+            tracks[track_num] = bytes(data)
+        pos += 3 + length
+    # Blocken ska ta slut precis vid ? FS ESC status
+    if pos != len(response) - 4:
+        raise ProtocolError(response)
+    return ReadResult(tracks, status)
+
+
+def compare_tracks(written, result):
+    """Jämför skrivna spår med en ReadResult och returnerar {spår: (skrivet, läst)} för avvikelser.
+
+    Text jämförs fram till slutsentinel '?' eftersom decode_read klipper där; rådata
+    jämförs utan avslutande nollbyte.
+    """
+    mismatches = {}
+    for num, expected in written.items():
+        if not expected:
+            continue
+        actual = result.tracks.get(num)
+        if isinstance(expected, str):
+            same = expected.split('?')[0] == actual
+        else:
+            same = bytes(expected).rstrip(b'\0') == bytes(actual or b"").rstrip(b'\0')
+        if not same:
+            mismatches[num] = (expected, actual)
+    return mismatches
+
+
+def decode_status(response):
+    """Returnerar statusbyten från ett ESC <status>-svar."""
+    if len(response) >= 2 and response[0] == ESC:
+        return response[1]
+    raise ProtocolError(response)
+
+
+def decode_model(response):
+    if len(response) >= 3 and response[0] == ESC and response[-1] == 0x53:
+        return response[1:-1].decode(errors='ignore')
+    raise ProtocolError(response)
+
+
+def decode_firmware(response):
+    if response and response[0] == ESC:
+        return response[1:].decode(errors='ignore')
+    raise ProtocolError(response)
+
+
+def decode_coercivity(response):
+    if response == b'\x1b\x48':
+        return COERCIVITY_HIGH
+    if response == b'\x1b\x4C':
+        return COERCIVITY_LOW
+    raise ProtocolError(response)
+
+
+def decode_leading_zeros(response):
+    """Returnerar (spår 1&3, spår 2)."""
+    if len(response) >= 3 and response[0] == ESC:
+        return response[1], response[2]
+    raise ProtocolError(response)
+
+
+def decode_bpc(response):
+    """Returnerar BPC för spår 1, 2 och 3 som enheten bekräftade, eller False om den avvisade dem."""
+    if len(response) >= 5 and response[:2] == bytes([ESC, STATUS_OK]):
+        return response[2], response[3], response[4]
+    if response == bytes([ESC, STATUS_FAIL]):
+        return False
+    raise ProtocolError(response)
+
+
+def decode_comm_test(response):
+    return response == COMM_TEST_OK
+
+
+def decode_ack(response):
+    """För tester och inställningar som svarar ESC 0 (ok) eller ESC A (fel)."""
+    if response == bytes([ESC, STATUS_OK]):
+        return True
+    if response == bytes([ESC, STATUS_FAIL]):
+        return False
+    raise ProtocolError(response)
+
+
+def decode_sensor(response):
+    """True om sensorn rapporterar ett kort."""
+    return bool(response) and response[0] == 0x01
+
+
+# --- Ramtolkning ---
+
+# Svarsformat per opkod: ett heltal betyder fast längd, strängarna beskrivs i FrameParser
+FRAME_SHAPES = {
+    OP_READ: "tracks",
+    OP_READ_RAW: "raw_tracks",
+    OP_WRITE: 2,
+    OP_WRITE_RAW: 2,
+    OP_ERASE: 2,
+    OP_COMM_TEST: 2,
+    OP_SENSOR_TEST: 2,
+    OP_RAM_TEST: 2,
+    OP_GET_COERCIVITY: 2,
+    OP_SET_LEADING_ZEROS: 2,
+    OP_SET_BPI: 2,
+    OP_SET_HICO: 2,
+    OP_SET_LOCO: 2,
+    OP_CHECK_LEADING_ZEROS: 3,
+    OP_SET_BPC: "bpc",
+    OP_GET_MODEL: "model",
+    # ESC + firmwaresträng, normalt "REV?X.XX" men längden är inte given
+    OP_GET_FIRMWARE: "silence",
+    OP_SENSOR: 1,
+}
+
+_TRACK_TRAILER = b'?\x1c\x1b'
+
+
+class FrameParser:
+    """Inkrementell tolk som vet exakt när svaret på en opkod är komplett.
+
+    feed() matas med byte allteftersom de kommer och returnerar True när ramen är hel.
+    needed() anger hur många byte som minst saknas, så att läsaren kan blockera på
+    precis så många. Byte efter ramens slut hamnar i remainder.
+
+    Format:
+      tracks      ESC s ESC 1 data ESC 2 data ESC 3 data ? FS ESC status
+      raw_tracks  ESC s ESC 1 len data ... ? FS ESC status
+      bpc         ESC 0 bpc1 bpc2 bpc3, eller ESC status vid fel
+      model       ESC modell S
+      silence     ESC data; slutar när linjen blir tyst, vilket läsaren anger med finish()
+    Ett svar som bara är ESC status (t.ex. läsfel) godtas för alla format.
+    Okända opkoder blir aldrig kompletta; då avgör läsarens tidsgränser.
+    """
+
+    def __init__(self, opcode):
+        self.opcode = opcode
+        self.shape = FRAME_SHAPES.get(opcode)
+        self.buffer = bytearray()
+        self.remainder = b""
+        self.complete = False
+        self._need = self.shape if isinstance(self.shape, int) else 2
+        self._pos = 2
+
+    def feed(self, data):
+        if self.complete:
+            self.remainder += bytes(data)
+            return True
+        self.buffer += data
+        end = self._scan()
+        if end is not None:
+            self.complete = True
+            self.remainder = bytes(self.buffer[end:])
+            del self.buffer[end:]
+        return self.complete
+
+    def needed(self):
+        """Minsta antal byte som fattas innan ramen kan vara komplett."""
+        if self.complete:
+            return 0
+        return max(1, self._need - len(self.buffer))
+
+    def finish(self):
+        """Anropas när det blivit tyst efter svaret; avslutar ramar som slutar på tystnad."""
+        if self.shape == "silence" and len(self.buffer) >= 2 and self.buffer[0] == ESC:
+            self.complete = True
+        return self.complete
+
+    @property
+    def frame(self):
+        return bytes(self.buffer)
+
+    def _scan(self):
+        buf = self.buffer
+        shape = self.shape
+        if isinstance(shape, int):
+            return shape if len(buf) >= shape else None
+        if shape is None or len(buf) < 2:
+            return None
+        if shape == "silence":
+            self._need = len(buf) + 1
+            return None
+        if shape == "bpc":
+            self._need = 5 if buf[1] == STATUS_OK else 2
+            return self._need if len(buf) >= self._need else None
+        if shape == "model":
+            end = buf.find(b'S', 1)
+            self._need = len(buf) + 1
+            return end + 1 if end >= 0 else None
+        # Spårsvar; ESC + annat än 's' är ett rent statussvar
+        if buf[1] != 0x73:
+            return 2
+        if shape == "tracks":
+            i = buf.find(_TRACK_TRAILER, max(2, self._pos - 2))
+            if i < 0:
+                self._pos = len(buf)
+                self._need = len(buf) + 1
+                return None
+            self._need = i + 4
+            return self._need if len(buf) >= self._need else None
+        # raw_tracks: gå igenom längdprefixade block
+        pos = self._pos
+        while True:
+            if pos >= len(buf):
+                self._need = pos + 1
+                break
+            if buf[pos] == ESC:
+                if pos + 3 > len(buf):
+                    self._need = pos + 3
+                    break
+                pos += 3 + buf[pos + 2]
+                self._pos = pos
+                continue
+            if buf[pos] == 0x3F:
+                self._need = pos + 4
+                return self._need if len(buf) >= self._need else None
+            # Oväntad byte; avsluta så att avkodaren får rapportera felet
+            return len(buf)
+        return None
@@ -0,0 +1,155 @@
+"""ISO 7811-kodning av rådata (ESC m / ESC n): bitström <-> tecken med paritet och LRC.
+
+Varje tecken är BPC bitar: BPC-1 databitar med minst signifikant bit först och
+sist en udda paritetsbit. Spår 1 använder 7 bitar (tecken 0x20-0x5F), spår 2 och
+3 använder 5 bitar (tecken 0x30-0x3F). Efter slutvakten '?' kommer LRC, XOR av
+alla tecken från startvakten till och med slutvakten.
+
+Avkodningen är vektoriserad med NumPy, så en hel samling rådataläsningar
+kontrolleras i ett svep:
+
+    ok = check_tracks(raw_reads, protocol.DEFAULT_BPC[2])
+    decoded = decode_tracks(raw_reads, 5)
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from . import protocol
+
+CHAR_OFFSETS = protocol.ISO_CHAR_OFFSETS
+START_SENTINELS = protocol.ISO_START_SENTINELS
+END_SENTINEL = protocol.ISO_END_SENTINEL
+# Bitordning inom varje byte i enhetens rådata; första biten på spåret är MSB
+BIT_ORDER = "big"
+# Udda antal ettor för varje bytevärde
+_ODD_PARITY = np.array([bin(code).count("1") % 2 == 1 for code in range(256)])
+
+
+@dataclass
+class DecodedTrack:
+    """Ett avkodat spår. parity_errors är index för tecken med fel paritet."""
+    text: str
+    parity_errors: list = field(default_factory=list)
+    lrc_ok: bool = False
+
+    @property
+    def ok(self):
+        return bool(self.text) and not self.parity_errors and self.lrc_ok
+
+
+def _check_bpc(bpc):
+    if bpc not in protocol.BPC_VALUES:
+        raise ValueError(f"Invalid BPC: {bpc}")
+
+
+def _bit_matrix(raws, bit_order):
+    """Lägger alla rådata i en nollutfylld bitmatris (en rad per spår)."""
+    lengths = np.fromiter((len(raw) for raw in raws), dtype=np.int64, count=len(raws))
+    width = int(lengths.max()) if len(raws) else 0
+    buffer = np.zeros((len(raws), width), dtype=np.uint8)
+    if lengths.sum():
+        data = np.frombuffer(b"".join(raws), dtype=np.uint8)
+        rows = np.repeat(np.arange(len(raws)), lengths)
+        cols = np.arange(len(data)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        buffer[rows, cols] = data
+    return np.unpackbits(buffer, axis=1, bitorder=bit_order), lengths * 8
+
+
+def _decode_arrays(raws, bpc, bit_order):
+    """Avkodar alla spår på en gång.
+
+    Returnerar (values, count, parity_ok, lrc_ok): teckenvärden per rad, antal tecken
+    till och med slutvakten (eller sista tecknet med ettor), paritet per tecken och
+    LRC-kontroll per rad.
+    """
+    _check_bpc(bpc)
+    bits, nbits = _bit_matrix(raws, bit_order)
+    rows = np.arange(len(raws))
+    max_chars = max(1, bits.shape[1] // bpc)
+    if not bits.shape[1]:
+        bits = np.zeros((len(raws), 1), dtype=np.uint8)
+    # Startvakten börjar med en etta, så första ettan är början på första tecknet
+    start = bits.argmax(axis=1)
+    positions = start[:, None] + np.arange(max_chars) * bpc
+    in_range = positions + bpc <= nbits[:, None]
+    index = np.minimum(positions[..., None] + np.arange(bpc), bits.shape[1] - 1)
+    chars = np.take_along_axis(bits, index.reshape(len(raws), -1), axis=1).reshape(len(raws), max_chars, bpc)
+    # Hela tecknet (data + paritet) som ett tal; paritetsbiten hamnar överst
+    codes = (chars * (1 << np.arange(bpc, dtype=np.uint8))).sum(axis=2, dtype=np.uint8) * in_range
+    values = (codes & ((1 << (bpc - 1)) - 1)).astype(np.int16)
+    parity_ok = _ODD_PARITY[codes]
+
+    offset = CHAR_OFFSETS[bpc]
+    is_end = (values == ord(END_SENTINEL) - offset) & in_range
+    has_end = is_end.any(axis=1)
+    end = is_end.argmax(axis=1)
+    # Utan slutvakt: allt till och med sista tecknet som innehåller ettor
+    nonzero = codes != 0
+    last = max_chars - 1 - nonzero[:, ::-1].argmax(axis=1)
+    count = np.where(has_end, end + 1, np.where(nonzero.any(axis=1), last + 1, 0))
+
+    lrc_at = np.minimum(end + 1, max_chars - 1)
+    xor = np.bitwise_xor.accumulate(values, axis=1)
+    lrc_ok = (has_end & (end + 1 < max_chars) & in_range[rows, lrc_at]
+              & (values[rows, lrc_at] == xor[rows, end]) & parity_ok[rows, lrc_at]
+              & (values[:, 0] == ord(START_SENTINELS[bpc]) - offset))
+    return values, count, parity_ok, lrc_ok
+
+
+def check_tracks(raws, bpc, bit_order=BIT_ORDER):
+    """Bool-array: True för de spår som har start-/slutvakt, rätt paritet och rätt LRC."""
+    if not len(raws):
+        _check_bpc(bpc)
+        return np.zeros(0, dtype=bool)
+    values, count, parity_ok, lrc_ok = _decode_arrays(raws, bpc, bit_order)
+    in_data = np.arange(values.shape[1]) < count[:, None]
+    return lrc_ok & (count > 0) & ~(~parity_ok & in_data).any(axis=1)
+
+
+def decode_tracks(raws, bpc, bit_order=BIT_ORDER):
+    """Avkodar en lista med rådata (bytes) till DecodedTrack, ett per spår."""
+    if not len(raws):
+        _check_bpc(bpc)
+        return []
+    values, count, parity_ok, lrc_ok = _decode_arrays(raws, bpc, bit_order)
+    text = (values + CHAR_OFFSETS[bpc]).astype(np.uint8)
+    decoded = []
+    for i, n in enumerate(count.tolist()):
+        decoded.append(DecodedTrack(text[i, :n].tobytes().decode("latin-1"),
+                                    np.flatnonzero(~parity_ok[i, :n]).tolist(), bool(lrc_ok[i])))
+    return decoded
+
+
+def decode_track(raw, bpc, bit_order=BIT_ORDER):
+    return decode_tracks([raw], bpc, bit_order)[0]
+
+
+def encode_track(text, bpc, leading_zeros=0, bit_order=BIT_ORDER):
+    """Kodar text till rådata för ESC n, med paritet och LRC.
+
+    Start- och slutvakt läggs till om de saknas. leading_zeros är antal nollbitar
+    före startvakten; slutet fylls ut med nollor till hel byte.
+    """
+    _check_bpc(bpc)
+    if not text.startswith(START_SENTINELS[bpc]):
+        text = START_SENTINELS[bpc] + text
+    if not text.endswith(END_SENTINEL):
+        text += END_SENTINEL
+    offset = CHAR_OFFSETS[bpc]
+    values = np.frombuffer(text.encode("ascii"), dtype=np.uint8).astype(np.int16) - offset
+    bad = (values < 0) | (values >= 1 << (bpc - 1))
+    if bad.any():
+        raise ValueError(f"Character {text[int(bad.argmax())]!r} cannot be encoded with {bpc} BPC")
+    values = np.append(values, np.bitwise_xor.reduce(values))
+    data = (values[:, None] >> np.arange(bpc - 1)) & 1
+    parity = 1 - data.sum(axis=1) % 2
+    bits = np.concatenate([np.zeros(leading_zeros, dtype=np.uint8),
+                           np.hstack([data, parity[:, None]]).astype(np.uint8).ravel()])
+    return np.packbits(bits, bitorder=bit_order).tobytes()
+
+
+def encode_tracks(tracks, bpc=None, leading_zeros=0, bit_order=BIT_ORDER):
+    """{spår: text} -> {spår: rådata}, med BPC per spår (standard: protocol.DEFAULT_BPC)."""
+    bpc = bpc or protocol.DEFAULT_BPC
+    return {num: encode_track(text, bpc[num], leading_zeros, bit_order) for num, text in tracks.items()}
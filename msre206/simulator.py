@@ -0,0 +1,353 @@
+"""Mjukvaru-MSRE206 på en pseudoterminal (endast POSIX).
+
+Simulatorn öppnar en pty och svarar på samma kommandon som appen skickar, så GUI:t,
+Device och övriga verktyg kan peka på den som på en riktig port:
+
+    python -m msre206.simulator --swipe-delay 0.5 --link /tmp/msre206
+
+Svarstider kan styras med swipe_delay (väntan på kortdragning) och baudrate
+(tid per byte på linjen). Fel injiceras med sannolikheter i errors eller
+deterministiskt med fail_next():
+  bad_status  statusbyten ersätts med ett felvärde
+  truncate    svaret kapas mitt i
+  timeout     inget svar alls
+  late        svaret kommer först efter late_delay sekunder (efter värdens timeout)
+"""
+import argparse
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+from . import protocol
+
+ESC = protocol.ESC
+STATUS_OK = protocol.STATUS_OK
+# Felvärde som används vid bad_status
+STATUS_ERROR = 0x31
+ERROR_KINDS = ("bad_status", "truncate", "timeout", "late")
+# Kommandon som väntar på att ett kort dras
+SWIPE_OPCODES = (protocol.OP_READ, protocol.OP_WRITE, protocol.OP_ERASE,
+                 protocol.OP_READ_RAW, protocol.OP_WRITE_RAW, protocol.OP_SENSOR_TEST)
+# Längd på kommandon med fasta argument; skrivkommandona har variabel längd
+REQUEST_LENGTHS = {
+    protocol.OP_ERASE: 3,
+    protocol.OP_SET_LEADING_ZEROS: 4,
+    protocol.OP_SET_BPI: 3,
+    protocol.OP_SET_BPC: 5,
+}
+
+
+class MSRE206Simulator:
+    """En simulerad MSRE206 som körs på en egen tråd bakom en pty."""
+
+    def __init__(self, swipe_delay=0.0, baudrate=9600, pace=True, errors=None, seed=None,
+                 model="3", firmware="REVS1.00", late_delay=0.5):
+        self.swipe_delay = swipe_delay
+        self.late_delay = late_delay
+        self.baudrate = baudrate
+        self.pace = pace
+        self.errors = dict(errors or {})
+        self.model = model
+        self.firmware = firmware
+        self.random = random.Random(seed)
+        self.port = None
+        # Enhetens tillstånd
+        self.tracks = {1: "", 2: "", 3: ""}
+        self.raw_tracks = {1: b"", 2: b"", 3: b""}
+        self.hico = True
+        self.leading_zeros = (61, 22)
+        self.bpi = {1: 210, 2: 75, 3: 210}
+        self.bpc = (7, 5, 5)
+        self.leds = protocol.LED_ALL_OFF
+        self.card_present = False
+        self.commands = []
+        self._forced = []
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._stop_r = self._stop_w = None
+        self._dispatch = self._handlers()
+
+    # --- Livscykel ---
+
+    def start(self):
+        """Öppnar pty:n, startar tråden och returnerar sökvägen till porten."""
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="msre206-simulator", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        if self._thread is None:
+            return
+        os.write(self._stop_w, b"x")
+        self._thread.join()
+        for fd in (self._master, self._slave, self._stop_r, self._stop_w):
+            os.close(fd)
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail_next(self, kind, count=1):
+        """Låter de nästa count svaren få felet kind."""
+        if kind not in ERROR_KINDS:
+            raise ValueError(f"Unknown error kind: {kind}")
+        self._forced.extend([kind] * count)
+
+    def insert_card(self):
+        self.card_present = True
+
+    def remove_card(self):
+        self.card_present = False
+
+    # --- Kommandohantering ---
+
+    def _run(self):
+        buffer = bytearray()
+        while True:
+            ready, _, _ = select.select([self._master, self._stop_r], [], [])
+            if self._stop_r in ready:
+                return
+            try:
+                buffer += os.read(self._master, 4096)
+            except OSError:
+                return
+            while True:
+                request = self._take_request(buffer)
+                if request is None:
+                    break
+                self._handle(request)
+
+    def _take_request(self, buffer):
+        """Plockar ut ett helt kommando ur buffer, eller None om det inte kommit än."""
+        # Skräp före ESC slängs
+        start = buffer.find(bytes([ESC]))
+        if start < 0:
+            buffer.clear()
+            return None
+        del buffer[:start]
+        if len(buffer) < 2:
+            return None
+        opcode = buffer[1]
+        if opcode == protocol.OP_WRITE:
+            end = buffer.find(b'?\x1c')
+            end = end + 2 if end >= 0 else None
+        elif opcode == protocol.OP_WRITE_RAW:
+            end = self._raw_block_end(buffer)
+        else:
+            end = REQUEST_LENGTHS.get(opcode, 2)
+            if len(buffer) < end:
+                end = None
+        if end is None:
+            return None
+        request = bytes(buffer[:end])
+        del buffer[:end]
+        return request
+
+    @staticmethod
+    def _raw_block_end(buffer):
+        pos = 4  # ESC n ESC s
+        while pos < len(buffer):
+            if buffer[pos] == ESC:
+                if pos + 3 > len(buffer):
+                    return None
+                pos += 3 + buffer[pos + 2]
+            elif buffer[pos] == 0x3F:
+                return pos + 2 if pos + 2 <= len(buffer) else None
+            else:
+                return pos + 1
+        return None
+
+    def _handle(self, request):
+        opcode = request[1]
+        self.commands.append(request)
+        if opcode in SWIPE_OPCODES and self.swipe_delay:
+            time.sleep(self.swipe_delay)
+        handler = self._dispatch.get(opcode)
+        if handler is None:
+            if opcode in protocol.LED_CODES:
+                self.leds = opcode
+            return
+        response = handler(request)
+        if response is not None:
+            self._send(response)
+
+    def _handlers(self):
+        p = protocol
+        return {
+            p.OP_RESET: self._reset,
+            p.OP_READ: self._read,
+            p.OP_WRITE: self._write,
+            p.OP_ERASE: self._erase,
+            p.OP_READ_RAW: self._read_raw,
+            p.OP_WRITE_RAW: self._write_raw,
+            p.OP_COMM_TEST: lambda r: bytes([ESC, 0x79]),
+            p.OP_SENSOR_TEST: lambda r: bytes([ESC, STATUS_OK]),
+            p.OP_RAM_TEST: lambda r: bytes([ESC, STATUS_OK]),
+            p.OP_GET_MODEL: lambda r: bytes([ESC]) + self.model.encode() + b'S',
+            p.OP_GET_FIRMWARE: lambda r: bytes([ESC]) + self.firmware.encode(),
+            p.OP_GET_COERCIVITY: lambda r: bytes([ESC, 0x48 if self.hico else 0x4C]),
+            p.OP_SET_HICO: lambda r: self._set_coercivity(True),
+            p.OP_SET_LOCO: lambda r: self._set_coercivity(False),
+            p.OP_SET_LEADING_ZEROS: self._set_leading_zeros,
+            p.OP_CHECK_LEADING_ZEROS: lambda r: bytes([ESC, *self.leading_zeros]),
+            p.OP_SET_BPI: self._set_bpi,
+            p.OP_SET_BPC: self._set_bpc,
+            p.OP_SENSOR: lambda r: bytes([0x01 if self.card_present else 0x00]),
+        }
+
+    def _reset(self, request):
+        self.leds = protocol.LED_ALL_OFF
+        return None
+
+    def _read(self, request):
+        block = bytearray([ESC, 0x73])
+        for num in protocol.TRACKS:
+            block += bytes([ESC, num]) + self.tracks[num].split('?')[0].encode()
+        return bytes(block) + bytes([0x3F, protocol.FS, ESC, STATUS_OK])
+
+    def _write(self, request):
+        block = request[4:-2]
+        for part in block.split(bytes([ESC]))[1:]:
+            if part and part[0] in self.tracks:
+                self.tracks[part[0]] = part[1:].decode(errors='ignore')
+                self.raw_tracks[part[0]] = bytes(part[1:])
+        return bytes([ESC, STATUS_OK])
+
+    def _erase(self, request):
+        for num in protocol.TRACKS:
+            if request[2] & (1 << (num - 1)):
+                self.tracks[num] = ""
+                self.raw_tracks[num] = b""
+        return bytes([ESC, STATUS_OK])
+
+    def _read_raw(self, request):
+        block = bytearray([ESC, 0x73])
+        for num in protocol.TRACKS:
+            data = self.raw_tracks[num]
+            block += bytes([ESC, num, len(data)]) + data
+        return bytes(block) + bytes([0x3F, protocol.FS, ESC, STATUS_OK])
+
+    def _write_raw(self, request):
+        pos = 4
+        while pos < len(request) and request[pos] == ESC:
+            num, length = request[pos + 1], request[pos + 2]
+            if num in self.raw_tracks:
+                self.raw_tracks[num] = request[pos + 3:pos + 3 + length]
+                self.tracks[num] = ""
+            pos += 3 + length
+        return bytes([ESC, STATUS_OK])
+
+    def _set_coercivity(self, high):
+        self.hico = high
+        return bytes([ESC, STATUS_OK])
+
+    def _set_leading_zeros(self, request):
+        self.leading_zeros = (request[2], request[3])
+        return bytes([ESC, STATUS_OK])
+
+    def _set_bpi(self, request):
+        for track, codes in protocol.BPI_CODES.items():
+            for bpi, code in codes.items():
+                if code == request[2]:
+                    self.bpi[track] = bpi
+                    return bytes([ESC, STATUS_OK])
+        return bytes([ESC, protocol.STATUS_FAIL])
+
+    def _set_bpc(self, request):
+        if not all(b in protocol.BPC_VALUES for b in request[2:5]):
+            return bytes([ESC, protocol.STATUS_FAIL])
+        self.bpc = tuple(request[2:5])
+        return bytes([ESC, STATUS_OK]) + bytes(self.bpc)
+
+    # --- Utdata ---
+
+    def _pick_error(self):
+        if self._forced:
+            return self._forced.pop(0)
+        for kind, probability in self.errors.items():
+            if self.random.random() < probability:
+                return kind
+        return None
+
+    def _send(self, response):
+        error = self._pick_error()
+        if error == "timeout":
+            return
+        if error == "late":
+            # Enheten är upptagen under tiden, precis som när den väntar på en dragning
+            time.sleep(self.late_delay)
+        if error == "truncate":
+            response = response[:max(1, len(response) // 2)]
+        elif error == "bad_status":
+            response = self._with_bad_status(response)
+        if not self.pace:
+            os.write(self._master, response)
+            return
+        # 10 bitar per byte (start + 8 data + stopp)
+        byte_time = 10 / self.baudrate
+        for i in range(0, len(response), 16):
+            chunk = response[i:i + 16]
+            time.sleep(len(chunk) * byte_time)
+            os.write(self._master, chunk)
+
+    @staticmethod
+    def _with_bad_status(response):
+        if len(response) >= 2 and response[-2] == ESC:
+            return response[:-1] + bytes([STATUS_ERROR])
+        if len(response) >= 2 and response[0] == ESC:
+            return bytes([ESC, STATUS_ERROR]) + response[2:]
+        return response
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated MSRE206 on a pseudo-terminal")
+    parser.add_argument("--swipe-delay", type=float, default=0.0, help="seconds to wait for a simulated swipe")
+    parser.add_argument("--baudrate", type=int, default=9600, help="baud rate used to pace responses")
+    parser.add_argument("--no-pace", action="store_true", help="send responses without wire-time pacing")
+    parser.add_argument("--error", action="append", default=[], metavar="KIND=PROB",
+                        help=f"inject errors, KIND is one of {', '.join(ERROR_KINDS)}")
+    parser.add_argument("--seed", type=int, help="random seed for error injection")
+    parser.add_argument("--link", help="create a symlink to the pty at this path")
+    args = parser.parse_args(argv)
+
+    errors = {}
+    for spec in args.error:
+        kind, _, probability = spec.partition("=")
+        if kind not in ERROR_KINDS:
+            parser.error(f"unknown error kind: {kind}")
+        errors[kind] = float(probability or 1.0)
+
+    sim = MSRE206Simulator(swipe_delay=args.swipe_delay, baudrate=args.baudrate,
+                           pace=not args.no_pace, errors=errors, seed=args.seed)
+    port = sim.start()
+    if args.link:
+        if os.path.islink(args.link):
+            os.unlink(args.link)
+        os.symlink(port, args.link)
+    print(f"MSRE206 simulator on {args.link or port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+        if args.link and os.path.islink(args.link):
+            os.unlink(args.link)
+
+
+if __name__ == "__main__":
+    main()
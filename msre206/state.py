@@ -0,0 +1,45 @@
+"""Enhetens inställningar som de var senast vi frågade eller fick kvittens.
+
+Modell, firmware, koercivitet, ledande nollor, BPI och BPC ändras bara av våra
+egna kommandon, så under en anslutning kan frågor besvaras ur minnet och
+inställningar som redan gäller behöver inte skickas igen. Allt som ett kommando
+kan ha ändrat glöms innan kommandot skickas, så ett misslyckat eller avbrutet
+kommando lämnar aldrig ett gammalt värde kvar.
+"""
+from dataclasses import dataclass, field
+
+from . import protocol
+
+# ESC b-kod -> (spår, bpi)
+BPI_BY_CODE = {code: (track, bpi) for track, codes in protocol.BPI_CODES.items() for bpi, code in codes.items()}
+
+
+@dataclass
+class DeviceState:
+    """None (eller saknad nyckel i bpi) betyder att värdet inte är känt."""
+    model: str = None
+    firmware: str = None
+    coercivity: str = None
+    leading_zeros: tuple = None
+    bpi: dict = field(default_factory=dict)
+    bpc: tuple = None
+
+    def clear(self):
+        self.model = self.firmware = self.coercivity = None
+        self.leading_zeros = self.bpc = None
+        self.bpi = {}
+
+    def forget(self, command):
+        """Glömmer det som command kan ändra; anropas innan command skickas."""
+        opcode = command.opcode
+        if opcode == protocol.OP_RESET:
+            self.clear()
+        elif opcode in (protocol.OP_SET_HICO, protocol.OP_SET_LOCO):
+            self.coercivity = None
+        elif opcode == protocol.OP_SET_LEADING_ZEROS:
+            self.leading_zeros = None
+        elif opcode == protocol.OP_SET_BPI:
+            track, _ = BPI_BY_CODE.get(command.payload[2], (None, None))
+            self.bpi.pop(track, None)
+        elif opcode == protocol.OP_SET_BPC:
+            self.bpc = None
@@ -0,0 +1,177 @@
+"""Återanslutning när enheten kopplas ur och sätts tillbaka.
+
+ConnectionSupervisor märker att porten försvunnit (ett kommando kastade
+DeviceDisconnected eller portens enhetsfil finns inte längre), stänger
+anslutningen och provar att ansluta igen med exponentiell backoff. Ett lyckat
+försök återställer enheten (ESC a), kontrollerar att den svarar och sätter
+tillbaka de inställningar som gällde innan, så att nästa kort skrivs likadant:
+
+    supervisor = ConnectionSupervisor(worker, on_change=print).start()
+"""
+import os
+import threading
+import time
+from concurrent.futures import CancelledError
+
+from . import discovery, protocol
+from .device import DeviceError
+from .profiles import Profile, apply_profile
+
+CONNECTION_LOST = "lost"
+CONNECTION_RESTORED = "restored"
+
+# Hur ofta porten kontrolleras när allt fungerar (sekunder)
+CHECK_INTERVAL = 0.5
+# Väntan före första återanslutningsförsöket, fördubblas upp till MAX_BACKOFF
+INITIAL_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+BACKOFF_FACTOR = 2
+# Hur gammal portlistan får vara när en COM-port kontrolleras medan allt fungerar;
+# listan hämtas om högst så här ofta i stället för vid varje kontroll (sekunder)
+PORT_LIST_MAX_AGE = 5.0
+
+
+def port_present(port, ports=None):
+    """False när portens enhetsfil (eller COM-port) inte längre finns.
+
+    En enhetsfil kontrolleras direkt. En COM-port slås upp i ports, en redan hämtad
+    discovery.candidate_ports(), eller i en ny lista om ports inte ges.
+    """
+    if os.path.isabs(port):
+        return os.path.exists(port)
+    if ports is None:
+        ports = discovery.candidate_ports()
+    return port in ports
+
+
+def backoff_delays(initial=INITIAL_BACKOFF, maximum=MAX_BACKOFF, factor=BACKOFF_FACTOR):
+    delay = initial
+    while True:
+        yield delay
+        delay = min(maximum, delay * factor)
+
+
+def take_down(device):
+    """Stänger en förlorad anslutning; returnerar en Profile med inställningarna den hade."""
+    profile = Profile.from_state("restore", device.state)
+    device.close()
+    return profile
+
+
+def restore(device, profile=None):
+    """Ett återanslutningsförsök i tråden som äger device; returnerar ett profiles.ApplyResult.
+
+    Kastar DeviceError, ProtocolError eller OSError om enheten inte går att öppna eller
+    inte svarar på kommunikationstestet; porten lämnas då stängd.
+    """
+    try:
+        device.open()
+        device.reset()
+        if not device.comm_test():
+            raise DeviceError("No answer to the communication test")
+        return apply_profile(device, profile or Profile("restore"), rollback=False)
+    except Exception:
+        device.close()
+        raise
+
+
+def reconnect(device, profile=None, stop=None, delays=None):
+    """Provar restore med backoff tills det lyckas; i tråden som äger device.
+
+    Returnerar ApplyResult från det lyckade försöket, eller None om stop (en
+    threading.Event) sattes först.
+    """
+    stop = stop or threading.Event()
+    for delay in delays or backoff_delays():
+        if stop.wait(delay):
+            return None
+        if not port_present(device.port):
+            continue
+        try:
+            return restore(device, profile)
+        except (DeviceError, protocol.ProtocolError, OSError):
+            continue
+
+
+class ConnectionSupervisor:
+    """Bevakar anslutningen på en DeviceWorker och återansluter när enheten kommer tillbaka.
+
+    on_change(CONNECTION_LOST, None) anropas när porten försvunnit och
+    on_change(CONNECTION_RESTORED, ApplyResult) när den fungerar igen. Allt som rör
+    porten körs på workern; on_change anropas från supervisorns tråd.
+    """
+
+    def __init__(self, worker, on_change=None, interval=CHECK_INTERVAL, initial_backoff=INITIAL_BACKOFF,
+                 max_backoff=MAX_BACKOFF):
+        self.worker = worker
+        self.on_change = on_change
+        self.interval = interval
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.connected = True
+        self._stop = threading.Event()
+        self._thread = None
+        self._ports = None
+        self._ports_listed = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="msre206-supervisor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _notify(self, event, detail):
+        if self.on_change and not self._stop.is_set():
+            self.on_change(event, detail)
+
+    def _port_present(self, max_age):
+        """port_present för workerns port med en portlista som är högst max_age sekunder gammal."""
+        port = self.worker.device.port
+        if os.path.isabs(port):
+            return os.path.exists(port)
+        now = time.monotonic()
+        if self._ports is None or now - self._ports_listed >= max_age:
+            self._ports, self._ports_listed = discovery.candidate_ports(), now
+        return port_present(port, self._ports)
+
+    def _run(self):
+        device = self.worker.device
+        while not self._stop.wait(self.interval):
+            # Flaggan sätts på I/O-tråden; här läses den bara
+            if not device.disconnected and self._port_present(PORT_LIST_MAX_AGE):
+                continue
+            if not self._recover():
+                return
+
+    def _recover(self):
+        """Stänger porten och återansluter; False om supervisorn eller workern stoppats."""
+        self.connected = False
+        self._notify(CONNECTION_LOST, None)
+        try:
+            profile = self.worker.submit(take_down).result()
+            for delay in backoff_delays(self.initial_backoff, self.max_backoff):
+                if self._stop.wait(delay):
+                    return False
+                # En ny portlista per backoff-steg
+                if not self._port_present(0):
+                    continue
+                try:
+                    result = self.worker.submit(restore, profile).result()
+                except (DeviceError, protocol.ProtocolError, OSError):
+                    continue
+                self.connected = True
+                self._notify(CONNECTION_RESTORED, result)
+                return True
+        except (CancelledError, RuntimeError):
+            # Workern stängs
+            return False
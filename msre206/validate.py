@@ -0,0 +1,165 @@
+"""Kontroll av spårdata innan den skickas till enheten.
+
+Reglerna för varje spår (teckenuppsättning, start- och slutvakt, maxlängd vid given
+BPI/BPC och fältlayout för %B...^...^ och ;...=...) kompileras en gång till reguljära
+uttryck. En giltig post kostar därför bara ett par fullmatch-anrop, och en hel
+jobbfil kan kontrolleras innan första kortet dras:
+
+    validator = Validator(bpc={1: 7, 2: 5, 3: 5})
+    report = validator.check_file("jobs.csv")
+    for index, errors in report.invalid.items():
+        print(index, errors)
+"""
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from . import cards, protocol
+from .batch import iter_records, record_tracks
+
+# Användbar spårlängd i tum; ger ISO 7811:s 79/40/107 tecken vid standard-BPI/BPC
+TRACK_INCHES = {
+    1: 79 * 7 / 210,
+    2: 40 * 5 / 75,
+    3: 107 * 5 / 210,
+}
+# Fältlayouter (ISO 7813): spår 1 format B och spår 2 PAN=YYMM, följt av servicekod
+# och diskretionära data; ett tomt utgångsdatum markeras med fältavgränsaren
+TRACK1_FORMAT_B = r"%B(\d{1,19})\^[^^]{1,26}\^(?:\d{4}|\^)[^?]*\??"
+TRACK2_LAYOUT = r";(\d{1,19})=(?:\d{4}|=)\d*\??"
+# Spår -> (villkor för att layouten gäller, layout, beskrivning i felmeddelandet)
+LAYOUTS = {
+    1: (r"%B", TRACK1_FORMAT_B, "track 1 format B (%B<PAN>^<NAME>^<YYMM>...?)"),
+    2: (r"[^=]*=", TRACK2_LAYOUT, "track 2 layout (;<PAN>=<YYMM>...?)"),
+}
+
+
+def max_length(track, bpc, bpi):
+    """Största antal tecken inklusive vakter och LRC som ryms på spåret."""
+    return int(TRACK_INCHES[track] * bpi / bpc + 1e-9)
+
+
+@dataclass(frozen=True)
+class TrackRule:
+    """Förkompilerade regler för ett spår vid en viss BPC och BPI."""
+    track: int
+    bpc: int
+    bpi: int
+    start: str
+    charset: frozenset
+    max_length: int
+    # Hela spåret i ett uttryck: startvakt, tillåtna tecken, maxlängd, slutvakt och
+    # (med layouts) fältlayout, så en giltig text kostar ett enda fullmatch
+    pattern: re.Pattern
+    layout: re.Pattern = None
+    layout_name: str = ""
+
+    def pan(self, text):
+        """Kortnumret om spåret följer sin layout, annars None."""
+        match = self.layout.fullmatch(text) if self.layout else None
+        return match.group(1) if match else None
+
+    def errors(self, text):
+        """Tom lista om text är giltig, annars en beskrivning per fel."""
+        if self.pattern.fullmatch(text):
+            return []
+        errors = []
+        # Saknas startvakten är första tecknet data; positioner räknas från textens början
+        first = 1 if text.startswith(self.start) else 0
+        if not first:
+            errors.append(f"missing start sentinel {self.start!r}")
+        end = protocol.ISO_END_SENTINEL
+        body = text[first:-1] if len(text) > first and text.endswith(end) else text[first:]
+        # Vakter och LRC räknas med även när slutvakten inte skrivits ut
+        if len(body) + 3 > self.max_length:
+            errors.append(f"too long: {len(body)} data characters, at most {self.max_length - 3} "
+                          f"at {self.bpi} BPI/{self.bpc} BPC")
+        for i, char in enumerate(body, first + 1):
+            if char not in self.charset:
+                errors.append(f"invalid character {char!r} at position {i}")
+                break
+        if not errors and self.layout:
+            errors.append(f"does not match {self.layout_name}")
+        return errors or ["invalid track data"]
+
+
+@lru_cache(maxsize=None)
+def compile_rule(track, bpc, bpi, layouts=True):
+    """TrackRule för spåret; samma kombination kompileras bara en gång."""
+    if bpc not in protocol.BPC_VALUES:
+        raise ValueError(f"Invalid BPC: {bpc}")
+    offset = protocol.ISO_CHAR_OFFSETS[bpc]
+    start = protocol.ISO_START_SENTINELS[bpc]
+    end = protocol.ISO_END_SENTINEL
+    charset = frozenset(chr(offset + value) for value in range(1 << (bpc - 1))) - {start, end}
+    limit = max_length(track, bpc, bpi)
+    body = "[" + "".join(re.escape(char) for char in sorted(charset)) + "]"
+    # Slutvakten får saknas: decode_read klipper den, så lästa spår ska kunna skrivas om
+    pattern = f"{re.escape(start)}{body}{{0,{max(0, limit - 3)}}}{re.escape(end)}?"
+    if not layouts or track not in LAYOUTS:
+        return TrackRule(track, bpc, bpi, start, charset, limit, re.compile(pattern))
+    condition, layout, name = LAYOUTS[track]
+    # Texter som uppfyller villkoret måste också följa layouten
+    guarded = f"(?:(?!{condition})|(?={layout}\\Z)){pattern}"
+    return TrackRule(track, bpc, bpi, start, charset, limit, re.compile(guarded),
+                     re.compile(f"(?={condition}){layout}"), name)
+
+
+@dataclass
+class ValidationReport:
+    """Resultat av check_file. invalid är {postindex: [fel, ...]} för ogiltiga poster."""
+    total: int = 0
+    invalid: dict = field(default_factory=dict)
+
+    @property
+    def ok(self):
+        return not self.invalid
+
+
+class Validator:
+    """Kontrollerar spårdata mot enhetens BPC/BPI (standard: ISO 7811).
+
+    layouts=True kräver dessutom ISO 7813-layout för spår 1 som börjar med %B och
+    spår 2 som innehåller '='. check_luhn=True kontrollerar kortnumrets Luhn-siffra.
+    """
+
+    def __init__(self, bpc=None, bpi=None, layouts=True, check_luhn=False):
+        bpc = bpc or protocol.DEFAULT_BPC
+        bpi = bpi or protocol.DEFAULT_BPI
+        self.rules = {num: compile_rule(num, int(bpc[num]), int(bpi[num]), layouts) for num in protocol.TRACKS}
+        self.check_luhn = check_luhn
+
+    def check_tracks(self, tracks):
+        """{spår: text} -> lista med fel i formen "track N: ..."; tom om allt är giltigt."""
+        errors = []
+        for num, text in tracks.items():
+            # Ett tomt spår skrivs som tomt och behöver inga vakter
+            if not text:
+                continue
+            rule = self.rules[num]
+            if rule.pattern.fullmatch(text):
+                if self.check_luhn:
+                    pan = rule.pan(text)
+                    if pan and (len(pan) < 2 or cards.luhn_check_digit(pan[:-1]) != int(pan[-1])):
+                        errors.append(f"track {num}: card number {pan} fails the Luhn check")
+                continue
+            errors += [f"track {num}: {problem}" for problem in rule.errors(text)]
+        return errors
+
+    def check_record(self, record, columns=None):
+        tracks = record_tracks(record, columns)
+        if not tracks:
+            return ["no track data"]
+        return self.check_tracks(tracks)
+
+    def check_file(self, path, fmt=None, columns=None, start=0):
+        """Kontrollerar alla poster i en jobbfil (efter de start första) utan att röra enheten."""
+        report = ValidationReport()
+        for index, record in enumerate(iter_records(path, fmt), 1):
+            if index <= start:
+                continue
+            report.total += 1
+            errors = self.check_record(record, columns)
+            if errors:
+                report.invalid[index] = errors
+        return report
@@ -0,0 +1,41 @@
+"""I/O-tråd som äger en Device och kör kommandon ett i taget."""
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DeviceWorker:
+    """Kör allt som rör serieporten på en egen tråd.
+
+    Jobb är funktioner som tar Device som första argument. De körs i den ordning de
+    skickas in och aldrig parallellt, så två kommandon kan inte blandas på linjen.
+    submit() returnerar en concurrent.futures.Future.
+    """
+
+    def __init__(self, device, name=None):
+        self.device = device
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name or "msre206-io")
+        self._pending = set()
+
+    def _submit(self, fn, *args, **kwargs):
+        future = self._executor.submit(fn, *args, **kwargs)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        return future
+
+    def submit(self, fn, *args, **kwargs):
+        return self._submit(fn, self.device, *args, **kwargs)
+
+    def execute(self, command):
+        """Skickar ett protocol.Command på I/O-tråden."""
+        return self._submit(self.device.execute, command)
+
+    @property
+    def busy(self):
+        return bool(self._pending)
+
+    def shutdown(self, wait=True):
+        """Stryker köade jobb, avbryter pågående läsning och stänger porten."""
+        for future in list(self._pending):
+            future.cancel()
+        self.device.cancel()
+        self._executor.submit(self.device.close)
+        self._executor.shutdown(wait=wait)
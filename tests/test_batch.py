@@ -0,0 +1,88 @@
+import csv
+import threading
+
+from msre206 import batch, protocol
+from msre206.device import DeviceTimeout
+
+
+class FakeDevice:
+    """Svarar med timeout de första gångerna, som när inget kort dras."""
+
+    def __init__(self, timeouts=0, read_timeouts=0):
+        self.timeouts = timeouts
+        self.read_timeouts = read_timeouts
+        self.written = []
+
+    def write(self, tracks):
+        if self.timeouts:
+            self.timeouts -= 1
+            raise DeviceTimeout(protocol.build_write(tracks))
+        self.written.append(tracks)
+        return protocol.STATUS_OK
+
+    def read(self):
+        if self.read_timeouts:
+            self.read_timeouts -= 1
+            raise DeviceTimeout(protocol.build_read())
+        tracks = {1: "", 2: "", 3: ""}
+        tracks.update((num, text.split("?")[0]) for num, text in self.written[-1].items())
+        return protocol.ReadResult(tracks, protocol.STATUS_OK)
+
+
+def write_job(tmp_path):
+    path = tmp_path / "jobs.csv"
+    path.write_text("id,track2\na,;1?\nb,;2?\n", encoding="utf-8")
+    return str(path), str(tmp_path / "results.csv")
+
+
+def read_results(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row["result"] for row in csv.DictReader(f)]
+
+
+def test_timeout_retries_same_record(tmp_path):
+    job, results = write_job(tmp_path)
+    device = FakeDevice(timeouts=2)
+    retries = []
+    summary = batch.run_batch(device, job, results, on_retry=retries.append)
+    assert summary.ok == 2 and summary.failed == 0
+    assert device.written == [{2: ";1?"}, {2: ";2?"}]
+    assert [result.index for result in retries] == [1, 1]
+    assert read_results(results) == ["ok", "ok"]
+
+
+def test_skip(tmp_path):
+    job, results = write_job(tmp_path)
+    device = FakeDevice(timeouts=1)
+    answers = iter([None, batch.SKIP, None])
+    summary = batch.run_batch(device, job, results, prompt=lambda index, record: next(answers))
+    assert device.written == [{2: ";2?"}]
+    assert summary.total == 2 and summary.ok == 1 and summary.failed == 1 and summary.skipped == 1
+    assert read_results(results) == ["skipped", "ok"]
+
+
+def test_stop_ends_retries(tmp_path):
+    job, results = write_job(tmp_path)
+    stop = threading.Event()
+    summary = batch.run_batch(FakeDevice(timeouts=5), job, results, stop=stop,
+                              on_retry=lambda result: stop.set())
+    assert summary.total == 1
+    assert read_results(results) == ["timeout"]
+
+
+def test_verify(tmp_path):
+    job, results = write_job(tmp_path)
+    summary = batch.run_batch(FakeDevice(), job, results, verify=True)
+    assert summary.ok == 2
+    assert read_results(results) == ["ok", "ok"]
+
+
+def test_verify_timeout_does_not_rewrite_card(tmp_path):
+    job, results = write_job(tmp_path)
+    device = FakeDevice(read_timeouts=1)
+    retries = []
+    summary = batch.run_batch(device, job, results, verify=True, on_retry=retries.append)
+    assert device.written == [{2: ";1?"}, {2: ";2?"}]
+    assert retries == []
+    assert summary.ok == 1 and summary.failed == 1
+    assert read_results(results) == ["verify_timeout", "ok"]
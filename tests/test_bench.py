@@ -0,0 +1,16 @@
+from msre206 import bench, protocol
+
+
+def test_sample_responses_are_complete_frames():
+    for opcode, response, decode in [
+        (protocol.OP_READ, bench._sample_read_response(), protocol.decode_read),
+        (protocol.OP_READ_RAW, bench._sample_raw_response(), protocol.decode_raw_read),
+    ]:
+        parser = protocol.FrameParser(opcode)
+        assert parser.feed(response) and not parser.remainder
+        assert decode(response).ok
+
+
+def test_sample_read_response_decodes_to_sample_tracks():
+    tracks = protocol.decode_read(bench._sample_read_response()).tracks
+    assert tracks == {num: text.split("?")[0] for num, text in bench.SAMPLE_TRACKS.items()}
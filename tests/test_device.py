@@ -0,0 +1,107 @@
+import asyncio
+import os
+
+import pytest
+
+from msre206 import protocol
+from msre206.aio import AsyncDevice
+from msre206.device import Device, DeviceDisconnected, DeviceTimeout
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="the simulator needs a pty")
+
+# Kort tidsgräns så att testerna inte väntar ut enhetens standardtider
+SHORT = 0.2
+
+
+def short(command):
+    return protocol.Command(command.name, command.payload, SHORT, command.expect_response)
+
+
+@pytest.fixture
+def sim():
+    from msre206.simulator import MSRE206Simulator
+    simulator = MSRE206Simulator(pace=False, late_delay=2 * SHORT)
+    simulator.start()
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture
+def device(sim):
+    with Device(sim.port) as device:
+        yield device
+
+
+def test_commands(device, sim):
+    assert device.comm_test()
+    assert device.get_model() == sim.model
+    assert device.get_firmware() == sim.firmware
+    assert device.write({2: ";123?"}) == protocol.STATUS_OK
+    assert device.read().tracks[2] == ";123"
+
+
+def test_firmware_of_any_length(device, sim):
+    sim.firmware = "REVS10.02-B"
+    assert device.get_firmware() == sim.firmware
+
+
+def test_timeout(device, sim):
+    sim.fail_next("timeout")
+    with pytest.raises(DeviceTimeout):
+        device.execute(short(protocol.build_get_model()))
+    assert device.get_model() == sim.model
+
+
+def test_late_reply_is_not_taken_for_next_response(device, sim):
+    sim.fail_next("late")
+    with pytest.raises(DeviceTimeout):
+        device.execute(short(protocol.build_check_leading_zeros()))
+    # Svaret (ESC 61 22) kommer medan nästa kommando väntar på sitt
+    assert device.comm_test()
+    assert device.get_model(refresh=True) == sim.model
+
+
+def test_truncated_reply(device, sim):
+    sim.fail_next("truncate")
+    with pytest.raises(protocol.ProtocolError):
+        device.execute(short(protocol.build_check_leading_zeros()))
+    assert device.check_leading_zeros(refresh=True) == sim.leading_zeros
+
+
+def test_truncated_read(device, sim):
+    sim.tracks[1] = "%HELLO?"
+    sim.fail_next("truncate")
+    with pytest.raises(protocol.ProtocolError):
+        device.read()
+    assert device.read().tracks[1] == "%HELLO"
+
+
+def test_late_sensor_reply(device, sim):
+    sim.fail_next("late")
+    with pytest.raises(DeviceTimeout):
+        device.poll_sensor()
+    sim.insert_card()
+    assert device.get_model(refresh=True) == sim.model
+    assert device.poll_sensor()
+
+
+def test_unplugged_port(device, sim):
+    sim.stop()
+    with pytest.raises(DeviceDisconnected):
+        device.comm_test()
+    assert device.disconnected
+
+
+def test_async_late_reply_is_not_taken_for_next_response(sim):
+    async def run():
+        async with AsyncDevice(sim.port) as device:
+            sim.insert_card()
+            sim.fail_next("late")
+            with pytest.raises(DeviceTimeout):
+                await device.poll_sensor(timeout=SHORT)
+            sim.remove_card()
+            # Det sena 0x01 får inte tas för svaret på nästa fråga
+            assert not await device.poll_sensor(timeout=1.0)
+            assert await device.get_model() == sim.model
+
+    asyncio.run(run())
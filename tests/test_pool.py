@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from msre206 import protocol
+from msre206.device import DeviceDisconnected, DeviceTimeout
+from msre206.pool import EncoderPool, JobResult
+
+GOOD_READ = protocol.ReadResult({1: "", 2: ";1", 3: ""}, protocol.STATUS_OK)
+
+
+@pytest.mark.parametrize("value, ok", [
+    (protocol.VerifyResult(protocol.STATUS_OK, GOOD_READ), True),
+    (protocol.VerifyResult(protocol.STATUS_FAIL), False),
+    (protocol.VerifyResult(protocol.STATUS_OK), False),
+    (protocol.VerifyResult(protocol.STATUS_OK, GOOD_READ, {2: (";1?", ";2")}), False),
+    (protocol.VerifyResult(protocol.STATUS_OK, protocol.ReadResult({}, 0x31)), False),
+    (GOOD_READ, True),
+    (protocol.ReadResult({}, 0x31), False),
+    (protocol.STATUS_OK, True),
+    (protocol.STATUS_FAIL, False),
+    (True, True),
+    (False, False),
+    (None, True),
+])
+def test_job_result_ok(value, ok):
+    assert JobResult(1, "a", "write_verified", value).ok is ok
+
+
+def test_job_result_with_error_is_not_ok():
+    result = JobResult(1, "a", "write", protocol.STATUS_OK, DeviceTimeout(protocol.build_write({2: ";1?"})))
+    assert not result.ok
+
+
+@pytest.mark.skipif(os.name != "posix", reason="the simulator needs a pty")
+def test_unplugged_device_leaves_jobs_to_the_others():
+    from msre206.simulator import MSRE206Simulator
+    sims = {name: MSRE206Simulator(pace=False) for name in ("a", "b")}
+    ports = {name: sim.start() for name, sim in sims.items()}
+    try:
+        with EncoderPool(ports) as pool:
+            sims["a"].stop()
+            results = [future.result(10) for future in [pool.submit("comm_test") for _ in range(10)]]
+            assert all(result.ok and result.device_id == "b" for result in results)
+            assert pool.report()["devices"]["a"]["disconnected"]
+            sims["b"].stop()
+            results = [future.result(10) for future in [pool.submit("comm_test") for _ in range(3)]]
+            assert all(isinstance(result.error, DeviceDisconnected) for result in results)
+    finally:
+        for sim in sims.values():
+            sim.stop()
@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import Future
+
+from msre206 import presence
+from msre206.device import DeviceDisconnected
+from msre206.presence import CARD_INSERTED, CARD_REMOVED, MONITOR_STOPPED, PresenceDetector, PresenceMonitor
+
+
+def test_debounce():
+    detector = PresenceDetector(debounce=2)
+    events = [detector.update(present) for present in (False, False, True, False, True, True, None, False, False)]
+    assert events == [None, None, None, None, None, CARD_INSERTED, None, None, CARD_REMOVED]
+
+
+def test_interval_backs_off_while_idle():
+    detector = PresenceDetector(fast_interval=0.05, slow_interval=0.5, backoff=2)
+    for _ in range(2):
+        detector.update(False)
+    intervals = []
+    for _ in range(6):
+        detector.update(False)
+        intervals.append(detector.interval)
+    assert intervals == [0.1, 0.2, 0.4, 0.5, 0.5, 0.5]
+
+
+class RecordingStop:
+    def __init__(self):
+        self.waits = []
+
+    def is_set(self):
+        return False
+
+    def wait(self, seconds):
+        self.waits.append(seconds)
+
+
+class SensorDevice:
+    def __init__(self, readings):
+        self.readings = iter(readings)
+
+    def poll_sensor(self):
+        return next(self.readings)
+
+
+def test_wait_for_insert_uses_adaptive_interval():
+    stop = RecordingStop()
+    detector = PresenceDetector(fast_interval=0.05, slow_interval=0.5, backoff=2)
+    assert presence.wait_for_insert(SensorDevice([False] * 6 + [True, True]), detector, stop)
+    assert stop.waits[-1] == 0.05
+    assert max(stop.waits) > detector.fast_interval
+
+
+class FailingWorker:
+    busy = False
+
+    def submit(self, fn):
+        future = Future()
+        future.set_exception(DeviceDisconnected("sensor_poll: gone"))
+        return future
+
+
+def test_monitor_reports_that_it_stopped():
+    stopped = threading.Event()
+    events = []
+
+    def on_change(event):
+        events.append(event)
+        stopped.set()
+
+    monitor = PresenceMonitor(FailingWorker(), on_change, PresenceDetector(fast_interval=0.01)).start()
+    assert stopped.wait(5)
+    monitor.stop()
+    assert events == [MONITOR_STOPPED]
+    assert isinstance(monitor.error, DeviceDisconnected)
@@ -0,0 +1,104 @@
+import pytest
+
+from msre206 import protocol
+from msre206.protocol import ESC, FS, FrameParser
+
+READ_RESPONSE = bytes([ESC, 0x73, ESC, 1]) + b"%ABC?" + bytes([ESC, 2]) + b";123?" + bytes([ESC, 3]) \
+    + bytes([0x3F, FS, ESC, protocol.STATUS_OK])
+RAW_RESPONSE = bytes([ESC, 0x73, ESC, 1, 2, 0xAA, 0x3F, ESC, 2, 0, ESC, 3, 1, 0x1C]) \
+    + bytes([0x3F, FS, ESC, protocol.STATUS_OK])
+
+
+def feed_bytewise(parser, data):
+    for i in range(len(data)):
+        if parser.feed(data[i:i + 1]):
+            return i + 1
+    return None
+
+
+@pytest.mark.parametrize("opcode, response", [
+    (protocol.OP_COMM_TEST, protocol.COMM_TEST_OK),
+    (protocol.OP_CHECK_LEADING_ZEROS, bytes([ESC, 61, 22])),
+    (protocol.OP_SENSOR, b"\x01"),
+    (protocol.OP_GET_MODEL, bytes([ESC]) + b"3S"),
+    (protocol.OP_SET_BPC, bytes([ESC, protocol.STATUS_OK, 7, 5, 5])),
+    (protocol.OP_SET_BPC, bytes([ESC, protocol.STATUS_FAIL])),
+    (protocol.OP_READ, READ_RESPONSE),
+    (protocol.OP_READ_RAW, RAW_RESPONSE),
+])
+def test_frame_completes_exactly_at_end(opcode, response):
+    parser = FrameParser(opcode)
+    assert feed_bytewise(parser, response) == len(response)
+    assert parser.frame == response
+
+
+@pytest.mark.parametrize("opcode", [protocol.OP_READ, protocol.OP_READ_RAW])
+def test_status_only_answer_to_track_command(opcode):
+    parser = FrameParser(opcode)
+    assert parser.feed(bytes([ESC, 0x31]))
+    assert parser.frame == bytes([ESC, 0x31])
+
+
+def test_bytes_after_frame_go_to_remainder():
+    parser = FrameParser(protocol.OP_COMM_TEST)
+    assert parser.feed(protocol.COMM_TEST_OK + b"\x1b")
+    assert parser.frame == protocol.COMM_TEST_OK
+    parser.feed(b"0")
+    assert parser.remainder == b"\x1b0"
+
+
+def test_partial_frame_is_not_complete():
+    parser = FrameParser(protocol.OP_READ)
+    assert not parser.feed(READ_RESPONSE[:-2])
+    assert parser.needed() >= 1
+    assert parser.feed(READ_RESPONSE[-2:])
+
+
+@pytest.mark.parametrize("firmware", [b"REVS1.00", b"REV1.2", b"REVS10.01-B"])
+def test_firmware_frame_ends_on_silence(firmware):
+    parser = FrameParser(protocol.OP_GET_FIRMWARE)
+    assert not parser.feed(bytes([ESC]) + firmware)
+    assert parser.needed() == 1
+    assert parser.finish()
+    assert protocol.decode_firmware(parser.frame) == firmware.decode()
+
+
+def test_finish_does_not_complete_fixed_shapes():
+    parser = FrameParser(protocol.OP_GET_MODEL)
+    parser.feed(bytes([ESC]) + b"3")
+    assert not parser.finish()
+
+
+def test_unknown_opcode_never_completes():
+    parser = FrameParser(0x00)
+    assert not parser.feed(b"\x1b\x30\x30\x30")
+
+
+def test_decode_read():
+    result = protocol.decode_read(READ_RESPONSE)
+    assert result.tracks == {1: "%ABC", 2: ";123", 3: ""}
+    assert result.ok
+
+
+def test_decode_raw_read():
+    result = protocol.decode_raw_read(RAW_RESPONSE)
+    assert result.tracks == {1: b"\xaa\x3f", 2: b"", 3: b"\x1c"}
+    assert result.ok
+
+
+@pytest.mark.parametrize("decode, response", [
+    (protocol.decode_read, READ_RESPONSE[:-2]),
+    (protocol.decode_read, READ_RESPONSE[:len(READ_RESPONSE) // 2]),
+    (protocol.decode_raw_read, RAW_RESPONSE[:-2]),
+    (protocol.decode_raw_read, RAW_RESPONSE[:8] + RAW_RESPONSE[-4:]),
+])
+def test_truncated_track_response_is_rejected(decode, response):
+    with pytest.raises(protocol.ProtocolError):
+        decode(response)
+
+
+def test_decode_bpc():
+    assert protocol.decode_bpc(bytes([ESC, protocol.STATUS_OK, 7, 5, 5])) == (7, 5, 5)
+    assert protocol.decode_bpc(bytes([ESC, protocol.STATUS_FAIL])) is False
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode_bpc(bytes([ESC, 0x31]))
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from msre206 import rawcodec
+
+
+@pytest.mark.parametrize("text, bpc", [
+    ("%B1234^TEST^25?", 7),
+    (";4111111111111111=2512?", 5),
+    (";0?", 5),
+    ("%12?", 6),
+])
+def test_round_trip(text, bpc):
+    raw = rawcodec.encode_track(text, bpc)
+    decoded = rawcodec.decode_track(raw, bpc)
+    assert decoded.text == text
+    assert decoded.ok
+
+
+def test_round_trip_with_leading_zeros():
+    raw = rawcodec.encode_track("123", 5, leading_zeros=61)
+    assert rawcodec.decode_track(raw, 5).text == ";123?"
+
+
+def test_batch_of_different_lengths():
+    texts = [";1?", ";12345678901234567890?", ";555?"]
+    raws = [rawcodec.encode_track(text, 5) for text in texts]
+    assert [track.text for track in rawcodec.decode_tracks(raws, 5)] == texts
+    assert rawcodec.check_tracks(raws, 5).tolist() == [True, True, True]
+
+
+def test_check_tracks_flags_damage():
+    good = rawcodec.encode_track(";123?", 5)
+    flipped = bytes([good[0] ^ 0x04]) + good[1:]
+    assert rawcodec.check_tracks([good, flipped, b"", b"\x00\x00"], 5).tolist() == [True, False, False, False]
+    assert rawcodec.decode_track(flipped, 5).parity_errors
+
+
+def test_empty_input():
+    ok = rawcodec.check_tracks([], 5)
+    assert isinstance(ok, np.ndarray) and ok.shape == (0,)
+    assert rawcodec.decode_tracks([], 7) == []
+    with pytest.raises(ValueError):
+        rawcodec.check_tracks([], 4)
+
+
+def test_unencodable_character():
+    with pytest.raises(ValueError):
+        rawcodec.encode_track(";12A?", 5)
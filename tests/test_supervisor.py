@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+from msre206 import discovery, supervisor
+from msre206.supervisor import ConnectionSupervisor
+
+
+def test_com_port_list_is_reused_while_fresh(monkeypatch):
+    lookups = []
+
+    def candidate_ports():
+        lookups.append(1)
+        return {"COM3": "MSRE206"}
+
+    monkeypatch.setattr(discovery, "candidate_ports", candidate_ports)
+    worker = SimpleNamespace(device=SimpleNamespace(port="COM3", disconnected=False))
+    watcher = ConnectionSupervisor(worker)
+    assert all(watcher._port_present(supervisor.PORT_LIST_MAX_AGE) for _ in range(10))
+    assert len(lookups) == 1
+    assert watcher._port_present(0)
+    assert len(lookups) == 2
+
+
+def test_device_path_is_checked_directly(monkeypatch, tmp_path):
+    monkeypatch.setattr(discovery, "candidate_ports", lambda: {})
+    port = tmp_path / "ttyUSB0"
+    port.touch()
+    assert supervisor.port_present(str(port))
+    port.unlink()
+    assert not supervisor.port_present(str(port))
@@ -0,0 +1,56 @@
+import pytest
+
+from msre206.validate import Validator, max_length
+
+
+def test_iso_track_lengths():
+    assert max_length(1, 7, 210) == 79
+    assert max_length(2, 5, 75) == 40
+    assert max_length(3, 5, 210) == 107
+
+
+@pytest.mark.parametrize("tracks", [
+    {1: "%B4111111111111111^DOE/JOHN^2512101?", 2: ";4111111111111111=2512101?"},
+    {1: "%HELLO WORLD?", 2: ";12345?", 3: ";999?"},
+    {2: ";12345"},
+    {1: "", 2: ";1?"},
+])
+def test_valid_tracks(tracks):
+    assert Validator().check_tracks(tracks) == []
+
+
+@pytest.mark.parametrize("tracks, fragment", [
+    ({2: "12345?"}, "missing start sentinel"),
+    ({2: ";12A45?"}, "invalid character 'A'"),
+    ({2: ";" + "1" * 40 + "?"}, "too long"),
+    ({1: "%B4111^NAME?"}, "track 1 format B"),
+    ({2: ";4111=25X?"}, "invalid character"),
+])
+def test_invalid_tracks(tracks, fragment):
+    errors = Validator().check_tracks(tracks)
+    assert errors and fragment in errors[0]
+
+
+def test_luhn():
+    validator = Validator(check_luhn=True)
+    assert validator.check_tracks({2: ";4111111111111111=2512?"}) == []
+    assert "Luhn" in validator.check_tracks({2: ";4111111111111112=2512?"})[0]
+
+
+def test_check_file(tmp_path):
+    path = tmp_path / "jobs.csv"
+    path.write_text("id,track2\na,;123?\nb,;12x?\nc,;456?\n", encoding="utf-8")
+    report = Validator().check_file(str(path))
+    assert report.total == 3
+    assert list(report.invalid) == [2]
+    assert Validator().check_file(str(path), start=2).invalid == {}
+
+
+@pytest.mark.parametrize("tracks, error", [
+    ({1: "hello"}, "invalid character 'h' at position 1"),
+    ({1: "%HEllo?"}, "invalid character 'l' at position 4"),
+    ({2: ";12A45?"}, "invalid character 'A' at position 4"),
+    ({2: "12A45"}, "invalid character 'A' at position 3"),
+])
+def test_invalid_character_position(tracks, error):
+    assert error in Validator().check_tracks(tracks)[-1]